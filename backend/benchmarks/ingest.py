@@ -0,0 +1,104 @@
+"""Per-request CPU cost of turning a contact form into a stored document, before and after the single-pass ingest.
+
+``legacy`` is the previous create path: validate ``ContactCreate``, validate
+again through ``ContactSubmission(**input.model_dump())`` (whose defaults call
+``uuid.uuid4()`` and ``datetime.now().isoformat()``) and ``model_dump()`` the
+result. ``single_pass`` is the current path: validate ``ContactCreate`` once
+(with email/phone normalization) and build the document with ``contact_doc``.
+The id/timestamp generators are also measured on their own.
+
+Run from backend/:
+
+    python -m benchmarks.ingest [--json]
+"""
+import argparse
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Optional
+
+from pydantic import BaseModel, ConfigDict, Field
+
+from benchmarks.serialization import measure
+from ingest import contact_doc, stamp
+from server import ContactCreate
+
+
+class LegacyContactCreate(BaseModel):
+    name: str
+    email: str
+    phone: Optional[str] = ""
+    service: Optional[str] = ""
+    message: str
+
+
+class LegacyContactSubmission(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    name: str
+    email: str
+    phone: Optional[str] = ""
+    service: Optional[str] = ""
+    message: str
+    created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+
+
+PAYLOAD = {
+    "name": "Lead Name",
+    "email": " Lead@Example.com ",
+    "phone": "+91 98765 43210",
+    "service": "Residential Construction",
+    "message": "We are planning a 3BHK villa in Whitefield and would like a quote.",
+}
+
+
+def legacy_path(payload):
+    return LegacyContactSubmission(**LegacyContactCreate.model_validate(payload).model_dump()).model_dump()
+
+
+def single_pass_path(payload):
+    return contact_doc(ContactCreate.model_validate(payload).model_dump())
+
+
+def legacy_ids(_):
+    return str(uuid.uuid4()), datetime.now(timezone.utc).isoformat()
+
+
+def single_pass_ids(_):
+    return stamp()
+
+
+CASES = (
+    ("document", legacy_path, single_pass_path),
+    ("id+timestamp", legacy_ids, single_pass_ids),
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--json", action="store_true", help="emit machine-readable results")
+    args = parser.parse_args()
+
+    doc = single_pass_path(PAYLOAD)
+    assert list(doc) == list(legacy_path(PAYLOAD))
+    assert doc["email"] == "lead@example.com" and doc["phone"] == "+919876543210"
+    assert uuid.UUID(doc["id"]).version == 7 and abs(
+        datetime.fromisoformat(doc["created_at"]).timestamp() - time.time()) < 5
+
+    results = []
+    for name, before_fn, after_fn in CASES:
+        before, after = measure(before_fn, PAYLOAD), measure(after_fn, PAYLOAD)
+        results.append({"case": name, "legacy_us": round(before, 2), "single_pass_us": round(after, 2),
+                        "speedup": round(before / after, 2)})
+
+    if args.json:
+        print(json.dumps(results))
+        return
+    print(f"{'case':<14} {'legacy (us)':>12} {'single pass (us)':>17} {'speedup':>8}")
+    for row in results:
+        print(f"{row['case']:<14} {row['legacy_us']:>12} {row['single_pass_us']:>17} {row['speedup']:>7}x")
+
+
+if __name__ == "__main__":
+    main()
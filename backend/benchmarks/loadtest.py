@@ -0,0 +1,192 @@
+"""In-process load test for the API routes.
+
+Runs the FastAPI app through httpx's ASGI transport (no network, no uvicorn)
+against mongomock-motor, a real mongod with ``--mongo-url``, or one of the
+embedded storage backends with ``--storage memory|sqlite``, seeds
+the collections to the requested sizes and drives each route with a fixed
+number of concurrent clients. Results are printed as a table or written as
+JSON for comparison across commits.
+
+Run from backend/:
+
+    python -m benchmarks.loadtest --docs 1000 --concurrency 32 --requests 2000
+    python -m benchmarks.loadtest --docs 100000 --routes list_contacts --output bench.json
+    python -m benchmarks.loadtest --mongo-url mongodb://localhost:27017 --docs 1000000
+    python -m benchmarks.loadtest --storage sqlite --docs 100000
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+
+def contact_payload(message_bytes):
+    token = uuid.uuid4().hex[:8]
+    return {
+        "name": f"Load {token}",
+        "email": f"load_{token}@example.com",
+        "phone": "+91 9876543210",
+        "service": "Residential Construction",
+        "message": ("x" * message_bytes) or "-",
+    }
+
+
+ROUTES = {
+    "root": lambda args: ("GET", "/api/", None),
+    "create_contact": lambda args: ("POST", "/api/contact", contact_payload(args.message_bytes)),
+    "list_contacts": lambda args: ("GET", f"/api/contacts?limit={args.page_size}", None),
+    "contact_stats": lambda args: ("GET", "/api/contacts/stats", None),
+    "subscribe_newsletter": lambda args: ("POST", "/api/newsletter", {"email": f"load_{uuid.uuid4().hex[:8]}@example.com"}),
+    "list_newsletter": lambda args: ("GET", f"/api/newsletter?limit={args.page_size}", None),
+    "newsletter_stats": lambda args: ("GET", "/api/newsletter/stats", None),
+}
+
+# mongomock does not implement $dateFromString, which the stats pipelines rely on,
+# and the embedded backends have no analytics at all.
+MONGOMOCK_UNSUPPORTED = {"contact_stats", "newsletter_stats"}
+
+
+async def seed(contacts, newsletter, docs, message_bytes, chunk=10000):
+    start = datetime.now(timezone.utc) - timedelta(days=365)
+    step = timedelta(days=365) / max(docs, 1)
+    for offset in range(0, docs, chunk):
+        contacts_batch, subs = [], []
+        for i in range(offset, min(offset + chunk, docs)):
+            created_at = (start + i * step).isoformat()
+            contacts_batch.append({**contact_payload(message_bytes), "id": str(uuid.uuid4()), "created_at": created_at})
+            subs.append({"id": str(uuid.uuid4()), "email": f"seed_{i}@example.com", "subscribed_at": created_at})
+        await contacts.insert_many(contacts_batch)
+        await newsletter.insert_many(subs)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1)]
+
+
+async def run_route(http, name, args):
+    latencies, errors = [], 0
+    remaining = args.requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            method, url, body = ROUTES[name](args)
+            started = time.perf_counter()
+            response = await http.request(method, url, json=body)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "route": name,
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(1000 * percentile(latencies, 50), 3),
+        "p95_ms": round(1000 * percentile(latencies, 95), 3),
+        "p99_ms": round(1000 * percentile(latencies, 99), 3),
+        "max_ms": round(1000 * latencies[-1], 3) if latencies else 0.0,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(args):
+    if not args.list_cache:
+        os.environ['LIST_CACHE_TTL'] = '0'
+    if not args.rate_limit:
+        os.environ['RATE_LIMIT_ENABLED'] = 'false'
+    if args.storage == "sqlite":
+        os.environ['SQLITE_PATH'] = args.sqlite_path
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.sqlite_path + suffix):
+                os.remove(args.sqlite_path + suffix)
+    import server
+    from repository import CONTACTS, NEWSLETTER, MongoRepository, open_embedded
+
+    if args.storage != "mongo":
+        server.storage_backend = args.storage
+        server.contacts_repo, server.newsletter_repo = open_embedded(args.storage)
+    else:
+        if args.mongo_url:
+            from database import create_client
+            server.client = create_client(args.mongo_url)
+        else:
+            from mongomock_motor import AsyncMongoMockClient
+            server.client = AsyncMongoMockClient()
+        # Collections are dropped and reseeded: never point this at a database you care about.
+        server.db = server.client[args.db_name]
+        await server.db.contacts.drop()
+        await server.db.newsletter.drop()
+        server.contacts_repo, server.newsletter_repo = MongoRepository(server.db, CONTACTS), MongoRepository(server.db, NEWSLETTER)
+
+    started = time.perf_counter()
+    await seed(server.contacts_repo, server.newsletter_repo, args.docs, args.message_bytes)
+    seed_seconds = time.perf_counter() - started
+
+    full_mongo = args.storage == "mongo" and args.mongo_url
+    routes = args.routes or [name for name in ROUTES if full_mongo or name not in MONGOMOCK_UNSUPPORTED]
+    results = []
+    async with server.app.router.lifespan_context(server.app):
+        transport = httpx.ASGITransport(app=server.app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as http:
+            for name in routes:
+                results.append(await run_route(http, name, args))
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "backend": args.storage if args.storage != "mongo" else "mongod" if args.mongo_url else "mongomock",
+        "config": {key: getattr(args, key) for key in ("docs", "concurrency", "requests", "message_bytes", "page_size", "list_cache", "rate_limit")},
+        "seed_seconds": round(seed_seconds, 2),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(report, fh, indent=2)
+    print(f"{'route':<22} {'req':>6} {'err':>5} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for row in results:
+        print(f"{row['route']:<22} {row['requests']:>6} {row['errors']:>5} {row['throughput_rps']:>9} "
+              f"{row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="In-process load test for the Gruha Homes API")
+    parser.add_argument("--mongo-url", help="benchmark against a real mongod instead of mongomock")
+    parser.add_argument("--storage", choices=["mongo", "memory", "sqlite"], default="mongo",
+                        help="storage backend; mongo uses --mongo-url or mongomock")
+    parser.add_argument("--sqlite-path", default="loadtest.sqlite3", help="scratch SQLite file, deleted before seeding")
+    parser.add_argument("--db-name", default="gruha_loadtest", help="scratch database, dropped before seeding")
+    parser.add_argument("--docs", type=int, default=1000, help="documents seeded into each collection")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=1000, help="requests per route")
+    parser.add_argument("--message-bytes", type=int, default=200, help="size of the contact message field")
+    parser.add_argument("--page-size", type=int, default=100, help="limit used by the list routes")
+    parser.add_argument("--list-cache", action="store_true", help="leave the list response cache enabled")
+    parser.add_argument("--rate-limit", action="store_true", help="leave form rate limiting enabled")
+    parser.add_argument("--routes", nargs="+", choices=list(ROUTES),
+                        help="routes to benchmark (default: all supported by the backend)")
+    parser.add_argument("--output", help="write JSON results to this file")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
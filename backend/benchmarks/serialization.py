@@ -0,0 +1,89 @@
+"""Per-request CPU cost of serializing list responses, before and after ORJSON.
+
+``fastapi`` is the previous read path: FastAPI validates every document
+through ``response_model=List[ContactSubmission]`` and renders it with the
+stdlib-json ``JSONResponse``. ``orjson`` is the current path: documents from
+the projection-controlled query are rendered straight into an
+``ORJSONResponse``.
+
+Run from backend/:
+
+    python -m benchmarks.serialization [--json]
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import List
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from server import ContactSubmission
+
+SIZES = (1, 100, 1000)
+
+
+def make_docs(n):
+    return [{
+        "id": str(uuid.uuid4()),
+        "name": f"Lead {i}",
+        "email": f"lead{i}@example.com",
+        "phone": "+91 9876543210",
+        "service": "Residential Construction",
+        "message": "We are planning a 3BHK villa in Whitefield and would like a quote.",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    } for i in range(n)]
+
+
+field = create_response_field(name="Response_get_contacts", type_=List[ContactSubmission])
+loop = asyncio.new_event_loop()
+
+
+def fastapi_path(docs):
+    content = loop.run_until_complete(serialize_response(field=field, response_content=docs))
+    return JSONResponse(content).body
+
+
+def orjson_path(docs):
+    return ORJSONResponse(docs).body
+
+
+def measure(fn, docs, min_time=0.5):
+    fn(docs)
+    runs = 0
+    start = time.process_time()
+    while True:
+        fn(docs)
+        runs += 1
+        elapsed = time.process_time() - start
+        if elapsed >= min_time:
+            return 1e6 * elapsed / runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--json", action="store_true", help="emit machine-readable results")
+    args = parser.parse_args()
+
+    results = []
+    for n in SIZES:
+        docs = make_docs(n)
+        assert json.loads(fastapi_path(docs)) == json.loads(orjson_path(docs))
+        before, after = measure(fastapi_path, docs), measure(orjson_path, docs)
+        results.append({"docs": n, "fastapi_us": round(before, 1), "orjson_us": round(after, 1),
+                        "speedup": round(before / after, 1)})
+
+    if args.json:
+        print(json.dumps(results))
+        return
+    print(f"{'docs':>6} {'fastapi (us)':>14} {'orjson (us)':>13} {'speedup':>8}")
+    for row in results:
+        print(f"{row['docs']:>6} {row['fastapi_us']:>14} {row['orjson_us']:>13} {row['speedup']:>7}x")
+
+
+if __name__ == "__main__":
+    main()
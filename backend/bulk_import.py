@@ -0,0 +1,230 @@
+"""Streaming parsers and chunked writer for the bulk import endpoints.
+
+Request bodies are consumed chunk by chunk from ``request.stream()``, parsed
+row by row, validated against the create models and written in unordered
+bulk writes of ``chunk_size`` rows, so memory stays bounded by one chunk
+however large the upload is. Supported bodies:
+
+* ``application/json`` - a JSON array of objects
+* ``application/x-ndjson`` - one JSON object per line
+* ``text/csv`` - a header row followed by one row per record
+
+``limit_body`` and ``max_rows`` cap an upload. Going over either stops the
+import like a malformed stream does: chunks already written stay written,
+and the report is marked ``too_large``.
+"""
+import codecs
+import csv
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from repository import WriteFailed
+
+MAX_RECORD_BYTES = 1 << 20
+MAX_REPORTED_ERRORS = 1000
+
+FORMATS = {
+    "application/json": "json",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "text/csv": "csv",
+}
+
+
+class RowError(Exception):
+    pass
+
+
+class ImportTooLarge(RowError):
+    pass
+
+
+def detect_format(content_type: str):
+    return FORMATS.get(content_type.split(";")[0].strip().lower())
+
+
+async def limit_body(chunks: AsyncIterator[bytes], max_bytes: int) -> AsyncIterator[bytes]:
+    received = 0
+    async for chunk in chunks:
+        received += len(chunk)
+        if received > max_bytes:
+            raise ImportTooLarge(f"Body exceeds {max_bytes} bytes")
+        yield chunk
+
+
+async def _text(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    async for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    pending = ""
+    async for text in _text(chunks):
+        pending += text
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line
+        if len(pending) > MAX_RECORD_BYTES:
+            raise RowError("Line exceeds maximum record size")
+    if pending:
+        yield pending
+
+
+async def parse_ndjson(chunks):
+    row = 0
+    async for line in _lines(chunks):
+        if not line.strip():
+            continue
+        row += 1
+        try:
+            yield row, json.loads(line)
+        except ValueError as exc:
+            yield row, RowError(f"Invalid JSON: {exc}")
+
+
+async def parse_json_array(chunks):
+    decoder = json.JSONDecoder()
+    buffer, pos, row = "", 0, 0
+    started = finished = False
+    stream = _text(chunks).__aiter__()
+    exhausted = False
+
+    async def fill():
+        nonlocal buffer, pos, exhausted
+        try:
+            text = await stream.__anext__()
+        except StopAsyncIteration:
+            exhausted = True
+            return
+        buffer = buffer[pos:] + text
+        pos = 0
+
+    while not finished:
+        while pos < len(buffer) and buffer[pos] in " \t\r\n" + (",]" if started else ""):
+            if started and buffer[pos] == "]":
+                finished = True
+                break
+            pos += 1
+        if finished:
+            break
+        if pos >= len(buffer):
+            if exhausted:
+                raise RowError("Unexpected end of JSON array")
+            await fill()
+            continue
+        if not started:
+            if buffer[pos] != "[":
+                raise RowError("Body must be a JSON array")
+            started = True
+            pos += 1
+            continue
+        try:
+            value, end = decoder.raw_decode(buffer, pos)
+        except ValueError:
+            if exhausted or len(buffer) - pos > MAX_RECORD_BYTES:
+                raise RowError(f"Invalid JSON after row {row}")
+            await fill()
+            continue
+        row += 1
+        pos = end
+        yield row, value
+
+
+async def parse_csv(chunks):
+    header = None
+    pending: List[str] = []
+    row = 0
+    async for line in _lines(chunks):
+        pending.append(line)
+        # A quoted field may contain newlines; wait until the quotes balance.
+        if sum(part.count('"') for part in pending) % 2:
+            continue
+        record = next(csv.reader(["\n".join(pending)]), [])
+        pending = []
+        if not any(field.strip() for field in record):
+            continue
+        if header is None:
+            header = [name.strip() for name in record]
+            continue
+        row += 1
+        if len(record) > len(header):
+            yield row, RowError(f"Expected {len(header)} columns, got {len(record)}")
+            continue
+        yield row, {name: value for name, value in zip(header, record) if value != ""}
+    if pending:
+        yield row + 1, RowError("Unterminated quoted field")
+
+
+PARSERS = {"json": parse_json_array, "ndjson": parse_ndjson, "csv": parse_csv}
+
+
+class ImportReport:
+    def __init__(self):
+        self.received = 0
+        self.inserted = 0
+        self.existing = 0
+        self.failed = 0
+        self.errors: List[Dict[str, Any]] = []
+        self.too_large = False
+
+    def error(self, row: int, message: Any):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row, "error": message})
+
+    def as_dict(self):
+        return {
+            "received": self.received,
+            "inserted": self.inserted,
+            "existing": self.existing,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+async def run_import(chunks, fmt: str, validate, write, chunk_size: int = 1000,
+                     max_rows: Optional[int] = None) -> ImportReport:
+    """Parse ``chunks``, turn each valid row into a document with ``validate`` and
+    hand batches of ``(row, doc)`` to ``write``, which updates the report."""
+    report = ImportReport()
+    batch: List[Tuple[int, Dict[str, Any]]] = []
+    try:
+        async for row, record in PARSERS[fmt](chunks):
+            if max_rows is not None and report.received >= max_rows:
+                raise ImportTooLarge(f"More than {max_rows} rows")
+            report.received += 1
+            if isinstance(record, RowError):
+                report.error(row, str(record))
+                continue
+            if not isinstance(record, dict):
+                report.error(row, "Expected an object")
+                continue
+            try:
+                batch.append((row, validate(record)))
+            except ValidationError as exc:
+                report.error(row, exc.errors(include_url=False, include_context=False))
+                continue
+            if len(batch) >= chunk_size:
+                await write(batch, report)
+                batch = []
+    except RowError as exc:
+        # The stream itself is malformed or over the limits; rows after this point are not read.
+        report.error(report.received + 1, str(exc))
+        report.too_large = isinstance(exc, ImportTooLarge)
+    if batch:
+        await write(batch, report)
+    return report
+
+
+def record_write_errors(exc: WriteFailed, rows: List[int], report: ImportReport):
+    for index, message in exc.errors:
+        report.error(rows[index], message)
@@ -0,0 +1,152 @@
+"""Small in-process caches for expensive, slowly changing reads."""
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+
+class TTLCache:
+    """Caches awaited results for ``ttl`` seconds.
+
+    Concurrent misses for the same key share one computation, so a burst of
+    dashboard refreshes triggers a single aggregation rather than one each.
+    """
+
+    def __init__(self, ttl: float, max_entries: int = 256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: Dict[Hashable, Tuple[float, Any]] = {}
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+
+    async def get_or_set(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                return entry[1]
+            try:
+                value = await factory()
+            finally:
+                self._locks.pop(key, None)
+            if len(self._entries) >= self.max_entries:
+                self._evict()
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            return value
+
+    def _evict(self):
+        now = time.monotonic()
+        for key in [k for k, (expires, _) in self._entries.items() if expires <= now]:
+            del self._entries[key]
+        while len(self._entries) >= self.max_entries:
+            del self._entries[next(iter(self._entries))]
+
+    def clear(self):
+        self._entries.clear()
+
+
+class CacheBackend:
+    """Storage behind ResponseCache.
+
+    The in-process LRUCache is the default; anything offering these three
+    coroutines (e.g. a thin wrapper over a Redis-compatible GET/SETEX/INCR)
+    can back the cache so that several workers share entries and invalidations.
+    """
+
+    async def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        raise NotImplementedError
+
+    async def incr(self, key: str) -> int:
+        """Increment a counter that is readable through ``get`` and never evicted."""
+        raise NotImplementedError
+
+
+class LRUCache(CacheBackend):
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._counters: Dict[str, int] = {}
+
+    async def get(self, key):
+        if key in self._counters:
+            return self._counters[key]
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    async def set(self, key, value, ttl):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def incr(self, key):
+        self._counters[key] = self._counters.get(key, 0) + 1
+        return self._counters[key]
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    headers: Dict[str, str]
+    etag: str
+
+
+class ResponseCache:
+    """Caches rendered responses per namespace and query, with ETags.
+
+    Keys embed a per-namespace generation number; ``invalidate`` bumps the
+    generation so every cached page of that namespace is orphaned at once and
+    ages out of the LRU, without having to enumerate keys.
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+
+    async def _generation(self, namespace):
+        return await self.backend.get(f"gen:{namespace}") or 0
+
+    async def get_or_render(self, namespace: str, params: Hashable,
+                            render: Callable[[], Awaitable[Tuple[bytes, Dict[str, str]]]]) -> CachedResponse:
+        key = f"{namespace}:{await self._generation(namespace)}:{params!r}"
+        cached = await self.backend.get(key)
+        if cached is not None:
+            return cached
+        body, headers = await render()
+        # Weak: CompressionMiddleware may re-encode the bytes, so 200s and 304s carry the same validator.
+        cached = CachedResponse(body, headers, 'W/"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest())
+        await self.backend.set(key, cached, self.ttl)
+        return cached
+
+    async def invalidate(self, namespace: str):
+        await self.backend.incr(f"gen:{namespace}")
+
+
+def etag_matches(etag: str, if_none_match: str) -> bool:
+    """Weak comparison, as ``If-None-Match`` uses: ``W/"x"`` and ``"x"`` match."""
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or any((tag[2:] if tag.startswith("W/") else tag) == opaque for tag in tags)
+
+
+def cached_response(request: Request, cached: CachedResponse) -> Response:
+    headers = {**cached.headers, "ETag": cached.etag, "Cache-Control": "no-cache"}
+    if etag_matches(cached.etag, request.headers.get("if-none-match", "")):
+        return Response(status_code=304, headers=headers)
+    return Response(cached.body, media_type="application/json", headers=headers)
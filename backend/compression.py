@@ -0,0 +1,172 @@
+"""Negotiated gzip/brotli compression for API responses.
+
+``CompressionMiddleware`` compresses ``/api`` responses whose media type is
+text-like (JSON, NDJSON, CSV, text) once they reach ``COMPRESSION_MIN_SIZE``
+bytes; smaller bodies go out as they are, since the headers and CPU cost
+more than the bytes saved. Brotli is preferred when the ``brotli`` package
+is installed and the client accepts it, gzip otherwise. Streamed responses
+(exports, NDJSON lists) are compressed chunk by chunk. Server-Sent Events
+are never compressed, so events are not held back in the compressor, and
+responses that already carry a ``Content-Encoding`` are left alone.
+
+Compressed responses get ``Vary: Accept-Encoding`` and have a strong ETag
+weakened (``W/"..."``): the bytes differ per encoding but the representation
+does not, so ``If-None-Match`` revalidation keeps working. The list cache
+issues weak ETags to begin with, so its 304s carry the same validator as
+its 200s; 304s get the ``Vary`` too.
+"""
+import os
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only without it
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+NEVER_COMPRESSED = ("text/event-stream",)
+
+
+def quality_values(header: str) -> dict:
+    """An ``Accept``-style header as ``{token: q}`` (``Accept-Encoding``, ``Accept``)."""
+    accepted = {}
+    for item in header.split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        name, _, value = params.strip().partition("=")
+        if name.strip().lower() == "q":
+            try:
+                q = float(value)
+            except ValueError:
+                q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def negotiate(header: str, available=None) -> Optional[str]:
+    """Best coding in ``available`` (in server preference order) the client accepts, or None."""
+    if available is None:
+        available = ("br", "gzip") if brotli is not None else ("gzip",)
+    accepted = quality_values(header)
+    best, best_q = None, 0.0
+    for coding in available:
+        q = accepted.get(coding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compressible(content_type: str) -> bool:
+    content_type = content_type.lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES) and not content_type.startswith(NEVER_COMPRESSED)
+
+
+class _Gzip:
+    def __init__(self, level: int):
+        self._obj = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data)
+
+    def finish(self) -> bytes:
+        return self._obj.flush()
+
+
+class _Brotli:
+    def __init__(self, quality: int):
+        self._obj = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.process(data)
+
+    def finish(self) -> bytes:
+        return self._obj.finish()
+
+
+class CompressionMiddleware:
+    """Pure ASGI middleware, so streamed responses stay streamed."""
+
+    def __init__(self, app, prefix: str = "/api", minimum_size: Optional[int] = None,
+                 gzip_level: Optional[int] = None, brotli_quality: Optional[int] = None):
+        self.app = app
+        self.prefix = prefix
+        self.minimum_size = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024')) if minimum_size is None else minimum_size
+        self.gzip_level = int(os.environ.get('COMPRESSION_GZIP_LEVEL', '6')) if gzip_level is None else gzip_level
+        # Quality 4-5 is brotli's sweet spot for dynamic content: smaller than gzip -6 at similar CPU.
+        self.brotli_quality = (int(os.environ.get('COMPRESSION_BROTLI_QUALITY', '4'))
+                               if brotli_quality is None else brotli_quality)
+
+    def compressor(self, coding: str):
+        return _Brotli(self.brotli_quality) if coding == "br" else _Gzip(self.gzip_level)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefix):
+            await self.app(scope, receive, send)
+            return
+        coding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        start = None
+        compressor = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, compressor, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message.get("headers", []))
+                if message["status"] == 304 and "content-encoding" not in headers:
+                    # Same Vary as the 200 it stands for, so caches key the revalidation the same way.
+                    MutableHeaders(raw=message.setdefault("headers", [])).add_vary_header("Accept-Encoding")
+                if ("content-encoding" in headers or message["status"] in (204, 304)
+                        or not compressible(headers.get("content-type", ""))):
+                    passthrough = True
+                    await send(message)
+                    return
+                MutableHeaders(raw=message.setdefault("headers", [])).add_vary_header("Accept-Encoding")
+                if coding is None:
+                    passthrough = True
+                    await send(message)
+                    return
+                # Hold the start until the first body chunk shows whether compression is worth it.
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = self.compressor(coding)
+                headers = MutableHeaders(raw=start["headers"])
+                headers["Content-Encoding"] = coding
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    headers["ETag"] = "W/" + etag
+                if more_body:
+                    del headers["Content-Length"]
+                else:
+                    body = compressor.compress(body) + compressor.finish()
+                    headers["Content-Length"] = str(len(body))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send(start)
+            data = compressor.compress(body)
+            if not more_body:
+                data += compressor.finish()
+            if data or not more_body:
+                await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
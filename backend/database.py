@@ -0,0 +1,144 @@
+"""Motor client construction, pool tuning and pool instrumentation.
+
+Pool settings come from the environment so each deployment can size the pool
+to its worker count without a code change:
+
+    MONGO_MAX_POOL_SIZE                 (pymongo default 100)
+    MONGO_MIN_POOL_SIZE                 (default 0)
+    MONGO_MAX_IDLE_TIME_MS
+    MONGO_WAIT_QUEUE_TIMEOUT_MS
+    MONGO_SERVER_SELECTION_TIMEOUT_MS   (pymongo default 30000)
+    MONGO_COMPRESSORS                   comma separated, e.g. "zstd,zlib"
+    MONGO_WARM_CONNECTIONS              connections opened at startup (default: min pool size)
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+
+from metrics import command_monitor
+
+logger = logging.getLogger(__name__)
+
+_INT_OPTIONS = {
+    "maxPoolSize": "MONGO_MAX_POOL_SIZE",
+    "minPoolSize": "MONGO_MIN_POOL_SIZE",
+    "maxIdleTimeMS": "MONGO_MAX_IDLE_TIME_MS",
+    "waitQueueTimeoutMS": "MONGO_WAIT_QUEUE_TIMEOUT_MS",
+    "serverSelectionTimeoutMS": "MONGO_SERVER_SELECTION_TIMEOUT_MS",
+}
+
+
+def client_options_from_env():
+    options = {}
+    for option, var in _INT_OPTIONS.items():
+        if os.environ.get(var):
+            options[option] = int(os.environ[var])
+    if os.environ.get('MONGO_COMPRESSORS'):
+        options["compressors"] = os.environ['MONGO_COMPRESSORS']
+    return options
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Tracks how long requests wait to check a connection out of the pool.
+
+    A steadily growing wait means the pool (or the server) is the bottleneck:
+    raise MONGO_MAX_POOL_SIZE or run fewer workers per host. pymongo runs
+    check-out start and completion on the same thread, so the start time is
+    kept in a thread local.
+    """
+
+    def __init__(self, window: int = 1024):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=window)
+        self.checkouts = 0
+        self.failures = 0
+        self.in_use = 0
+        self.open = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _waited(self):
+        started = getattr(self._local, "started", None)
+        self._local.started = None
+        return time.perf_counter() - started if started is not None else 0.0
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        wait = self._waited()
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self._recent.append(wait)
+
+    def connection_check_out_failed(self, event):
+        self._waited()
+        with self._lock:
+            self.failures += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use -= 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open -= 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def snapshot(self):
+        with self._lock:
+            recent = sorted(self._recent)
+            return {
+                "checkouts": self.checkouts,
+                "checkout_failures": self.failures,
+                "connections_open": self.open,
+                "connections_in_use": self.in_use,
+                "wait_ms_avg": round(1000 * self.total_wait / self.checkouts, 3) if self.checkouts else 0.0,
+                "wait_ms_p95": round(1000 * recent[int(0.95 * (len(recent) - 1))], 3) if recent else 0.0,
+                "wait_ms_max": round(1000 * self.max_wait, 3),
+            }
+
+
+pool_monitor = PoolMonitor()
+
+
+def create_client(mongo_url: str) -> AsyncIOMotorClient:
+    options = client_options_from_env()
+    logger.info("Creating Mongo client with %s", options or "default pool settings")
+    return AsyncIOMotorClient(mongo_url, event_listeners=[pool_monitor, command_monitor], **options)
+
+
+async def warm_pool(client, db):
+    """Open connections up front so the first requests after a deploy don't pay for the handshakes."""
+    connections = int(os.environ.get('MONGO_WARM_CONNECTIONS') or client_options_from_env().get("minPoolSize", 1))
+    start = time.perf_counter()
+    await asyncio.gather(*(db.command("ping") for _ in range(max(connections, 1))))
+    logger.info("Warmed Mongo pool with %d connection(s) in %.1f ms", connections, 1000 * (time.perf_counter() - start))
@@ -0,0 +1,151 @@
+"""Streaming encoders for the export endpoints.
+
+Each encoder consumes an async Motor cursor and yields bytes batch by batch,
+so an export holds at most one cursor batch in memory and gives the event
+loop back between batches; ``CompressionMiddleware`` compresses CSV and NDJSON
+on the fly.
+XLSX is written as a zip streamed through a non-seekable sink (entries use
+data descriptors), with the worksheet in inline-string form so no shared
+strings table has to be built in memory.
+"""
+import csv
+import io
+import re
+import zipfile
+from typing import AsyncIterator, Dict, Sequence
+from xml.sax.saxutils import escape
+
+import orjson
+
+CONTACT_COLUMNS = ("id", "name", "email", "phone", "service", "message", "created_at")
+NEWSLETTER_COLUMNS = ("id", "email", "subscribed_at")
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+async def _batches(cursor, size: int):
+    batch = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def ndjson_rows(cursor, columns: Sequence[str] = (), batch_size: int = 500) -> AsyncIterator[bytes]:
+    async for batch in _batches(cursor, batch_size):
+        yield b"".join(orjson.dumps(doc) + b"\n" for doc in batch)
+
+
+def _csv_safe(value) -> str:
+    # Keep spreadsheet apps from evaluating user-supplied text as a formula
+    # (phone numbers like "+91 ..." and negative numbers are left alone).
+    text = "" if value is None else str(value)
+    if text[:1] in ("=", "@", "\t", "\r") or (text[:1] in ("+", "-") and not text[1:2].isdigit() and text[1:2] != " "):
+        return "'" + text
+    return text
+
+
+async def csv_rows(cursor, columns: Sequence[str], batch_size: int = 500) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    async for batch in _batches(cursor, batch_size):
+        writer.writerows([_csv_safe(doc.get(col)) for col in columns] for doc in batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _Sink(io.RawIOBase):
+    """Write-only, non-seekable file object that zipfile writes into; drained after each batch."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+_XLSX_STATIC: Dict[str, str] = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Export" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'),
+}
+
+
+# Control characters are not allowed anywhere in an XML document.
+_XML_INVALID = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _xlsx_row(values) -> str:
+    cells = "".join(
+        f'<c t="inlineStr"><is><t xml:space="preserve">{escape(_XML_INVALID.sub("", str(v)))}</t></is></c>'
+        for v in ("" if v is None else v for v in values)
+    )
+    return f"<row>{cells}</row>"
+
+
+async def xlsx_rows(cursor, columns: Sequence[str], batch_size: int = 500) -> AsyncIterator[bytes]:
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_STATIC.items():
+            archive.writestr(name, content)
+        with archive.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                        b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+            sheet.write(_xlsx_row(columns).encode())
+            yield sink.drain()
+            async for batch in _batches(cursor, batch_size):
+                sheet.write("".join(_xlsx_row(doc.get(col) for col in columns) for doc in batch).encode())
+                yield sink.drain()
+            sheet.write(b"</sheetData></worksheet>")
+    yield sink.drain()
+
+
+ENCODERS = {"csv": csv_rows, "ndjson": ndjson_rows, "xlsx": xlsx_rows}
+
@@ -0,0 +1,80 @@
+"""Query builders shared by the list, stats and export endpoints."""
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from ingest import normalize_email, normalize_phone
+
+
+def iso(value: datetime) -> str:
+    return value.astimezone(timezone.utc).isoformat()
+
+
+def date_range(field: str, since: Optional[datetime], until: Optional[datetime]) -> Dict[str, Any]:
+    """Half-open [since, until) range on an ISO-8601 UTC string field."""
+    bounds = {}
+    if since:
+        bounds["$gte"] = iso(since)
+    if until:
+        bounds["$lt"] = iso(until)
+    return {field: bounds} if bounds else {}
+
+
+def mixed_date_range(field: str, since: Optional[datetime], until: Optional[datetime]) -> Dict[str, Any]:
+    """``date_range`` that also matches BSON dates (compact contacts schema, or mid-migration)."""
+    strings = date_range(field, since, until)
+    if not strings:
+        return {}
+    dates = {}
+    if since:
+        dates["$gte"] = since.astimezone(timezone.utc)
+    if until:
+        dates["$lt"] = until.astimezone(timezone.utc)
+    return {"$or": [strings, {field: dates}]}
+
+
+@dataclass
+class ListFilter:
+    """Storage-neutral filter: a [since, until) range on the collection's timestamp,
+    exact matches on fields, and free text matched against the collection's text fields."""
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+    equals: Dict[str, str] = field(default_factory=dict)
+    text: Optional[str] = None
+
+
+def contact_filter(
+    service: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    email: Optional[str] = None,
+    phone: Optional[str] = None,
+    q: Optional[str] = None,
+) -> ListFilter:
+    equals = {}
+    if service:
+        equals["service"] = service
+    # Stored the way ingest normalizes them (older leads once `lifecycle.py normalize` has run),
+    # so match on the normalized form.
+    if email:
+        equals["email"] = normalize_email(email)
+    if phone:
+        equals["phone"] = normalize_phone(phone.strip())
+    return ListFilter(since, until, equals, q.strip() if q and q.strip() else None)
+
+
+def mongo_query(filters: ListFilter, sort_field: str) -> Dict[str, Any]:
+    """For contacts every condition is served by an index: ``service_created_at_id``,
+    ``created_at_id``, ``email``, ``phone`` and the ``contacts_text`` text index."""
+    query = date_range(sort_field, filters.since, filters.until)
+    query.update(filters.equals)
+    if filters.text:
+        query["$text"] = {"$search": text_search(filters.text)}
+    return query
+
+
+def text_search(text: str) -> str:
+    """``$search`` string requiring every term. Unquoted terms are OR-ed, and the text index
+    splits ``john@gmail.com`` into john/gmail/com; quoted, each must appear as typed."""
+    terms = [term.replace('"', "") for term in text.split()]
+    return " ".join(f'"{term}"' for term in terms if term)
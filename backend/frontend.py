@@ -0,0 +1,139 @@
+"""Serve the built frontend bundle from the API process.
+
+With ``FRONTEND_BUILD_DIR`` pointing at ``frontend/build`` the API mounts
+``FrontendFiles`` at ``/`` behind its own routes:
+
+* Files with a content hash in their name (``main.3f2a1b9c.js``,
+  ``logo.6ce24c58023cc2f8fd88fe9d219db6c6.svg``) are cached for a year as
+  ``immutable``; everything else (``index.html``, ``manifest.json``) is
+  ``no-cache``, so a deploy is picked up on the next navigation.
+* A ``.br`` or ``.gz`` file next to the original is sent instead, with
+  ``Content-Encoding``, when the client accepts it.
+* Every response carries ``ETag`` and ``Last-Modified`` and answers
+  ``If-None-Match``/``If-Modified-Since`` with 304.
+* Unknown paths without a file extension get ``index.html`` so client-side
+  routes survive a reload; ``/api/...`` paths still 404.
+
+Generate the compressed files once per build, from backend/:
+
+    python frontend.py ../frontend/build
+"""
+import argparse
+import gzip
+import logging
+import mimetypes
+import os
+import re
+import stat
+from pathlib import Path
+from typing import Dict, Tuple
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from compression import brotli, negotiate
+
+logger = logging.getLogger("frontend")
+
+HASHED_NAME = re.compile(r"\.[0-9a-f]{8,}(\.chunk)?\.[A-Za-z0-9]+$")
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+PRECOMPRESS_SUFFIXES = (".html", ".js", ".css", ".json", ".map", ".svg", ".txt", ".xml", ".ico", ".webmanifest")
+
+
+class FrontendFiles(StaticFiles):
+    def __init__(self, directory: str):
+        super().__init__(directory=directory, html=True)
+        # The bundle does not change while the process runs; remember which files have siblings.
+        self._variants: Dict[str, Tuple[Tuple[str, str, os.stat_result], ...]] = {}
+
+    async def get_response(self, path, scope):
+        if path.split(os.sep, 1)[0] == "api":
+            raise HTTPException(status_code=404)
+        try:
+            return await super().get_response(path, scope)
+        except HTTPException as exc:
+            if exc.status_code != 404 or "." in os.path.basename(path):
+                raise
+        full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, "index.html")
+        if stat_result is None:
+            raise HTTPException(status_code=404)
+        return self.file_response(full_path, stat_result, scope)
+
+    def variants(self, full_path: str):
+        found = self._variants.get(full_path)
+        if found is None:
+            found = []
+            for coding, suffix in PRECOMPRESSED:
+                try:
+                    variant_stat = os.stat(full_path + suffix)
+                except OSError:
+                    continue
+                if stat.S_ISREG(variant_stat.st_mode):
+                    found.append((coding, full_path + suffix, variant_stat))
+            found = self._variants[full_path] = tuple(found)
+        return found
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        request_headers = Headers(scope=scope)
+        full_path = str(full_path)
+        headers = {"Cache-Control": IMMUTABLE if HASHED_NAME.search(full_path) else REVALIDATE}
+        media_type = mimetypes.guess_type(full_path)[0] or "text/plain"
+        variants = self.variants(full_path)
+        if variants:
+            headers["Vary"] = "Accept-Encoding"
+            coding = negotiate(request_headers.get("accept-encoding", ""), [c for c, _, _ in variants])
+            for name, variant_path, variant_stat in variants:
+                if name == coding:
+                    # The variant's own size and mtime give it a distinct ETag.
+                    full_path, stat_result = variant_path, variant_stat
+                    headers["Content-Encoding"] = coding
+                    break
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result,
+                                media_type=media_type, headers=headers)
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+def precompress(directory: Path, min_size: int = 1024) -> int:
+    """Write ``.gz`` (and ``.br`` with brotli installed) next to each text asset; returns files written."""
+    written = 0
+    for path in sorted(directory.rglob("*")):
+        if not path.is_file() or path.suffix not in PRECOMPRESS_SUFFIXES:
+            continue
+        data = path.read_bytes()
+        if len(data) < min_size:
+            continue
+        encoders = [(".gz", lambda raw: gzip.compress(raw, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            encoders.append((".br", lambda raw: brotli.compress(raw, quality=11)))
+        for suffix, encode in encoders:
+            target = path.with_name(path.name + suffix)
+            if target.exists() and target.stat().st_mtime >= path.stat().st_mtime:
+                continue
+            packed = encode(data)
+            if len(packed) >= len(data):
+                continue
+            target.write_bytes(packed)
+            written += 1
+    logger.info("Wrote %d precompressed file(s) under %s%s", written, directory,
+                "" if brotli is not None else " (gzip only; install brotli for .br)")
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompress the built frontend for FrontendFiles")
+    parser.add_argument("directory", type=Path, nargs="?", default=Path(__file__).parent.parent / "frontend" / "build")
+    parser.add_argument("--min-size", type=int, default=1024, help="skip files smaller than this many bytes")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    precompress(args.directory, args.min_size)
+
+
+if __name__ == "__main__":
+    main()
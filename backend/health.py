@@ -0,0 +1,8 @@
+"""Process-level health flags shared by the serving entrypoint and the health endpoints.
+
+``started`` flips once the lifespan startup has finished; ``draining`` flips
+when the worker received SIGTERM and is waiting out its drain delay, so
+readiness fails while in-flight and already-routed requests still complete.
+"""
+started = False
+draining = False
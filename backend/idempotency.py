@@ -0,0 +1,202 @@
+"""``Idempotency-Key`` support for form submissions.
+
+A client that retries a POST after a timeout sends the same key again. The
+first request claims the key (status ``pending``) and runs; its response is
+stored against the key (status ``done``) and replayed verbatim, with
+``Idempotent-Replayed: true``, to every later request carrying that key,
+without running the handler again. A retry that arrives while the first
+attempt is still running gets 409 with ``Retry-After``; the same key with a
+different body gets 422. A handler that fails releases its claim so the
+retry runs for real, and a claim left ``pending`` by a crashed worker can be
+taken over after ``IDEMPOTENCY_LOCK_SECONDS``. Once the handler has
+succeeded its side effects are done, so storing the response is retried
+(``IDEMPOTENCY_COMPLETE_ATTEMPTS``) rather than leaving a claim that a
+later takeover would run again; the response is returned either way.
+
+Completed records live in the ``idempotency_keys`` collection, which a TTL
+index purges after ``IDEMPOTENCY_TTL_SECONDS`` (24h), with an in-process LRU
+in front so hot retries skip the round trip. Embedded storage backends keep
+records in memory, per process.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import orjson
+from fastapi import HTTPException
+from fastapi.responses import ORJSONResponse
+from pymongo.errors import DuplicateKeyError
+
+from cache import CacheBackend, LRUCache
+
+logger = logging.getLogger("idempotency")
+
+Record = Dict[str, Any]
+
+
+def fingerprint(payload: dict) -> str:
+    return hashlib.blake2b(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS), digest_size=16).hexdigest()
+
+
+class IdempotencyStore:
+    async def claim(self, key: str, fingerprint: str, lock_seconds: float) -> Optional[Record]:
+        """Reserve ``key`` for the caller and return None, or return the record already holding it."""
+        raise NotImplementedError
+
+    async def get(self, key: str) -> Optional[Record]:
+        raise NotImplementedError
+
+    async def complete(self, key: str, response: Any) -> None:
+        raise NotImplementedError
+
+    async def release(self, key: str) -> None:
+        raise NotImplementedError
+
+
+class MongoIdempotencyStore(IdempotencyStore):
+    def __init__(self, db):
+        self.collection = db.idempotency_keys
+
+    async def claim(self, key, fingerprint, lock_seconds):
+        while True:
+            now = datetime.now(timezone.utc)
+            try:
+                await self.collection.insert_one(
+                    {"_id": key, "fingerprint": fingerprint, "status": "pending", "created_at": now})
+                return None
+            except DuplicateKeyError:
+                pass
+            existing = await self.collection.find_one({"_id": key})
+            if existing is None:
+                continue  # released or expired in between
+            created_at = existing["created_at"].replace(tzinfo=timezone.utc)
+            if existing["status"] == "pending" and created_at < now - timedelta(seconds=lock_seconds):
+                taken = await self.collection.update_one(
+                    {"_id": key, "status": "pending", "created_at": existing["created_at"]},
+                    {"$set": {"fingerprint": fingerprint, "created_at": now}})
+                if taken.modified_count:
+                    return None
+                continue
+            return existing
+
+    async def get(self, key):
+        return await self.collection.find_one({"_id": key})
+
+    async def complete(self, key, response):
+        # created_at restarts the TTL from completion rather than from the claim.
+        await self.collection.update_one(
+            {"_id": key}, {"$set": {"status": "done", "response": response, "created_at": datetime.now(timezone.utc)}})
+
+    async def release(self, key):
+        await self.collection.delete_one({"_id": key, "status": "pending"})
+
+
+class MemoryIdempotencyStore(IdempotencyStore):
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._records: Dict[str, Record] = {}
+
+    def _purge(self):
+        now = time.monotonic()
+        for key in [k for k, record in self._records.items() if record["expires"] <= now]:
+            del self._records[key]
+
+    async def claim(self, key, fingerprint, lock_seconds):
+        self._purge()
+        now = time.monotonic()
+        existing = self._records.get(key)
+        if existing is not None and not (existing["status"] == "pending" and existing["claimed"] < now - lock_seconds):
+            return existing
+        self._records[key] = {"fingerprint": fingerprint, "status": "pending", "claimed": now, "expires": now + self.ttl}
+        return None
+
+    async def get(self, key):
+        record = self._records.get(key)
+        return record if record is not None and record["expires"] > time.monotonic() else None
+
+    async def complete(self, key, response):
+        record = self._records.get(key)
+        if record is not None:
+            record.update(status="done", response=response, expires=time.monotonic() + self.ttl)
+
+    async def release(self, key):
+        if self._records.get(key, {}).get("status") == "pending":
+            del self._records[key]
+
+
+class Idempotency:
+    def __init__(self, ttl: float = 86400, lock_seconds: float = 60, cache: Optional[CacheBackend] = None,
+                 complete_attempts: int = 3, complete_backoff: float = 0.1):
+        self.ttl = ttl
+        self.lock_seconds = lock_seconds
+        self.complete_attempts = complete_attempts
+        self.complete_backoff = complete_backoff
+        # Only completed records are cached; they never change for the lifetime of the key.
+        self.cache = cache or LRUCache(1024)
+        # Set at startup to match the storage backend.
+        self.store: Optional[IdempotencyStore] = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            ttl=float(os.environ.get('IDEMPOTENCY_TTL_SECONDS', str(24 * 3600))),
+            lock_seconds=float(os.environ.get('IDEMPOTENCY_LOCK_SECONDS', '60')),
+            cache=LRUCache(int(os.environ.get('IDEMPOTENCY_CACHE_MAX_ENTRIES', '1024'))),
+            complete_attempts=int(os.environ.get('IDEMPOTENCY_COMPLETE_ATTEMPTS', '3')),
+        )
+
+    async def _completed(self, key: str) -> Optional[Record]:
+        record = await self.cache.get(key)
+        if record is None:
+            record = await self.store.get(key)
+            if record is None or record["status"] != "done":
+                return None
+            record = {"fingerprint": record["fingerprint"], "status": "done", "response": record["response"]}
+            await self.cache.set(key, record, self.ttl)
+        return record
+
+    async def known(self, scope: str, key: Optional[str]) -> bool:
+        """Whether a request under ``key`` has completed or is still running."""
+        if not key:
+            return False
+        key = f"{scope}:{key}"
+        return await self.cache.get(key) is not None or await self.store.get(key) is not None
+
+    async def run(self, scope: str, key: str, fingerprint: str,
+                  handler: Callable[[], Awaitable[Any]]) -> ORJSONResponse:
+        key = f"{scope}:{key}"
+        record = await self._completed(key)
+        if record is None:
+            record = await self.store.claim(key, fingerprint, self.lock_seconds)
+        if record is not None:
+            if record["status"] != "done":
+                raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is in progress",
+                                    headers={"Retry-After": "1"})
+            if record["fingerprint"] != fingerprint:
+                raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+            return ORJSONResponse(record["response"], headers={"Idempotent-Replayed": "true"})
+        try:
+            response = await handler()
+        except BaseException:
+            await self.store.release(key)
+            raise
+        # Cached first: retries reaching this process replay even if the store stays unreachable.
+        await self.cache.set(key, {"fingerprint": fingerprint, "status": "done", "response": response}, self.ttl)
+        await self._complete(key, response)
+        return ORJSONResponse(response)
+
+    async def _complete(self, key: str, response: Any):
+        for attempt in range(1, self.complete_attempts + 1):
+            try:
+                await self.store.complete(key, response)
+                return
+            except Exception as exc:
+                if attempt == self.complete_attempts:
+                    logger.error("Could not record the response for %s after %d attempt(s); a retry on another "
+                                 "worker may run again once the claim is stale: %s", key, attempt, exc)
+                    return
+                await asyncio.sleep(self.complete_backoff * 2 ** (attempt - 1))
@@ -0,0 +1,61 @@
+"""Index definitions, applied once at startup.
+
+``create_indexes`` is a no-op for indexes that already exist with the same
+spec, so running it on every boot is cheap and keeps environments in sync.
+"""
+import logging
+import os
+
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+INDEXES = {
+    "contacts": [
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_at_id"),
+        IndexModel([("service", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+                   name="service_created_at_id"),
+        IndexModel([("email", ASCENDING)], name="email"),
+        IndexModel([("phone", ASCENDING)], name="phone"),
+        # No stemming: names, emails and phone numbers must match as typed.
+        IndexModel([("name", TEXT), ("email", TEXT), ("phone", TEXT), ("message", TEXT)],
+                   name="contacts_text", default_language="none",
+                   weights={"name": 10, "email": 10, "phone": 10, "message": 1}),
+    ],
+    "newsletter": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        IndexModel([("subscribed_at", DESCENDING), ("id", DESCENDING)], name="subscribed_at_id"),
+    ],
+    # Cold storage for leads moved out by ``lifecycle archive``; purged after
+    # CONTACTS_ARCHIVE_TTL_DAYS when set, kept forever otherwise.
+    "contacts_archive": [
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_at_id"),
+        IndexModel([("email", ASCENDING)], name="email"),
+    ] + ([IndexModel([("archived_at", ASCENDING)], name="archived_at_ttl",
+                     expireAfterSeconds=int(float(os.environ['CONTACTS_ARCHIVE_TTL_DAYS']) * 86400))]
+         if os.environ.get('CONTACTS_ARCHIVE_TTL_DAYS') else []),
+    # Idempotency-Key records for form retries (see idempotency.py).
+    "idempotency_keys": [
+        IndexModel([("created_at", ASCENDING)], name="created_at_ttl",
+                   expireAfterSeconds=int(float(os.environ.get('IDEMPOTENCY_TTL_SECONDS', str(24 * 3600))))),
+    ],
+    "jobs": [
+        IndexModel([("status", ASCENDING), ("run_at", ASCENDING)], name="status_run_at"),
+        IndexModel([("status", ASCENDING), ("locked_until", ASCENDING)], name="status_locked_until"),
+        IndexModel([("completed_at", ASCENDING)], name="completed_at_ttl",
+                   expireAfterSeconds=int(os.environ.get('JOBS_RETENTION_SECONDS', str(7 * 24 * 3600)))),
+    ],
+}
+
+
+async def ensure_indexes(db):
+    for collection, models in INDEXES.items():
+        try:
+            names = await db[collection].create_indexes(models)
+        except OperationFailure as exc:
+            # Most likely legacy duplicate emails blocking the unique index; keep serving
+            # and let an operator dedupe (``python lifecycle.py normalize``) rather than failing the boot.
+            logger.error("Could not ensure indexes on %s: %s (run `python lifecycle.py normalize`)", collection, exc)
+            continue
+        logger.info("Ensured indexes on %s: %s", collection, ", ".join(names))
@@ -0,0 +1,66 @@
+"""Cheap identifiers, timestamps and field normalization for incoming submissions.
+
+Documents are built once, from the validated create model, instead of
+re-validating through the stored model. Ids are UUIDv7 (RFC 9562): the
+leading 48 bits are the Unix time in milliseconds, so new ids sort after
+older ones and land on the right-hand edge of id indexes instead of random
+pages. ``stamp`` takes the id and the ISO-8601 ``created_at`` from a single
+clock read and reuses the formatted date-time prefix within a second.
+"""
+import os
+import re
+import time
+from typing import Optional, Tuple
+
+_PHONE_NOISE = re.compile(r"[\s().\-/]")
+_second: Tuple[int, str] = (-1, "")
+
+
+def uuid7(unix_ms: Optional[int] = None) -> str:
+    if unix_ms is None:
+        unix_ms = time.time_ns() // 1_000_000
+    rand = int.from_bytes(os.urandom(10), "big")
+    value = ((unix_ms & 0xFFFFFFFFFFFF) << 80) | (0x7 << 76) | ((rand >> 62) & 0xFFF) << 64 \
+        | (0b10 << 62) | (rand & 0x3FFFFFFFFFFFFFFF)
+    h = f"{value:032x}"
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+
+def _iso(micros: int) -> str:
+    # Same output as datetime.now(timezone.utc).isoformat().
+    global _second
+    seconds, fraction = divmod(micros, 1_000_000)
+    if _second[0] != seconds:
+        _second = (seconds, time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(seconds)))
+    if fraction:
+        return f"{_second[1]}.{fraction:06d}+00:00"
+    return f"{_second[1]}+00:00"
+
+
+def now_iso() -> str:
+    return _iso(time.time_ns() // 1000)
+
+
+def stamp() -> Tuple[str, str]:
+    """``(id, created_at)`` for a new document."""
+    ns = time.time_ns()
+    return uuid7(ns // 1_000_000), _iso(ns // 1000)
+
+
+def normalize_email(value: str) -> str:
+    return value.strip().lower()
+
+
+def normalize_phone(value: Optional[str]) -> str:
+    """Drop spaces and punctuation, keep digits and a leading ``+``: "+91 98765-43210" -> "+919876543210"."""
+    return _PHONE_NOISE.sub("", value) if value else ""
+
+
+def contact_doc(fields: dict) -> dict:
+    ident, created_at = stamp()
+    return {"id": ident, **fields, "created_at": created_at}
+
+
+def newsletter_doc(fields: dict) -> dict:
+    ident, subscribed_at = stamp()
+    return {"id": ident, **fields, "subscribed_at": subscribed_at}
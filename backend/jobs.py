@@ -0,0 +1,255 @@
+"""Persistent background jobs stored in Mongo and run by an asyncio worker pool.
+
+Work that should not delay a response (notifications, CRM sync, scoring) is
+enqueued as a document in ``jobs`` and picked up by ``JobQueue`` workers:
+
+* A worker claims a job with one ``find_one_and_update`` that flips it to
+  ``running`` and sets ``locked_until``, so any number of workers across
+  processes can share the collection without double-processing.
+* A job whose worker died is reclaimed once ``locked_until`` passes
+  (the visibility timeout).
+* Failures are retried with exponential backoff plus jitter; after
+  ``max_attempts`` the job is moved to ``jobs_dead`` with its last error.
+* Finished jobs keep ``completed_at`` and are purged by a TTL index.
+
+Handlers are registered per job type with ``@job_queue.handler("type")`` and
+receive the job payload. Request handlers use ``submit``, which stores the
+job in a background task: the response does not wait on the ``jobs`` write,
+and a failure to store it is logged and counted rather than failing a
+request whose own write already succeeded.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from pymongo import ReturnDocument
+
+from metrics import Counter, Histogram, REGISTRY
+
+logger = logging.getLogger(__name__)
+
+JOB_LAG = Histogram(
+    "job_queue_lag_seconds", "Delay between a job becoming runnable and a worker claiming it.", ("type",),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300))
+JOB_DURATION = Histogram("job_duration_seconds", "Job handler run time.", ("type",))
+JOBS_PROCESSED = Counter("jobs_processed_total", "Jobs finished by outcome.", ("type", "outcome"))
+JOBS_ENQUEUE_FAILED = Counter("jobs_enqueue_failed_total", "Jobs submitted but never stored.", ("type",))
+REGISTRY.extend([JOB_LAG, JOB_DURATION, JOBS_PROCESSED, JOBS_ENQUEUE_FAILED])
+
+Handler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _aware(value: datetime) -> datetime:
+    # pymongo returns naive UTC datetimes unless the client is tz_aware.
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+class JobQueue:
+    def __init__(
+        self,
+        concurrency: int = 2,
+        max_attempts: int = 5,
+        visibility_timeout: float = 60,
+        backoff_base: float = 2,
+        backoff_max: float = 600,
+        poll_interval: float = 1,
+    ):
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.visibility_timeout = visibility_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.poll_interval = poll_interval
+        self.handlers: Dict[str, Handler] = {}
+        self.db = None
+        self._tasks = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+        self._background = set()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            concurrency=int(os.environ.get('JOBS_CONCURRENCY', '2')),
+            max_attempts=int(os.environ.get('JOBS_MAX_ATTEMPTS', '5')),
+            visibility_timeout=float(os.environ.get('JOBS_VISIBILITY_TIMEOUT', '60')),
+            backoff_base=float(os.environ.get('JOBS_BACKOFF_BASE', '2')),
+            poll_interval=float(os.environ.get('JOBS_POLL_INTERVAL', '1')),
+        )
+
+    def handler(self, job_type: str):
+        def register(fn: Handler) -> Handler:
+            self.handlers[job_type] = fn
+            return fn
+        return register
+
+    async def enqueue(self, db, job_type: str, payload: Dict[str, Any], delay: float = 0) -> Optional[str]:
+        """Store a job; returns its id, or None when nothing handles ``job_type`` or there is no ``db``."""
+        if job_type not in self.handlers:
+            return None
+        if db is None:
+            # No Mongo (embedded storage backend): run once in-process, without persistence or retries.
+            task = asyncio.create_task(self._run_inline(job_type, payload))
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+            return None
+        now = _now()
+        job = {
+            "id": str(uuid.uuid4()),
+            "type": job_type,
+            "payload": payload,
+            "status": "pending",
+            "attempts": 0,
+            "run_at": now + timedelta(seconds=delay),
+            "created_at": now,
+        }
+        await db.jobs.insert_one(job)
+        if self._wakeup is not None and not delay:
+            self._wakeup.set()
+        return job["id"]
+
+    def submit(self, db, job_type: str, payload: Dict[str, Any], delay: float = 0) -> None:
+        """``enqueue`` off the caller's path; ``stop`` waits for pending submissions."""
+        task = asyncio.create_task(self._submit(db, job_type, payload, delay))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _submit(self, db, job_type, payload, delay):
+        try:
+            await self.enqueue(db, job_type, payload, delay)
+        except Exception:
+            JOBS_ENQUEUE_FAILED.inc((job_type,))
+            logger.exception("Could not enqueue %s job", job_type)
+
+    def start(self, db):
+        if self.concurrency <= 0:
+            return
+        self.db = db
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._work(i), name=f"job-worker-{i}") for i in range(self.concurrency)]
+
+    async def stop(self, timeout: float = 10):
+        """Let running handlers finish (up to ``timeout``); unfinished jobs are reclaimed after their lock expires."""
+        deadline = time.monotonic() + timeout
+        # Loop: a submission without a db starts an inline run as it finishes.
+        while self._background and time.monotonic() < deadline:
+            await asyncio.wait(set(self._background), timeout=deadline - time.monotonic())
+        if not self._tasks:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        done, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self._tasks = []
+
+    async def _claim(self):
+        now = _now()
+        return await self.db.jobs.find_one_and_update(
+            {"$or": [
+                {"status": "pending", "run_at": {"$lte": now}},
+                {"status": "running", "locked_until": {"$lte": now}},
+            ]},
+            {"$set": {"status": "running", "locked_until": now + timedelta(seconds=self.visibility_timeout),
+                      "claimed_at": now},
+             "$inc": {"attempts": 1}},
+            sort=[("run_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _work(self, index: int):
+        errors = 0
+        while not self._stopping:
+            try:
+                job = await self._claim()
+                errors = 0
+            except Exception as exc:
+                if not errors:
+                    logger.error("Job worker %d could not claim a job: %s", index, exc)
+                errors += 1
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                # Back off while the database is unreachable instead of hammering it every poll.
+                idle = min(self.poll_interval * 2 ** errors, self.backoff_max)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), idle)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _run_inline(self, job_type, payload):
+        started = time.perf_counter()
+        try:
+            await self.handlers[job_type](payload)
+            JOBS_PROCESSED.inc((job_type, "done"))
+        except Exception as exc:
+            logger.error("Job %s failed: %s: %s", job_type, type(exc).__name__, exc)
+            JOBS_PROCESSED.inc((job_type, "dead"))
+        JOB_DURATION.observe((job_type,), time.perf_counter() - started)
+
+    async def _run(self, job):
+        job_type = job["type"]
+        JOB_LAG.observe((job_type,), max((_aware(job["claimed_at"]) - _aware(job["run_at"])).total_seconds(), 0))
+        handler = self.handlers.get(job_type)
+        started = time.perf_counter()
+        try:
+            if handler is None:
+                raise LookupError(f"No handler registered for {job_type}")
+            await handler(job["payload"])
+        except Exception as exc:
+            JOB_DURATION.observe((job_type,), time.perf_counter() - started)
+            await self._failed(job, exc)
+            return
+        JOB_DURATION.observe((job_type,), time.perf_counter() - started)
+        JOBS_PROCESSED.inc((job_type, "done"))
+        # Matching on claimed_at: if the lock expired and another worker re-claimed the job, leave it to them.
+        await self.db.jobs.update_one(
+            {"_id": job["_id"], "claimed_at": job["claimed_at"]},
+            {"$set": {"status": "done", "completed_at": _now()}, "$unset": {"locked_until": ""}},
+        )
+
+    async def _failed(self, job, exc):
+        error = f"{type(exc).__name__}: {exc}"
+        if job["attempts"] >= self.max_attempts:
+            logger.error("Job %s (%s) failed %d times, moving to jobs_dead: %s",
+                         job["id"], job["type"], job["attempts"], error)
+            JOBS_PROCESSED.inc((job["type"], "dead"))
+            await self.db.jobs_dead.insert_one({**job, "status": "dead", "last_error": error, "failed_at": _now()})
+            await self.db.jobs.delete_one({"_id": job["_id"]})
+            return
+        delay = min(self.backoff_max, self.backoff_base ** job["attempts"]) * random.uniform(0.5, 1.5)
+        logger.warning("Job %s (%s) attempt %d failed, retrying in %.1fs: %s",
+                       job["id"], job["type"], job["attempts"], delay, error)
+        JOBS_PROCESSED.inc((job["type"], "retried"))
+        await self.db.jobs.update_one(
+            {"_id": job["_id"], "claimed_at": job["claimed_at"]},
+            {"$set": {"status": "pending", "run_at": _now() + timedelta(seconds=delay), "last_error": error},
+             "$unset": {"locked_until": ""}},
+        )
+
+    async def status(self, db):
+        counts = {row["_id"]: row["count"] async for row in db.jobs.aggregate(
+            [{"$group": {"_id": "$status", "count": {"$sum": 1}}}])}
+        oldest = await db.jobs.find_one({"status": "pending", "run_at": {"$lte": _now()}},
+                                        {"run_at": 1}, sort=[("run_at", 1)])
+        lag = max((_now() - _aware(oldest["run_at"])).total_seconds(), 0.0) if oldest else 0.0
+        return {
+            "pending": counts.get("pending", 0),
+            "running": counts.get("running", 0),
+            "done": counts.get("done", 0),
+            "dead": await db.jobs_dead.estimated_document_count(),
+            "oldest_pending_seconds": round(lag, 3),
+        }
@@ -0,0 +1,198 @@
+"""Online maintenance of the contacts collection: schema migration and archival.
+
+Run from backend/ (reads MONGO_URL/DB_NAME like the server):
+
+    python lifecycle.py status
+    python lifecycle.py migrate --to compact --batch-size 1000 --pause 0.05
+    python lifecycle.py archive --older-than-days 365
+    python lifecycle.py normalize
+
+``migrate --to compact`` rewrites string ``id``/``created_at`` documents into
+the compact form (binary UUID, BSON date) in small unordered bulk updates
+while the API keeps serving. Enable ``CONTACTS_COMPACT_SCHEMA`` on the API
+first so new leads are written compact, then migrate: documents are
+converted newest first, which keeps every BSON date newer than every
+remaining string so keyset pages stay in order throughout. ``--to strings``
+reverses it (oldest first) after the flag has been turned off again.
+Each update is conditional on the value it read, so a document changed in
+between is simply left for the next run.
+
+``archive`` moves leads older than the cutoff to ``contacts_archive``
+(stamped with ``archived_at``, which a TTL index purges after
+``CONTACTS_ARCHIVE_TTL_DAYS`` when set), inserting before deleting so an
+interrupted run loses nothing and a rerun finishes it.
+
+``normalize`` rewrites emails and phone numbers stored before ingest
+normalized them (``User@X.com `` -> ``user@x.com``, ``+91 98765-43210`` ->
+``+919876543210``). The newsletter upsert and ``email_unique`` index and the
+contacts ``email``/``phone`` filters all match the normalized form, so run it
+once after deploying: until then a legacy subscriber gets a second document
+on their next signup and legacy leads drop out of filtered lists. When the
+normalized address is already subscribed, that document is kept and the
+legacy duplicate deleted. Safe to rerun.
+"""
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from filters import mixed_date_range
+from ingest import normalize_email, normalize_phone
+from repository import CONTACTS, MongoRepository
+
+logger = logging.getLogger("lifecycle")
+
+
+async def migrate(db, to: str = "compact", batch_size: int = 1000, pause: float = 0.0) -> int:
+    repo = MongoRepository(db, CONTACTS, compact=True)
+    compact = to == "compact"
+    direction = DESCENDING if compact else ASCENDING
+    op = "$lt" if compact else "$gt"
+    query = {"created_at": {"$type": "string" if compact else "date"}}
+    converted = skipped = 0
+    while True:
+        docs = await db.contacts.find(query, {"_id": 1, "id": 1, "created_at": 1}).sort(
+            [("created_at", direction), ("id", direction)]).limit(batch_size).to_list(batch_size)
+        if not docs:
+            break
+        ops = []
+        for doc in docs:
+            try:
+                target = repo.encode(dict(doc)) if compact else repo.decode(dict(doc))
+            except (TypeError, ValueError):
+                skipped += 1
+                continue
+            ops.append(UpdateOne({"_id": doc["_id"], "created_at": doc["created_at"]},
+                                 {"$set": {"id": target["id"], "created_at": target["created_at"]}}))
+        if ops:
+            converted += (await db.contacts.bulk_write(ops, ordered=False)).modified_count
+        # Continue strictly after this batch; comparison operators only match values of the same
+        # BSON type, so this also keeps skipped documents from being read again.
+        last = docs[-1]
+        query = {"$or": [{"created_at": {op: last["created_at"]}},
+                         {"created_at": last["created_at"], "id": {op: last["id"]}}]}
+        logger.info("Converted %d document(s) to %s (%d skipped)", converted, to, skipped)
+        if pause:
+            await asyncio.sleep(pause)
+    return converted
+
+
+async def archive(db, older_than: datetime, batch_size: int = 1000, pause: float = 0.0) -> int:
+    query = mixed_date_range("created_at", None, older_than)
+    moved = 0
+    while True:
+        docs = await db.contacts.find(query).sort([("created_at", ASCENDING), ("id", ASCENDING)]).limit(
+            batch_size).to_list(batch_size)
+        if not docs:
+            break
+        archived_at = datetime.now(timezone.utc)
+        try:
+            await db.contacts_archive.insert_many([{**doc, "archived_at": archived_at} for doc in docs], ordered=False)
+        except BulkWriteError as exc:
+            # Duplicate _id: archived by an earlier run that stopped before deleting.
+            if any(err["code"] != 11000 for err in exc.details["writeErrors"]):
+                raise
+        await db.contacts.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+        moved += len(docs)
+        logger.info("Archived %d contact(s) created before %s", moved, older_than.isoformat())
+        if pause:
+            await asyncio.sleep(pause)
+    return moved
+
+
+# Fields written in normalized form by ingest, and matched that way by upserts and filters.
+NORMALIZED_FIELDS = {
+    "newsletter": {"email": normalize_email},
+    "contacts": {"email": normalize_email, "phone": normalize_phone},
+}
+
+
+async def normalize(db, batch_size: int = 1000, pause: float = 0.0) -> dict:
+    counts = {name: {"normalized": 0, "merged": 0} for name in NORMALIZED_FIELDS}
+    for name, fields in NORMALIZED_FIELDS.items():
+        collection, done = db[name], counts[name]
+        last = None
+        while True:
+            query = {"_id": {"$gt": last}} if last is not None else {}
+            docs = await collection.find(query, {"_id": 1, **{field: 1 for field in fields}}).sort(
+                "_id", ASCENDING).limit(batch_size).to_list(batch_size)
+            if not docs:
+                break
+            for doc in docs:
+                changes = {field: fn(doc[field]) for field, fn in fields.items()
+                           if isinstance(doc.get(field), str) and fn(doc[field]) != doc[field]}
+                if not changes:
+                    continue
+                # Conditional on the values read, like migrate: a document changed in between is left alone.
+                current = {"_id": doc["_id"], **{field: doc[field] for field in changes}}
+                try:
+                    await collection.update_one(current, {"$set": changes})
+                    done["normalized"] += 1
+                except DuplicateKeyError:
+                    # Newsletter only: already subscribed under the normalized address, and that
+                    # document is the one the API returns.
+                    await collection.delete_one(current)
+                    done["merged"] += 1
+            last = docs[-1]["_id"]
+            logger.info("Normalized %d %s document(s), merged %d duplicate(s)", done["normalized"], name, done["merged"])
+            if pause:
+                await asyncio.sleep(pause)
+    return counts
+
+
+async def status(db):
+    return {
+        "contacts_string": await db.contacts.count_documents({"created_at": {"$type": "string"}}),
+        "contacts_compact": await db.contacts.count_documents({"created_at": {"$type": "date"}}),
+        "contacts_archive": await db.contacts_archive.estimated_document_count(),
+    }
+
+
+async def run(args):
+    from database import create_client
+    from indexes import ensure_indexes
+
+    client = create_client(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        if args.command == "migrate":
+            await migrate(db, args.to, args.batch_size, args.pause)
+        elif args.command == "archive":
+            await ensure_indexes(db)
+            cutoff = datetime.now(timezone.utc) - timedelta(days=args.older_than_days)
+            await archive(db, cutoff, args.batch_size, args.pause)
+        elif args.command == "normalize":
+            await normalize(db, args.batch_size, args.pause)
+            await ensure_indexes(db)
+        print(await status(db))
+    finally:
+        client.close()
+
+
+def main(argv=None):
+    load_dotenv(Path(__file__).parent / '.env')
+    parser = argparse.ArgumentParser(description="Contacts schema migration and archival")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="count documents per storage form")
+    migrate_cmd = commands.add_parser("migrate", help="convert documents between string and compact forms")
+    migrate_cmd.add_argument("--to", choices=["compact", "strings"], default="compact")
+    archive_cmd = commands.add_parser("archive", help="move old leads to contacts_archive")
+    archive_cmd.add_argument("--older-than-days", type=float,
+                             default=float(os.environ.get('CONTACTS_ARCHIVE_AFTER_DAYS', '365')))
+    normalize_cmd = commands.add_parser("normalize", help="normalize legacy emails and phones, merge duplicate signups")
+    for cmd in (migrate_cmd, archive_cmd, normalize_cmd):
+        cmd.add_argument("--batch-size", type=int, default=1000)
+        cmd.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between batches")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""Live feed of new contacts, fanned out to Server-Sent Events subscribers.
+
+One ``LiveFeed`` per process reads new leads once and copies each encoded
+event to every subscriber's queue, so open dashboards cost one change stream
+(or one poll) instead of one query each:
+
+* ``changestream`` watches inserts on ``contacts``; the stream's own resume
+  token restarts it without gaps after a transient error or failover.
+* ``poll`` (standalone mongod, or ``auto`` once the server rejects change
+  streams) queries ``created_at`` every ``poll_interval`` seconds, looking
+  back ``poll_lookback`` seconds for inserts that committed late.
+
+Every event id is a pagination cursor for the contact. A client that
+reconnects with ``Last-Event-ID`` is first replayed everything after that
+position from the collection, then switched to the live queue, skipping what
+the replay already sent. Subscribers that fall ``queue_size`` events behind
+are disconnected and catch up the same way.
+"""
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Set, Tuple
+
+import orjson
+from pymongo.errors import OperationFailure
+
+from pagination import encode_cursor
+
+logger = logging.getLogger(__name__)
+
+# Standalone mongod ("only supported on replica sets") and servers without $changeStream.
+CHANGE_STREAMS_UNSUPPORTED = {40573, 40324}
+MAX_SEEN = 10000
+
+
+def event_frame(doc) -> Tuple[str, bytes]:
+    frame = b"id: %s\nevent: contact\ndata: %s\n\n" % (encode_cursor(doc, "created_at").encode(), orjson.dumps(doc))
+    return doc["id"], frame
+
+
+class Subscription:
+    def __init__(self, size: int):
+        self.queue: "asyncio.Queue[Optional[Tuple[str, bytes]]]" = asyncio.Queue(size)
+
+
+class LiveFeed:
+    def __init__(
+        self,
+        mode: str = "auto",
+        poll_interval: float = 1,
+        poll_lookback: float = 5,
+        queue_size: int = 1000,
+        heartbeat: float = 15,
+        replay_batch: int = 500,
+    ):
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.poll_lookback = poll_lookback
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        self.replay_batch = replay_batch
+        self.repo = None
+        self.subscribers: Set[Subscription] = set()
+        self._resume_token = None
+        self._task: Optional[asyncio.Task] = None
+        self._active: Optional[asyncio.Event] = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            mode=os.environ.get('LIVE_FEED_MODE', 'auto'),
+            poll_interval=float(os.environ.get('LIVE_POLL_INTERVAL', '1')),
+            poll_lookback=float(os.environ.get('LIVE_POLL_LOOKBACK', '5')),
+            queue_size=int(os.environ.get('LIVE_QUEUE_SIZE', '1000')),
+            heartbeat=float(os.environ.get('LIVE_HEARTBEAT_SECONDS', '15')),
+        )
+
+    def start(self, repo):
+        """``repo`` is the contacts ``MongoRepository``."""
+        self.repo = repo
+        self._active = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="live-feed")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        # Ending every stream lets the server finish shutting down instead of waiting on open connections.
+        for sub in list(self.subscribers):
+            self._close(sub)
+
+    def subscribe(self) -> Subscription:
+        sub = Subscription(self.queue_size)
+        self.subscribers.add(sub)
+        if self._active is not None:
+            self._active.set()
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        self.subscribers.discard(sub)
+        if not self.subscribers and self._active is not None:
+            self._active.clear()
+
+    def _close(self, sub: Subscription):
+        self.unsubscribe(sub)
+        while True:
+            try:
+                sub.queue.put_nowait(None)
+                return
+            except asyncio.QueueFull:
+                sub.queue.get_nowait()
+
+    def publish(self, doc):
+        event = event_frame(doc)
+        for sub in list(self.subscribers):
+            try:
+                sub.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Too far behind: end the stream; the client reconnects and replays from its Last-Event-ID.
+                self._close(sub)
+
+    async def _run(self):
+        errors = 0
+        while True:
+            # Nothing is read while nobody is listening; reconnecting clients catch up from the collection.
+            await self._active.wait()
+            try:
+                if self.mode == "poll":
+                    await self._poll()
+                else:
+                    await self._watch()
+                errors = 0
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as exc:
+                if self.mode == "auto" and exc.code in CHANGE_STREAMS_UNSUPPORTED:
+                    logger.info("Change streams unavailable (%s); live feed falls back to polling", exc)
+                    self.mode = "poll"
+                    continue
+                errors += 1
+                logger.error("Live feed error: %s", exc)
+            except Exception as exc:
+                errors += 1
+                logger.error("Live feed error: %s", exc)
+            if errors:
+                await asyncio.sleep(min(self.poll_interval * 2 ** errors, 60))
+
+    async def _watch(self):
+        pipeline = [{"$match": {"operationType": "insert"}}]
+        async with self.repo.collection.watch(pipeline, resume_after=self._resume_token) as stream:
+            while self.subscribers:
+                change = await stream.try_next()
+                self._resume_token = stream.resume_token
+                if change is None:
+                    continue
+                doc = change["fullDocument"]
+                doc.pop("_id", None)
+                self.publish(self.repo.decode(doc))
+        # Nobody left: the next subscriber starts from the current position, not from this token.
+        self._resume_token = None
+
+    async def _poll(self):
+        seen: "OrderedDict[str, str]" = OrderedDict()
+        while self.subscribers:
+            floor = datetime.now(timezone.utc) - timedelta(seconds=self.poll_lookback)
+            docs = self.repo.collection.find(self.repo.range_query(floor), {"_id": 0}).sort(
+                [("created_at", 1), ("id", 1)])
+            async for doc in docs:
+                doc = self.repo.decode(doc)
+                if doc["id"] not in seen:
+                    seen[doc["id"]] = doc["created_at"]
+                    self.publish(doc)
+            while seen and (len(seen) > MAX_SEEN or next(iter(seen.values())) < floor.isoformat()):
+                seen.popitem(last=False)
+            await asyncio.sleep(self.poll_interval)
+
+    async def stream(self, after: Optional[Tuple[str, str]] = None):
+        """SSE body: replay from ``after`` (a decoded cursor), then live events."""
+        # Subscribe before replaying so nothing inserted during the replay is lost.
+        sub = self.subscribe()
+        try:
+            yield b"retry: 3000\n\n"
+            replayed = set()
+            while after:
+                query = self.repo.after_query(*after, descending=False)
+                docs = await self.repo.collection.find(query, {"_id": 0}).sort(
+                    [("created_at", 1), ("id", 1)]).limit(self.replay_batch).to_list(self.replay_batch)
+                for doc in docs:
+                    doc_id, frame = event_frame(self.repo.decode(doc))
+                    replayed.add(doc_id)
+                    yield frame
+                after = (docs[-1]["created_at"], docs[-1]["id"]) if len(docs) == self.replay_batch else None
+            while True:
+                try:
+                    event = await asyncio.wait_for(sub.queue.get(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                if event is None:
+                    return
+                doc_id, frame = event
+                if doc_id not in replayed:
+                    yield frame
+        finally:
+            self.unsubscribe(sub)
@@ -0,0 +1,320 @@
+"""Responsive image variants for project and portfolio media.
+
+Build stage (run from backend/ after adding or replacing originals):
+
+    python media.py build --workers 4
+
+Every image under ``MEDIA_SOURCE_DIR`` (``media/originals``) becomes a media
+id from its path without the extension (``projects/villa-1.jpg`` ->
+``projects-villa-1``). Each original is decoded once in a process pool,
+EXIF-rotated and resized down to every ``MEDIA_WIDTHS`` step below its own
+width (plus the original width), and encoded as AVIF (when Pillow has
+AVIF support), WebP and a JPEG/PNG fallback, together with a BlurHash
+placeholder. Output is content-addressed under ``MEDIA_CACHE_DIR``
+(``media/cache``) by a hash of the original's bytes and the encoder
+settings, so unchanged images are skipped on the next build and a replaced
+image never serves stale variants. ``index.json`` maps ids to hashes and is
+swapped in atomically at the end of a build.
+
+Serve stage: ``MediaLibrary`` reads the index (picking up a rebuild without
+a restart) and picks, per request, the smallest variant at least as wide as
+the requested width (``?w=``, else the ``Sec-CH-Width``/``Width`` client
+hint, else viewport width times DPR) in the best format the ``Accept``
+header allows.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from dotenv import load_dotenv
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse, Response
+
+from cache import etag_matches
+from compression import quality_values
+
+logger = logging.getLogger("media")
+
+ROOT_DIR = Path(__file__).parent
+SOURCE_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp", ".avif", ".tif", ".tiff")
+MIME_TYPES = {"avif": "image/avif", "webp": "image/webp", "jpeg": "image/jpeg", "png": "image/png"}
+EXTENSIONS = {"avif": ".avif", "webp": ".webp", "jpeg": ".jpg", "png": ".png"}
+# Modern formats first; the fallback (jpeg, or png for images with alpha) is always acceptable.
+PREFERENCE = ("avif", "webp")
+CLIENT_HINTS = "Sec-CH-Width, Sec-CH-DPR, Sec-CH-Viewport-Width"
+BLURHASH_CHARS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+
+
+def settings_from_env() -> dict:
+    return {
+        "widths": sorted(int(w) for w in os.environ.get('MEDIA_WIDTHS', '320,640,960,1280,1920').split(',')),
+        "quality": {
+            "avif": int(os.environ.get('MEDIA_AVIF_QUALITY', '50')),
+            "webp": int(os.environ.get('MEDIA_WEBP_QUALITY', '75')),
+            "jpeg": int(os.environ.get('MEDIA_JPEG_QUALITY', '80')),
+        },
+        "blurhash": [4, 3],
+    }
+
+
+def media_id(source: Path, root: Path) -> str:
+    return "-".join(source.relative_to(root).with_suffix("").parts)
+
+
+def content_hash(data: bytes, settings: dict) -> str:
+    digest = hashlib.sha256(data)
+    digest.update(json.dumps(settings, sort_keys=True).encode())
+    return digest.hexdigest()[:32]
+
+
+# BlurHash (https://blurha.sh), computed on a small thumbnail.
+def _base83(value: int, length: int) -> str:
+    return "".join(BLURHASH_CHARS[(value // 83 ** (length - i)) % 83] for i in range(1, length + 1))
+
+
+def _to_linear(value: int) -> float:
+    v = value / 255
+    return v / 12.92 if v <= 0.04045 else ((v + 0.055) / 1.055) ** 2.4
+
+
+def _to_srgb(value: float) -> int:
+    v = min(max(value, 0.0), 1.0)
+    return int(v * 12.92 * 255 + 0.5) if v <= 0.0031308 else int((1.055 * v ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def blurhash(image, components_x: int = 4, components_y: int = 3) -> str:
+    """Encode an RGB ``PIL.Image`` (ideally ~32px wide; cost is per pixel)."""
+    width, height = image.size
+    lut = [_to_linear(v) for v in range(256)]
+    data = image.tobytes()
+    linear = [(lut[data[k]], lut[data[k + 1]], lut[data[k + 2]]) for k in range(0, len(data), 3)]
+    cos_x = [[math.cos(math.pi * i * x / width) for x in range(width)] for i in range(components_x)]
+    cos_y = [[math.cos(math.pi * j * y / height) for y in range(height)] for j in range(components_y)]
+    factors = []
+    for j in range(components_y):
+        for i in range(components_x):
+            scale = (1 if i == j == 0 else 2) / (width * height)
+            r = g = b = 0.0
+            for y in range(height):
+                row, cy = y * width, cos_y[j][y]
+                for x in range(width):
+                    basis = cos_x[i][x] * cy
+                    pr, pg, pb = linear[row + x]
+                    r += basis * pr
+                    g += basis * pg
+                    b += basis * pb
+            factors.append((r * scale, g * scale, b * scale))
+    dc, ac = factors[0], factors[1:]
+    encoded = _base83((components_x - 1) + (components_y - 1) * 9, 1)
+    if ac:
+        quantised_max = max(0, min(82, int(max(abs(c) for f in ac for c in f) * 166 - 0.5)))
+        maximum = (quantised_max + 1) / 166
+        encoded += _base83(quantised_max, 1)
+    else:
+        maximum = 1.0
+        encoded += _base83(0, 1)
+    encoded += _base83((_to_srgb(dc[0]) << 16) + (_to_srgb(dc[1]) << 8) + _to_srgb(dc[2]), 4)
+
+    def quantise(value):
+        return max(0, min(18, int(math.copysign(abs(value / maximum) ** 0.5, value) * 9 + 9.5)))
+
+    for r, g, b in ac:
+        encoded += _base83(quantise(r) * 19 * 19 + quantise(g) * 19 + quantise(b), 2)
+    return encoded
+
+
+# Build
+def render(job: dict) -> dict:
+    """Worker: decode one original, write its variants into ``job["target"]`` and return its info."""
+    from PIL import Image, ImageOps, features
+
+    settings, target = job["settings"], Path(job["target"])
+    target.mkdir(parents=True, exist_ok=True)
+    with Image.open(job["source"]) as original:
+        image = ImageOps.exif_transpose(original)
+        image.load()
+    alpha = image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+    image = image.convert("RGBA" if alpha else "RGB")
+    fallback = "png" if alpha else "jpeg"
+    formats = [f for f in PREFERENCE if f != "avif" or features.check("avif")] + [fallback]
+    width, height = image.size
+    widths = [w for w in settings["widths"] if w < width] + [width]
+    variants = []
+    # Widest first, each step resized from the previous one: far cheaper than always starting from the original.
+    current = image
+    for w in reversed(widths):
+        h = max(1, round(height * w / width))
+        if current.size != (w, h):
+            current = current.resize((w, h), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        for fmt in formats:
+            name = f"{w}{EXTENSIONS[fmt]}"
+            options = {"quality": settings["quality"][fmt]} if fmt in settings["quality"] else {"optimize": True}
+            if fmt == "jpeg":
+                options.update(optimize=True, progressive=True)
+            elif fmt == "webp":
+                options["method"] = 4
+            tmp = target / (name + ".tmp")
+            current.save(tmp, format=fmt.upper(), **options)
+            os.replace(tmp, target / name)
+            variants.append({"width": w, "height": h, "format": fmt, "file": name, "bytes": (target / name).stat().st_size})
+    thumb = image.convert("RGB")
+    thumb.thumbnail((32, 32))
+    info = {
+        "width": width,
+        "height": height,
+        "blurhash": blurhash(thumb, *settings["blurhash"]),
+        "variants": sorted(variants, key=lambda v: (v["width"], v["format"])),
+    }
+    # Written last: its presence marks the directory complete.
+    (target / "info.json.tmp").write_text(json.dumps(info))
+    os.replace(target / "info.json.tmp", target / "info.json")
+    return info
+
+
+def build(source_dir: Path, cache_dir: Path, workers: Optional[int] = None, settings: Optional[dict] = None) -> Dict[str, str]:
+    settings = settings or settings_from_env()
+    index, jobs = {}, []
+    for source in sorted(source_dir.rglob("*")):
+        if not source.is_file() or source.suffix.lower() not in SOURCE_SUFFIXES:
+            continue
+        digest = content_hash(source.read_bytes(), settings)
+        index[media_id(source, source_dir)] = digest
+        target = cache_dir / digest[:2] / digest
+        if not (target / "info.json").exists():
+            jobs.append({"source": str(source), "target": str(target), "settings": settings})
+    logger.info("%d image(s), %d to render", len(index), len(jobs))
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for job, info in zip(jobs, pool.map(render, jobs)):
+                logger.info("Rendered %s: %d variant(s), %s", job["source"], len(info["variants"]), info["blurhash"])
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    (cache_dir / "index.json.tmp").write_text(json.dumps(index, sort_keys=True))
+    os.replace(cache_dir / "index.json.tmp", cache_dir / "index.json")
+    return index
+
+
+# Serve
+def _hint(headers: Headers, *names: str) -> Optional[float]:
+    for name in names:
+        try:
+            return float(headers[name])
+        except (KeyError, ValueError):
+            continue
+    return None
+
+
+def target_width(headers: Headers, width: Optional[int]) -> Optional[float]:
+    if width:
+        return width
+    hinted = _hint(headers, "sec-ch-width", "width")
+    if hinted:
+        return hinted
+    viewport = _hint(headers, "sec-ch-viewport-width", "viewport-width")
+    if viewport:
+        return viewport * (_hint(headers, "sec-ch-dpr", "dpr") or 1.0)
+    return None
+
+
+def pick_variant(variants: Sequence[dict], accept: str, width: Optional[float]) -> dict:
+    """Smallest variant at least ``width`` wide in the best format ``accept`` names.
+
+    A modern format has to be listed by its own type: ``image/*`` and ``*/*``
+    come from browsers that may not decode it, so they get the fallback. Among
+    listed formats the highest q-value wins, ties going to ``PREFERENCE``.
+    """
+    accepted = quality_values(accept)
+    formats = {v["format"] for v in variants}
+    listed = [f for f in PREFERENCE if f in formats and accepted.get(MIME_TYPES[f], 0) > 0]
+    fmt = max(listed, key=lambda f: accepted[MIME_TYPES[f]], default="png" if "png" in formats else "jpeg")
+    candidates = [v for v in variants if v["format"] == fmt]
+    if width:
+        for variant in candidates:
+            if variant["width"] >= width:
+                return variant
+    return candidates[-1]
+
+
+class MediaLibrary:
+    def __init__(self, cache_dir: Path, max_age: int = 86400):
+        self.cache_dir = Path(cache_dir)
+        self.max_age = max_age
+        self._index: Dict[str, str] = {}
+        self._index_mtime = None
+        self._info: Dict[str, dict] = {}
+
+    @classmethod
+    def from_env(cls):
+        return cls(Path(os.environ.get('MEDIA_CACHE_DIR', str(ROOT_DIR / 'media' / 'cache'))),
+                   max_age=int(os.environ.get('MEDIA_MAX_AGE', '86400')))
+
+    def lookup(self, media_id: str):
+        """``(hash, info)`` for a media id; 404 when it has not been built."""
+        try:
+            mtime = (self.cache_dir / "index.json").stat().st_mtime_ns
+        except OSError:
+            raise HTTPException(status_code=404, detail="Media not found")
+        if mtime != self._index_mtime:
+            self._index = json.loads((self.cache_dir / "index.json").read_text())
+            self._index_mtime = mtime
+        digest = self._index.get(media_id)
+        if digest is None:
+            raise HTTPException(status_code=404, detail="Media not found")
+        info = self._info.get(digest)
+        if info is None:
+            # Content-addressed, so an entry never changes once built.
+            info = self._info[digest] = json.loads((self.cache_dir / digest[:2] / digest / "info.json").read_text())
+        return digest, info
+
+    def meta(self, media_id: str, url: str) -> dict:
+        """Intrinsic size, placeholder and per-format ``srcset`` strings for ``<picture>``."""
+        _, info = self.lookup(media_id)
+        srcset: Dict[str, List[str]] = {}
+        for variant in info["variants"]:
+            srcset.setdefault(MIME_TYPES[variant["format"]], []).append(f"{url}?w={variant['width']} {variant['width']}w")
+        return {
+            "id": media_id,
+            "width": info["width"],
+            "height": info["height"],
+            "blurhash": info["blurhash"],
+            "srcset": {mime: ", ".join(entries) for mime, entries in srcset.items()},
+        }
+
+    def response(self, media_id: str, headers: Headers, width: Optional[int] = None) -> Response:
+        digest, info = self.lookup(media_id)
+        variant = pick_variant(info["variants"], headers.get("accept", ""), target_width(headers, width))
+        response_headers = {
+            "Cache-Control": f"public, max-age={self.max_age}",
+            "ETag": f'"{digest[:16]}-{variant["file"]}"',
+            "Vary": "Accept" if width else f"Accept, {CLIENT_HINTS}, Width",
+            "Accept-CH": CLIENT_HINTS,
+        }
+        if etag_matches(response_headers["ETag"], headers.get("if-none-match", "")):
+            return Response(status_code=304, headers=response_headers)
+        return FileResponse(self.cache_dir / digest[:2] / digest / variant["file"],
+                            media_type=MIME_TYPES[variant["format"]], headers=response_headers)
+
+
+def main(argv=None):
+    load_dotenv(ROOT_DIR / '.env')
+    parser = argparse.ArgumentParser(description="Build responsive image variants")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_cmd = commands.add_parser("build", help="render variants for every original not built yet")
+    build_cmd.add_argument("--source", type=Path,
+                           default=Path(os.environ.get('MEDIA_SOURCE_DIR', str(ROOT_DIR / 'media' / 'originals'))))
+    build_cmd.add_argument("--cache", type=Path,
+                           default=Path(os.environ.get('MEDIA_CACHE_DIR', str(ROOT_DIR / 'media' / 'cache'))))
+    build_cmd.add_argument("--workers", type=int, default=int(os.environ.get('MEDIA_WORKERS', os.cpu_count() or 1)))
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    build(args.source, args.cache, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+"""Request and Mongo command instrumentation with Prometheus text exposition.
+
+``MetricsMiddleware`` times every request by route template and tracks the
+number in flight. ``CommandMonitor`` is a pymongo command listener timing
+every command by collection and command name. Motor runs pymongo calls with
+a copy of the caller's context, so the listener can also charge each
+command's duration to the request that issued it; with
+``METRICS_SERVER_TIMING`` set, that split is returned as a ``Server-Timing``
+header (``db`` vs. ``app``) on every response.
+
+The registry is per process. With several workers (``serve.py --workers N``)
+any worker may answer a scrape, so each one also writes a snapshot to
+``METRICS_MULTIPROC_DIR`` every ``METRICS_SNAPSHOT_SECONDS`` (and on
+shutdown), and ``/metrics`` merges them: counters and histograms are summed
+across workers, gauges are reported per worker with a ``pid`` label. Series
+from other workers lag by up to one snapshot interval. ``serve.py`` sets the
+directory up when it starts more than one worker; a worker that crashed
+keeps its last gauges there until the next start.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+from starlette.responses import Response
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str], buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Tuple[str, ...], value: float):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # one counter per bucket, then +Inf count, then sum
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def samples(self) -> Dict[Tuple[str, ...], list]:
+        with self._lock:
+            return {labels: list(series) for labels, series in self._series.items()}
+
+    @staticmethod
+    def add(a: Optional[list], b: list) -> list:
+        return list(b) if a is None else [x + y for x, y in zip(a, b)]
+
+    def render(self, samples=None):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, series in (self.samples() if samples is None else samples).items():
+            for bound, count in zip(self.buckets, series):
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {count}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {series[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {series[-2]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), kind: str = "counter"):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Tuple[str, ...] = (), amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, labels: Tuple[str, ...] = (), amount: float = 1):
+        self.inc(labels, -amount)
+
+    def samples(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def add(a: Optional[float], b: float) -> float:
+        return b if a is None else a + b
+
+    def render(self, samples=None, labelnames: Optional[Sequence[str]] = None):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        labelnames = self.labelnames if labelnames is None else labelnames
+        lines.extend(f"{self.name}{_labels(labelnames, labels)} {value}"
+                     for labels, value in (self.samples() if samples is None else samples).items())
+        return lines
+
+
+def Gauge(name: str, help: str, labelnames: Sequence[str] = ()):
+    return Counter(name, help, labelnames, kind="gauge")
+
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template.", ("method", "route", "status"))
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being served.")
+MONGO_LATENCY = Histogram(
+    "mongodb_command_duration_seconds", "MongoDB command latency by collection and command.", ("collection", "command"))
+MONGO_FAILURES = Counter(
+    "mongodb_command_failures_total", "MongoDB commands that returned an error.", ("collection", "command"))
+
+REGISTRY = [REQUEST_LATENCY, REQUESTS_IN_FLIGHT, MONGO_LATENCY, MONGO_FAILURES]
+
+
+class _RequestTiming:
+    __slots__ = ("db_seconds",)
+
+    def __init__(self):
+        self.db_seconds = 0.0
+
+
+_request_timing: ContextVar[Optional[_RequestTiming]] = ContextVar("request_timing", default=None)
+
+
+class CommandMonitor(monitoring.CommandListener):
+    def __init__(self):
+        self._collections: Dict[Tuple[int, object], str] = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        # The collection name is the value of the command's first key, e.g. {"find": "contacts", ...}.
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = ""
+        with self._lock:
+            self._collections[(event.request_id, event.connection_id)] = collection
+
+    def _finish(self, event):
+        with self._lock:
+            collection = self._collections.pop((event.request_id, event.connection_id), "")
+        seconds = event.duration_micros / 1e6
+        timing = _request_timing.get()
+        if timing is not None:
+            timing.db_seconds += seconds
+        return (collection, event.command_name), seconds
+
+    def succeeded(self, event):
+        labels, seconds = self._finish(event)
+        MONGO_LATENCY.observe(labels, seconds)
+
+    def failed(self, event):
+        labels, seconds = self._finish(event)
+        MONGO_LATENCY.observe(labels, seconds)
+        MONGO_FAILURES.inc(labels)
+
+
+command_monitor = CommandMonitor()
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streamed responses are timed to their last byte."""
+
+    def __init__(self, app, server_timing: Optional[bool] = None):
+        self.app = app
+        if server_timing is None:
+            server_timing = os.environ.get('METRICS_SERVER_TIMING', '').lower() in ('1', 'true', 'yes')
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timing = _RequestTiming()
+        token = _request_timing.set(timing)
+        start = time.perf_counter()
+        status = "500"
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+                if self.server_timing:
+                    total = time.perf_counter() - start
+                    value = "db;dur=%.3f, app;dur=%.3f" % (1000 * timing.db_seconds, 1000 * max(total - timing.db_seconds, 0.0))
+                    message["headers"] = list(message.get("headers", [])) + [(b"server-timing", value.encode())]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            _request_timing.reset(token)
+            # Label by route template, not raw path, to keep series cardinality bounded.
+            route = scope.get("route")
+            REQUEST_LATENCY.observe(
+                (scope["method"], getattr(route, "path", "unmatched"), status), time.perf_counter() - start)
+
+
+class MultiprocessMetrics:
+    """Per-worker registry snapshots in a shared directory, merged at scrape time."""
+
+    def __init__(self, directory: str, interval: float = 1.0,
+                 gauges: Optional[Callable[[], Dict[str, float]]] = None):
+        self.directory = Path(directory)
+        self.interval = interval
+        # Point-in-time gauges (pool, subscribers) sampled with each snapshot.
+        self.gauges = gauges
+        self.pid = os.getpid()
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls, gauges=None):
+        directory = os.environ.get('METRICS_MULTIPROC_DIR')
+        if not directory:
+            return None
+        return cls(directory, float(os.environ.get('METRICS_SNAPSHOT_SECONDS', '1')), gauges)
+
+    def write(self, exited: bool = False):
+        snapshot = {
+            "pid": self.pid,
+            "exited": exited,
+            "metrics": {metric.name: [[list(labels), value] for labels, value in metric.samples().items()]
+                        for metric in REGISTRY},
+            "gauges": {} if exited or self.gauges is None else self.gauges(),
+        }
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{self.pid}.json"
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(snapshot))
+        os.replace(tmp, path)
+
+    def snapshots(self) -> List[dict]:
+        found = []
+        for path in sorted(self.directory.glob("*.json")):
+            try:
+                found.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                continue  # replaced or removed while reading
+        return found
+
+    def collect(self) -> List[str]:
+        self.write()
+        snapshots = self.snapshots()
+        live = [snap for snap in snapshots if not snap["exited"]]
+        lines = []
+        for metric in REGISTRY:
+            if metric.kind == "gauge":
+                # Summing a worker's gauge after it exited would be wrong; report each live worker.
+                samples = {tuple(labels) + (str(snap["pid"]),): value
+                           for snap in live for labels, value in snap["metrics"].get(metric.name, [])}
+                lines.extend(metric.render(samples, metric.labelnames + ("pid",)))
+                continue
+            merged = {}
+            for snap in snapshots:
+                for labels, value in snap["metrics"].get(metric.name, []):
+                    merged[tuple(labels)] = metric.add(merged.get(tuple(labels)), value)
+            lines.extend(metric.render(merged))
+        names = {name for snap in live for name in snap["gauges"]}
+        for name in sorted(names):
+            lines.append(f"# TYPE {name} gauge")
+            lines.extend(f'{name}{{pid="{snap["pid"]}"}} {snap["gauges"][name]}'
+                         for snap in live if name in snap["gauges"])
+        return lines
+
+    def start(self):
+        self._task = asyncio.create_task(self._run(), name="metrics-snapshot")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.write(exited=True)
+
+    async def _run(self):
+        while True:
+            try:
+                self.write()
+            except Exception as exc:
+                logger.error("Could not write metrics snapshot to %s: %s", self.directory, exc)
+            await asyncio.sleep(self.interval)
+
+
+def render_metrics(gauges: Optional[Dict[str, float]] = None,
+                   multiprocess: Optional[MultiprocessMetrics] = None) -> Response:
+    """Render the registry plus point-in-time ``gauges`` sampled at scrape time, or every
+    worker's with ``multiprocess``."""
+    if multiprocess is not None:
+        lines = multiprocess.collect()
+    else:
+        lines = []
+        for metric in REGISTRY:
+            lines.extend(metric.render())
+        for name, value in (gauges or {}).items():
+            lines.extend([f"# TYPE {name} gauge", f"{name} {value}"])
+    return Response("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
@@ -0,0 +1,67 @@
+"""Keyset (cursor) pagination helpers for the list endpoints.
+
+A cursor is the opaque, url-safe encoding of the sort key of the last
+document on a page. The next page is fetched with a range query on that key
+instead of ``skip``, so every page is served straight from the compound
+index no matter how deep the client pages.
+"""
+import base64
+import json
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from starlette.datastructures import URL
+
+
+def encode_cursor(doc: Dict[str, Any], sort_field: str) -> str:
+    raw = json.dumps([doc[sort_field], doc["id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> Tuple[str, str]:
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        pair = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # The cursor is client input that lands in queries: anything but two strings (a number,
+    # or an object Mongo would read as an operator) is rejected here.
+    if not (isinstance(pair, list) and len(pair) == 2 and all(isinstance(part, str) for part in pair)):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return pair[0], pair[1]
+
+
+def keyset_query(sort_field: str, cursor: Optional[str], base: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Filter selecting documents strictly after ``cursor`` in (sort_field, id) descending order."""
+    query = dict(base or {})
+    if not cursor:
+        return query
+    value, last_id = decode_cursor(cursor)
+    after = [
+        {sort_field: {"$lt": value}},
+        {sort_field: value, "id": {"$lt": last_id}},
+    ]
+    if "$or" in query or sort_field in query:
+        return {"$and": [query, {"$or": after}]}
+    # Merge at the top level so operators such as $text stay where the planner requires them.
+    query["$or"] = after
+    return query
+
+
+def keyset_sort(sort_field: str):
+    return [(sort_field, -1), ("id", -1)]
+
+
+def page_headers(docs, limit: int, sort_field: str, url: URL) -> Dict[str, str]:
+    """X-Next-Cursor/Link headers for a page; none when the page is the last one.
+
+    The Link target is the request's own path and query (every filter kept) with the
+    next cursor, relative so a cached page stays valid whatever host served it."""
+    if len(docs) < limit:
+        return {}
+    next_cursor = encode_cursor(docs[-1], sort_field)
+    next_url = url.include_query_params(limit=limit, cursor=next_cursor)
+    return {
+        "X-Next-Cursor": next_cursor,
+        "Link": f'<{next_url.path}?{next_url.query}>; rel="next"',
+    }
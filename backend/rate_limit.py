@@ -0,0 +1,154 @@
+"""Token-bucket rate limiting and duplicate suppression for the public form endpoints.
+
+``FormGuard.check`` runs as a route dependency, before FastAPI validates the
+body into the Pydantic model, and works on the raw request: the client IP and
+the ``email`` field pulled out of the JSON body with orjson. Rejected requests
+never reach Pydantic or Mongo. The client IP is the connection peer, which
+uvicorn already resolves through ``--forwarded-allow-ips``; set
+``RATE_LIMIT_TRUSTED_PROXIES`` to the number of proxy hops in front of the
+app to read it from ``X-Forwarded-For`` instead (counting from the right, as
+entries further left are whatever the client sent).
+
+``FormGuard.deduplicated`` wraps the write itself: a repeat of a stored
+submission gets 409, and a write that fails un-records it so the
+resubmission goes through.
+
+State lives behind ``LimiterBackend``. ``MemoryBackend`` keeps it per
+process; a backend over a Redis-compatible store (a Lua token bucket and
+``SET NX EX``) shares it across uvicorn workers.
+"""
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional, Tuple
+
+import orjson
+from fastapi import HTTPException, Request
+
+
+class LimiterBackend:
+    async def take(self, key: str, rate: float, burst: int) -> Tuple[bool, float]:
+        """Take one token from ``key``'s bucket refilled at ``rate`` tokens/second.
+
+        Returns ``(allowed, retry_after_seconds)``.
+        """
+        raise NotImplementedError
+
+    async def seen(self, key: str, ttl: float) -> bool:
+        """Record ``key`` for ``ttl`` seconds; True if it was already recorded."""
+        raise NotImplementedError
+
+    async def forget(self, key: str) -> None:
+        """Drop a ``seen`` record."""
+        raise NotImplementedError
+
+
+class MemoryBackend(LimiterBackend):
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+
+    def _bound(self, entries):
+        while len(entries) > self.max_keys:
+            entries.popitem(last=False)
+
+    async def take(self, key, rate, burst):
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets[key] = (tokens, now)
+        self._bound(self._buckets)
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+    async def seen(self, key, ttl):
+        now = time.monotonic()
+        expires = self._seen.pop(key, None)
+        self._seen[key] = now + ttl
+        self._bound(self._seen)
+        return expires is not None and expires > now
+
+    async def forget(self, key):
+        self._seen.pop(key, None)
+
+
+def _per_minute(var: str, default: str) -> float:
+    return float(os.environ.get(var, default)) / 60
+
+
+class FormGuard:
+    def __init__(self, backend: LimiterBackend):
+        self.backend = backend
+        self.enabled = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+        self.trusted_proxies = int(os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', '0'))
+        self.ip_rate = _per_minute('RATE_LIMIT_IP_PER_MINUTE', '60')
+        self.ip_burst = int(os.environ.get('RATE_LIMIT_IP_BURST', '30'))
+        self.email_rate = _per_minute('RATE_LIMIT_EMAIL_PER_MINUTE', '10')
+        self.email_burst = int(os.environ.get('RATE_LIMIT_EMAIL_BURST', '5'))
+        self.dedup_window = float(os.environ.get('DEDUP_WINDOW_SECONDS', '60'))
+
+    def client_ip(self, request: Request) -> str:
+        if self.trusted_proxies:
+            # Each trusted proxy appends the address it received from; the one appended by the
+            # outermost is the client. Anything to its left was written by the client itself.
+            hops = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+            if len(hops) >= self.trusted_proxies:
+                return hops[-self.trusted_proxies]
+        return request.client.host if request.client else "unknown"
+
+    async def _limit(self, key: str, rate: float, burst: int):
+        allowed, retry_after = await self.backend.take(key, rate, burst)
+        if not allowed:
+            raise HTTPException(status_code=429, detail="Too many requests",
+                                headers={"Retry-After": str(max(1, round(retry_after)))})
+
+    async def check(self, request: Request, endpoint: str):
+        """Raise 429 past the IP/email limits."""
+        await self.check_ip(request, endpoint)
+        await self.check_email(request, endpoint)
+
+    async def check_ip(self, request: Request, endpoint: str):
+        if self.enabled:
+            await self._limit(f"rl:{endpoint}:ip:{self.client_ip(request)}", self.ip_rate, self.ip_burst)
+
+    async def check_email(self, request: Request, endpoint: str):
+        if not self.enabled:
+            return
+        try:
+            body = orjson.loads(await request.body())
+        except orjson.JSONDecodeError:
+            return
+        if not isinstance(body, dict):
+            return
+        email = body.get("email")
+        if isinstance(email, str) and email.strip():
+            await self._limit(f"rl:{endpoint}:email:{email.strip().lower()}", self.email_rate, self.email_burst)
+
+    @asynccontextmanager
+    async def deduplicated(self, endpoint: str, fields: dict):
+        """Raise 409 if the same validated submission was stored within the window. It only
+        counts as stored once the block completes; an exception inside un-records it."""
+        digest = content_hash(fields) if self.enabled and self.dedup_window > 0 else None
+        if digest is None:
+            yield
+            return
+        key = f"dedup:{endpoint}:{digest}"
+        if await self.backend.seen(key, self.dedup_window):
+            raise HTTPException(status_code=409, detail="Duplicate submission")
+        try:
+            yield
+        except BaseException:
+            await self.backend.forget(key)
+            raise
+
+def content_hash(body: dict) -> Optional[str]:
+    """Hash of the normalized string fields, or None if the body has nothing worth deduplicating."""
+    fields = {k: v.strip().lower() for k, v in body.items() if isinstance(v, str)}
+    if not fields:
+        return None
+    return hashlib.blake2b(orjson.dumps(fields, option=orjson.OPT_SORT_KEYS), digest_size=16).hexdigest()
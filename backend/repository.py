@@ -0,0 +1,493 @@
+"""Storage backends for contacts and newsletter subscriptions.
+
+The route handlers only talk to a ``Repository`` per collection, chosen with
+``STORAGE_BACKEND``:
+
+* ``mongo`` (default) - Motor against ``MONGO_URL``/``DB_NAME``;
+  ``CONTACTS_COMPACT_SCHEMA`` stores new contacts in the compact form.
+* ``sqlite`` - one file at ``SQLITE_PATH`` in WAL mode, queried from a small
+  thread pool (``SQLITE_THREADS``) so the event loop never blocks on disk.
+* ``memory`` - per-process dicts and a sorted key list; nothing persists.
+
+The embedded backends let small deployments, CI and load tests run without a
+database server. They implement the same keyset order (sort field, then id,
+newest first) and cursors as Mongo; free-text search requires every query
+word as a case-insensitive substring of some text field, where Mongo's
+``$text`` (unstemmed, ``default_language="none"``) requires every word as a
+quoted phrase. Analytics, background jobs and the live feed need Mongo.
+"""
+import asyncio
+import bisect
+import os
+import sqlite3
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from bson.binary import Binary
+from fastapi import HTTPException
+from pymongo import InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from export import CONTACT_COLUMNS, NEWSLETTER_COLUMNS
+from filters import ListFilter, date_range, iso, mixed_date_range, mongo_query
+from pagination import decode_cursor, encode_cursor, keyset_query, keyset_sort
+
+Doc = Dict[str, Any]
+
+
+@dataclass(frozen=True)
+class Schema:
+    name: str
+    sort_field: str
+    columns: Sequence[str]
+    unique: Optional[str] = None
+    text_fields: Sequence[str] = ()
+    indexed: Sequence[str] = ()
+
+
+CONTACTS = Schema("contacts", "created_at", CONTACT_COLUMNS,
+                  text_fields=("name", "email", "phone", "message"), indexed=("service", "email", "phone"))
+NEWSLETTER = Schema("newsletter", "subscribed_at", NEWSLETTER_COLUMNS, unique="email")
+
+
+class WriteFailed(Exception):
+    """Some documents of an unordered batch were not written; ``errors`` holds ``(index, message)``."""
+
+    def __init__(self, inserted: int, errors: List[Tuple[int, str]]):
+        super().__init__(f"{len(errors)} write(s) failed")
+        self.inserted = inserted
+        self.errors = errors
+
+
+class Repository:
+    def __init__(self, schema: Schema):
+        self.schema = schema
+
+    async def insert(self, doc: Doc) -> None:
+        raise NotImplementedError
+
+    async def insert_many(self, docs: List[Doc]) -> int:
+        """Unordered insert; returns the count written or raises ``WriteFailed``."""
+        raise NotImplementedError
+
+    async def upsert(self, doc: Doc) -> Tuple[Doc, bool]:
+        """Insert unless a document with the same unique key exists; returns ``(stored, inserted)``."""
+        raise NotImplementedError
+
+    async def upsert_many(self, docs: List[Doc]) -> List[bool]:
+        """``upsert`` for documents with distinct keys; returns an inserted flag per document."""
+        raise NotImplementedError
+
+    async def get_many(self, keys: List[str]) -> List[Doc]:
+        """Documents whose unique key is in ``keys``."""
+        raise NotImplementedError
+
+    async def list(self, filters: ListFilter, cursor: Optional[str] = None, limit: int = 100) -> List[Doc]:
+        """One page, newest first, strictly after ``cursor``."""
+        raise NotImplementedError
+
+    async def count(self, filters: ListFilter) -> int:
+        raise NotImplementedError
+
+    async def stream(self, filters: ListFilter, cursor: Optional[str] = None,
+                     batch_size: int = 500) -> AsyncIterator[Doc]:
+        """Every matching document in list order, fetched ``batch_size`` at a time."""
+        while True:
+            page = await self.list(filters, cursor, batch_size)
+            for doc in page:
+                yield doc
+            if len(page) < batch_size:
+                return
+            cursor = encode_cursor(page[-1], self.schema.sort_field)
+
+    async def ping(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+def _as_binary(value: str):
+    try:
+        return Binary.from_uuid(uuid.UUID(value))
+    except ValueError:
+        return value
+
+
+class MongoRepository(Repository):
+    """With ``compact=True`` documents are written with ``id`` as a binary UUID and the
+    sort field as a BSON date; queries match both forms so string documents stay visible
+    until ``lifecycle migrate`` has converted them. Reads always return the string form."""
+
+    def __init__(self, db, schema: Schema, compact: bool = False):
+        super().__init__(schema)
+        self.db = db
+        self.collection = db[schema.name]
+        self.compact = compact
+
+    def encode(self, doc: Doc) -> Doc:
+        if not self.compact:
+            return doc
+        field = self.schema.sort_field
+        when = datetime.fromisoformat(doc[field]).astimezone(timezone.utc)
+        when = when.replace(microsecond=when.microsecond // 1000 * 1000)
+        # BSON dates keep milliseconds: truncate the caller's copy too, so a create
+        # response matches what later reads of the same document return.
+        doc[field] = when.isoformat()
+        return {**doc, "id": _as_binary(doc["id"]), field: when}
+
+    def decode(self, doc: Doc) -> Doc:
+        field = self.schema.sort_field
+        value = doc.get(field)
+        if isinstance(value, datetime):
+            doc[field] = (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).isoformat()
+        ident = doc.get("id")
+        if isinstance(ident, Binary):
+            doc["id"] = str(ident.as_uuid())
+        elif isinstance(ident, uuid.UUID):
+            doc["id"] = str(ident)
+        return doc
+
+    def range_query(self, since: Optional[datetime] = None, until: Optional[datetime] = None) -> Dict[str, Any]:
+        field = self.schema.sort_field
+        return (mixed_date_range if self.compact else date_range)(field, since, until)
+
+    def after_query(self, value: str, last_id: str, descending: bool = True) -> Dict[str, Any]:
+        """Documents strictly after ``(value, last_id)`` in sort order.
+
+        Mongo sorts dates above strings, so while a migration is running the compact
+        branches are only chronologically right because it converts newest first."""
+        field, op = self.schema.sort_field, "$lt" if descending else "$gt"
+        branches = [{field: {op: value}}, {field: value, "id": {op: last_id}}]
+        if self.compact:
+            try:
+                when = datetime.fromisoformat(value).astimezone(timezone.utc)
+            except (TypeError, ValueError):
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            branches += [{field: {op: when}}, {field: when, "id": {op: _as_binary(last_id)}}]
+        return {"$or": branches}
+
+    def _query(self, filters, cursor):
+        field = self.schema.sort_field
+        if not self.compact:
+            return keyset_query(field, cursor, mongo_query(filters, field))
+        query = mongo_query(ListFilter(equals=filters.equals, text=filters.text), field)
+        clauses = [self.range_query(filters.since, filters.until)]
+        if cursor:
+            clauses.append(self.after_query(*decode_cursor(cursor)))
+        clauses = [clause for clause in clauses if clause]
+        if clauses:
+            query["$and"] = clauses
+        return query
+
+    async def insert(self, doc):
+        await self.collection.insert_one(self.encode(doc))
+        doc.pop("_id", None)
+
+    async def insert_many(self, docs):
+        try:
+            result = await self.collection.bulk_write([InsertOne(self.encode(doc)) for doc in docs], ordered=False)
+            return result.inserted_count
+        except BulkWriteError as exc:
+            raise WriteFailed(exc.details["nInserted"], [
+                (err["index"], err.get("errmsg", "Write failed")) for err in exc.details["writeErrors"]])
+        finally:
+            for doc in docs:
+                doc.pop("_id", None)
+
+    async def upsert(self, doc):
+        key = self.schema.unique
+        try:
+            stored = await self.collection.find_one_and_update(
+                {key: doc[key]},
+                {"$setOnInsert": self.encode(doc)},
+                projection={"_id": 0},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # Lost an upsert race on the unique index; the winner's document is there now.
+            stored = await self.collection.find_one({key: doc[key]}, {"_id": 0})
+        stored = self.decode(stored)
+        return stored, stored["id"] == doc["id"]
+
+    async def upsert_many(self, docs):
+        key = self.schema.unique
+        ops = [UpdateOne({key: doc[key]}, {"$setOnInsert": self.encode(doc)}, upsert=True) for doc in docs]
+        try:
+            result = await self.collection.bulk_write(ops, ordered=False)
+            upserted = set(result.upserted_ids)
+        except BulkWriteError as exc:
+            upserted = {up["index"] for up in exc.details.get("upserted", [])}
+            # A duplicate key means a concurrent write won the upsert: the document exists.
+            errors = [(err["index"], err.get("errmsg", "Write failed"))
+                      for err in exc.details["writeErrors"] if err["code"] != 11000]
+            if errors:
+                raise WriteFailed(len(upserted), errors)
+        return [i in upserted for i in range(len(docs))]
+
+    async def get_many(self, keys):
+        docs = await self.collection.find({self.schema.unique: {"$in": keys}}, {"_id": 0}).to_list(None)
+        return [self.decode(doc) for doc in docs]
+
+    def _find(self, filters, cursor):
+        query = self._query(filters, cursor)
+        return self.collection.find(query, {"_id": 0}).sort(keyset_sort(self.schema.sort_field))
+
+    async def list(self, filters, cursor=None, limit=100):
+        return [self.decode(doc) for doc in await self._find(filters, cursor).limit(limit).to_list(limit)]
+
+    async def count(self, filters):
+        return await self.collection.count_documents(self._query(filters, None))
+
+    async def stream(self, filters, cursor=None, batch_size=500):
+        async for doc in self._find(filters, cursor).batch_size(batch_size):
+            yield self.decode(doc)
+
+    async def ping(self):
+        await self.db.command("ping")
+
+
+def _words(text: str) -> List[str]:
+    # The same terms filters.text_search quotes for Mongo.
+    return text.lower().replace('"', "").split()
+
+
+class MemoryRepository(Repository):
+    def __init__(self, schema: Schema):
+        super().__init__(schema)
+        self.docs: Dict[str, Doc] = {}
+        self.keys: Dict[str, str] = {}
+        # (sort value, id) ascending; pages are read from the end.
+        self.order: List[Tuple[str, str]] = []
+
+    def _add(self, doc):
+        if doc["id"] in self.docs:
+            raise ValueError(f"Duplicate id {doc['id']}")
+        if self.schema.unique and doc[self.schema.unique] in self.keys:
+            raise ValueError(f"Duplicate {self.schema.unique} {doc[self.schema.unique]}")
+        doc = dict(doc)
+        self.docs[doc["id"]] = doc
+        if self.schema.unique:
+            self.keys[doc[self.schema.unique]] = doc["id"]
+        bisect.insort(self.order, (doc[self.schema.sort_field], doc["id"]))
+        return doc
+
+    async def insert(self, doc):
+        self._add(doc)
+
+    async def insert_many(self, docs):
+        errors = []
+        for i, doc in enumerate(docs):
+            try:
+                self._add(doc)
+            except ValueError as exc:
+                errors.append((i, str(exc)))
+        if errors:
+            raise WriteFailed(len(docs) - len(errors), errors)
+        return len(docs)
+
+    async def upsert(self, doc):
+        existing = self.keys.get(doc[self.schema.unique])
+        if existing is not None:
+            return dict(self.docs[existing]), False
+        return dict(self._add(doc)), True
+
+    async def upsert_many(self, docs):
+        return [(await self.upsert(doc))[1] for doc in docs]
+
+    async def get_many(self, keys):
+        return [dict(self.docs[self.keys[key]]) for key in keys if key in self.keys]
+
+    def _matches(self, doc, filters, since, until, words):
+        value = doc[self.schema.sort_field]
+        if (since and value < since) or (until and value >= until):
+            return False
+        if any(doc.get(k) != v for k, v in filters.equals.items()):
+            return False
+        if words:
+            text = " ".join(str(doc.get(f) or "") for f in self.schema.text_fields).lower()
+            return all(word in text for word in words)
+        return True
+
+    async def list(self, filters, cursor=None, limit=100):
+        end = bisect.bisect_left(self.order, decode_cursor(cursor)) if cursor else len(self.order)
+        since = iso(filters.since) if filters.since else None
+        until = iso(filters.until) if filters.until else None
+        words = _words(filters.text) if filters.text else []
+        page = []
+        for i in range(end - 1, -1, -1):
+            doc = self.docs[self.order[i][1]]
+            if since and doc[self.schema.sort_field] < since:
+                break
+            if self._matches(doc, filters, since, until, words):
+                page.append(dict(doc))
+                if len(page) >= limit:
+                    break
+        return page
+
+    async def count(self, filters):
+        return len(await self.list(filters, None, len(self.order) or 1))
+
+
+class SQLiteRepository(Repository):
+    def __init__(self, path: str, schema: Schema, executor: ThreadPoolExecutor):
+        super().__init__(schema)
+        self.path = path
+        self.executor = executor
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._columns = ", ".join(schema.columns)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    def create_schema(self):
+        s = self.schema
+        conn = self._conn()
+        columns = ", ".join(f"{c} TEXT PRIMARY KEY" if c == "id" else f"{c} TEXT" for c in s.columns)
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {s.name} ({columns})")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {s.name}_{s.sort_field}_id ON {s.name} ({s.sort_field}, id)")
+        for column in s.indexed:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {s.name}_{column} ON {s.name} ({column}, {s.sort_field})")
+        if s.unique:
+            conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {s.name}_{s.unique}_unique ON {s.name} ({s.unique})")
+
+    def _row(self, doc):
+        return tuple(doc.get(c) for c in self.schema.columns)
+
+    def _insert_many(self, docs):
+        conn = self._conn()
+        sql = f"INSERT INTO {self.schema.name} ({self._columns}) VALUES ({', '.join('?' * len(self.schema.columns))})"
+        errors = []
+        conn.execute("BEGIN")
+        try:
+            for i, doc in enumerate(docs):
+                try:
+                    conn.execute(sql, self._row(doc))
+                except sqlite3.IntegrityError as exc:
+                    errors.append((i, str(exc)))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if errors:
+            raise WriteFailed(len(docs) - len(errors), errors)
+        return len(docs)
+
+    async def insert(self, doc):
+        await self._run(self._insert_many, [doc])
+
+    async def insert_many(self, docs):
+        return await self._run(self._insert_many, docs)
+
+    def _upsert_many(self, docs):
+        s = self.schema
+        conn = self._conn()
+        sql = (f"INSERT INTO {s.name} ({self._columns}) VALUES ({', '.join('?' * len(s.columns))}) "
+               f"ON CONFLICT({s.unique}) DO NOTHING")
+        conn.execute("BEGIN")
+        try:
+            inserted = [conn.execute(sql, self._row(doc)).rowcount == 1 for doc in docs]
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return inserted
+
+    async def upsert(self, doc):
+        [inserted] = await self._run(self._upsert_many, [doc])
+        if inserted:
+            return dict(doc), True
+        [stored] = await self.get_many([doc[self.schema.unique]])
+        return stored, False
+
+    async def upsert_many(self, docs):
+        return await self._run(self._upsert_many, docs)
+
+    def _query(self, sql, params):
+        return [dict(row) for row in self._conn().execute(sql, params)]
+
+    async def get_many(self, keys):
+        if not keys:
+            return []
+        sql = (f"SELECT {self._columns} FROM {self.schema.name} "
+               f"WHERE {self.schema.unique} IN ({', '.join('?' * len(keys))})")
+        return await self._run(self._query, sql, list(keys))
+
+    def _where(self, filters, cursor):
+        s = self.schema
+        clauses, params = [], []
+        if filters.since:
+            clauses.append(f"{s.sort_field} >= ?")
+            params.append(iso(filters.since))
+        if filters.until:
+            clauses.append(f"{s.sort_field} < ?")
+            params.append(iso(filters.until))
+        for column, value in filters.equals.items():
+            if column not in s.columns:
+                raise ValueError(f"Unknown field {column}")
+            clauses.append(f"{column} = ?")
+            params.append(value)
+        if filters.text:
+            # Every word, each in any of the text fields.
+            for word in _words(filters.text):
+                pattern = "%" + word.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+                clauses.append("(" + " OR ".join(f"{column} LIKE ? ESCAPE '\\'" for column in s.text_fields) + ")")
+                params.extend([pattern] * len(s.text_fields))
+        if cursor:
+            value, last_id = decode_cursor(cursor)
+            clauses.append(f"({s.sort_field} < ? OR ({s.sort_field} = ? AND id < ?))")
+            params.extend([value, value, last_id])
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    async def list(self, filters, cursor=None, limit=100):
+        s = self.schema
+        where, params = self._where(filters, cursor)
+        sql = f"SELECT {self._columns} FROM {s.name}{where} ORDER BY {s.sort_field} DESC, id DESC LIMIT ?"
+        return await self._run(self._query, sql, params + [limit])
+
+    async def count(self, filters):
+        where, params = self._where(filters, None)
+        [row] = await self._run(self._query, f"SELECT COUNT(*) AS n FROM {self.schema.name}{where}", params)
+        return row["n"]
+
+    async def ping(self):
+        await self._run(self._query, "SELECT 1", [])
+
+    async def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self.executor.shutdown(wait=False)
+
+
+def open_embedded(backend: str) -> Tuple[Repository, Repository]:
+    if backend == "memory":
+        return MemoryRepository(CONTACTS), MemoryRepository(NEWSLETTER)
+    if backend == "sqlite":
+        path = os.environ.get('SQLITE_PATH', 'gruha.sqlite3')
+        executor = ThreadPoolExecutor(int(os.environ.get('SQLITE_THREADS', '4')), thread_name_prefix="sqlite")
+        repos = SQLiteRepository(path, CONTACTS, executor), SQLiteRepository(path, NEWSLETTER, executor)
+        for repo in repos:
+            repo.create_schema()
+        return repos
+    raise ValueError(f"Unknown STORAGE_BACKEND {backend!r}")
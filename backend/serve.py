@@ -0,0 +1,118 @@
+"""Production entrypoint: N uvicorn workers with graceful drain on SIGTERM.
+
+Run from backend/:
+
+    python serve.py --workers 4 --port 8001
+
+Each worker runs uvloop and httptools when installed (falling back to
+uvicorn's defaults otherwise) and opens and warms its own Mongo pool in the
+app's lifespan handler before it accepts traffic. On SIGTERM a worker first
+fails ``/api/health/ready`` for ``--drain-delay`` seconds so the load
+balancer stops routing to it, then stops accepting connections and gives
+in-flight requests up to ``--graceful-timeout`` seconds to finish before the
+lifespan shutdown flushes buffers and closes the pool. A second signal exits
+immediately.
+
+With more than one worker, ``/metrics`` merges every worker's series through
+snapshots in ``METRICS_MULTIPROC_DIR`` (a fresh temporary directory unless
+set; stale snapshots are cleared on start).
+"""
+import argparse
+import importlib.util
+import logging
+import os
+import signal
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+import uvicorn
+from uvicorn.supervisors import Multiprocess
+
+logger = logging.getLogger("serve")
+
+
+class DrainingServer(uvicorn.Server):
+    def __init__(self, config, drain_delay: float = 0.0):
+        super().__init__(config)
+        # An instance attribute, so it survives pickling into spawned worker processes.
+        self.drain_delay = drain_delay
+
+    def handle_exit(self, sig, frame):
+        if self.should_exit or self.drain_delay <= 0 or sig != signal.SIGTERM:
+            return super().handle_exit(sig, frame)
+        import health
+        if health.draining:
+            self.force_exit = True
+            return super().handle_exit(sig, frame)
+        health.draining = True
+        logger.info("Draining for %.1fs before shutdown (pid %d)", self.drain_delay, os.getpid())
+        timer = threading.Timer(self.drain_delay, super().handle_exit, (sig, frame))
+        timer.daemon = True
+        timer.start()
+
+
+class ParallelShutdown(Multiprocess):
+    """uvicorn's ``Multiprocess.shutdown`` terminates and joins one worker at a time, so each
+    worker only starts draining after the previous one exited. Signal them all, then join."""
+
+    def shutdown(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join()
+        logger.info("Stopping parent process [%d]", self.pid)
+
+
+def _available(module):
+    return importlib.util.find_spec(module) is not None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the Gruha Homes API")
+    parser.add_argument("--host", default=os.environ.get('HOST', '0.0.0.0'))
+    parser.add_argument("--port", type=int, default=int(os.environ.get('PORT', '8001')))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1)))
+    parser.add_argument("--graceful-timeout", type=int, default=int(os.environ.get('GRACEFUL_TIMEOUT', '30')),
+                        help="seconds in-flight requests get to finish after shutdown starts")
+    parser.add_argument("--drain-delay", type=float, default=float(os.environ.get('DRAIN_DELAY', '5')),
+                        help="seconds to fail readiness before shutting down on SIGTERM")
+    parser.add_argument("--log-level", default=os.environ.get('LOG_LEVEL', 'info'))
+    parser.add_argument("--forwarded-allow-ips", default=os.environ.get('FORWARDED_ALLOW_IPS', '*'))
+    args = parser.parse_args(argv)
+
+    if args.workers > 1:
+        # Before importing the app: spawned workers inherit the environment and read it at import.
+        metrics_dir = os.environ.get('METRICS_MULTIPROC_DIR') or tempfile.mkdtemp(prefix="gruha-metrics-")
+        os.environ['METRICS_MULTIPROC_DIR'] = metrics_dir
+        for stale in Path(metrics_dir).glob("*.json"):
+            stale.unlink()
+
+    # Fail fast on import/config errors in the parent instead of in every worker.
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import server  # noqa: F401
+
+    config = uvicorn.Config(
+        "server:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop="uvloop" if _available("uvloop") else "auto",
+        http="httptools" if _available("httptools") else "auto",
+        log_level=args.log_level,
+        proxy_headers=True,
+        forwarded_allow_ips=args.forwarded_allow_ips,
+        timeout_graceful_shutdown=args.graceful_timeout,
+    )
+    instance = DrainingServer(config, drain_delay=args.drain_delay)
+    if config.workers > 1:
+        ParallelShutdown(config, target=instance.run, sockets=[config.bind_socket()]).run()
+    else:
+        instance.run()
+    if not instance.started and config.workers == 1:
+        sys.exit(3)
+
+
+if __name__ == "__main__":
+    main()
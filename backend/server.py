@@ -1,35 +1,122 @@
-from fastapi import FastAPI, APIRouter
+from fastapi import FastAPI, APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from contextlib import asynccontextmanager
+import asyncio
+import hmac
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional
-import uuid
+from pydantic import BaseModel, Field, ConfigDict, field_validator
+from typing import List, Literal, Optional
+import orjson
 from datetime import datetime, timezone
 
+from bulk_import import detect_format, limit_body, record_write_errors, run_import
+from cache import LRUCache, ResponseCache, TTLCache, cached_response
+from compression import CompressionMiddleware
+import health
+from database import create_client, pool_monitor, warm_pool
+from export import CONTACT_COLUMNS, ENCODERS, MEDIA_TYPES, NEWSLETTER_COLUMNS, ndjson_rows
+from filters import ListFilter, contact_filter
+from frontend import FrontendFiles
+from idempotency import Idempotency, MemoryIdempotencyStore, MongoIdempotencyStore, fingerprint
+from indexes import ensure_indexes
+from ingest import contact_doc, newsletter_doc, normalize_email, normalize_phone, now_iso, uuid7
+from jobs import JobQueue
+from live import LiveFeed
+from media import MediaLibrary
+from metrics import MetricsMiddleware, MultiprocessMetrics, render_metrics
+from pagination import decode_cursor, page_headers
+from rate_limit import FormGuard, MemoryBackend
+from repository import CONTACTS, NEWSLETTER, MongoRepository, WriteFailed, open_embedded
+from stats import contact_stats, newsletter_stats
+from write_buffer import BufferFull, WriteBehindBuffer
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Set by lifespan(); tests and benchmarks may install their own client or repositories before startup.
+storage_backend = os.environ.get('STORAGE_BACKEND', 'mongo')
+contacts_compact = os.environ.get('CONTACTS_COMPACT_SCHEMA', '').lower() in ('1', 'true', 'yes')
+client = None
+db = None
+contacts_repo = None
+newsletter_repo = None
+
+stats_cache = TTLCache(float(os.environ.get('STATS_CACHE_TTL', '30')))
+list_cache = ResponseCache(
+    LRUCache(int(os.environ.get('LIST_CACHE_MAX_ENTRIES', '512'))),
+    ttl=float(os.environ.get('LIST_CACHE_TTL', '5')),
+)
+form_guard = FormGuard(MemoryBackend())
+job_queue = JobQueue.from_env()
+live_feed = LiveFeed.from_env()
+media_library = MediaLibrary.from_env()
+idempotency = Idempotency.from_env()
+bulk_chunk_size = int(os.environ.get('BULK_IMPORT_CHUNK_SIZE', '1000'))
+bulk_max_bytes = int(os.environ.get('BULK_IMPORT_MAX_BYTES', str(20 * 1024 * 1024)))
+bulk_max_rows = int(os.environ.get('BULK_IMPORT_MAX_ROWS', '50000'))
+# Bearer token for the bulk import endpoints; they are disabled while it is unset.
+admin_token = os.environ.get('ADMIN_TOKEN', '')
+write_buffer_enabled = os.environ.get('WRITE_BUFFER_ENABLED', '').lower() in ('1', 'true', 'yes')
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global client, db, contacts_repo, newsletter_repo
+    if contacts_repo is None and storage_backend != "mongo":
+        contacts_repo, newsletter_repo = open_embedded(storage_backend)
+    if contacts_repo is None:
+        if client is None:
+            client = create_client(os.environ['MONGO_URL'])
+            db = client[os.environ['DB_NAME']]
+        contacts_repo = MongoRepository(db, CONTACTS, compact=contacts_compact)
+        newsletter_repo = MongoRepository(db, NEWSLETTER)
+    if idempotency.store is None:
+        idempotency.store = MongoIdempotencyStore(db) if db is not None else MemoryIdempotencyStore(idempotency.ttl)
+    if db is not None:
+        try:
+            await warm_pool(client, db)
+            await ensure_indexes(db)
+        except Exception as exc:
+            # Keep serving: readiness reports the outage and indexes are retried on the next start.
+            logger.error("Mongo unavailable at startup: %s", exc)
+        job_queue.start(db)
+        live_feed.start(contacts_repo)
+    for buffer in (contacts_buffer, newsletter_buffer):
+        if buffer:
+            buffer.start()
+    if multiprocess_metrics:
+        multiprocess_metrics.start()
+    health.started = True
+    yield
+    health.started = False
+    await live_feed.stop()
+    await job_queue.stop()
+    for buffer in (contacts_buffer, newsletter_buffer):
+        if buffer:
+            await buffer.stop()
+    for repo in (contacts_repo, newsletter_repo):
+        await repo.close()
+    if multiprocess_metrics:
+        await multiprocess_metrics.stop()
+    if client is not None:
+        client.close()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 api_router = APIRouter(prefix="/api")
 
 # Models
 class ContactSubmission(BaseModel):
     model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=uuid7)
     name: str
     email: str
     phone: Optional[str] = ""
     service: Optional[str] = ""
     message: str
-    created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    created_at: str = Field(default_factory=now_iso)
 
 class ContactCreate(BaseModel):
     name: str
@@ -38,62 +125,368 @@ class ContactCreate(BaseModel):
     service: Optional[str] = ""
     message: str
 
+    @field_validator("email")
+    @classmethod
+    def normalize_email(cls, v: str) -> str:
+        return normalize_email(v)
+
+    @field_validator("phone")
+    @classmethod
+    def normalize_phone(cls, v: Optional[str]) -> str:
+        return normalize_phone(v)
+
 class NewsletterSubscription(BaseModel):
     model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=uuid7)
     email: str
-    subscribed_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    subscribed_at: str = Field(default_factory=now_iso)
 
 class NewsletterCreate(BaseModel):
     email: str
 
+    @field_validator("email")
+    @classmethod
+    def normalize_email(cls, v: str) -> str:
+        return normalize_email(v)
+
 # Routes
 @api_router.get("/")
 async def root():
     return {"message": "Gruha Homes API"}
 
-@api_router.post("/contact", response_model=ContactSubmission)
-async def create_contact(input: ContactCreate):
-    submission = ContactSubmission(**input.model_dump())
-    doc = submission.model_dump()
-    await db.contacts.insert_one(doc)
-    doc.pop("_id", None)
-    return submission
+@api_router.get("/health/live")
+async def liveness():
+    return {"status": "ok"}
+
+@api_router.get("/health/ready")
+async def readiness():
+    if not health.started or health.draining:
+        return ORJSONResponse({"status": "draining" if health.draining else "starting"}, status_code=503)
+    try:
+        await asyncio.wait_for(contacts_repo.ping(), float(os.environ.get('READINESS_TIMEOUT', '2')))
+    except Exception as exc:
+        return ORJSONResponse({"status": "unavailable", "error": str(exc)}, status_code=503)
+    return {"status": "ok"}
+
+@api_router.get("/status/pool")
+async def pool_status():
+    return pool_monitor.snapshot()
+
+# Rate limiting runs as a dependency, ahead of body validation.
+async def contact_guard(request: Request):
+    # The IP bucket comes first: it also bounds the store lookups that arbitrary keys can cause.
+    await form_guard.check_ip(request, "contact")
+    # A retry under a known Idempotency-Key is answered by create_contact without writing; don't count it per email.
+    if await idempotency.known("contact", request.headers.get("idempotency-key")):
+        return
+    await form_guard.check_email(request, "contact")
+
+async def newsletter_guard(request: Request):
+    await form_guard.check(request, "newsletter")
+
+# Bulk imports bypass the form limits, so only an operator holding ADMIN_TOKEN may run them.
+async def bulk_guard(request: Request):
+    if not admin_token:
+        raise HTTPException(status_code=403, detail="Bulk import is disabled")
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.strip().encode(), admin_token.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token", headers={"WWW-Authenticate": "Bearer"})
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > bulk_max_bytes:
+        raise HTTPException(status_code=413, detail=f"Body exceeds {bulk_max_bytes} bytes")
+
+# Analytics, jobs and the live feed run on Mongo only.
+async def require_mongo():
+    if db is None:
+        raise HTTPException(status_code=501, detail=f"Not available with STORAGE_BACKEND={storage_backend}")
+
+@api_router.get("/status/jobs", dependencies=[Depends(require_mongo)])
+async def jobs_status():
+    return await job_queue.status(db)
+
+@api_router.post("/contact", response_model=ContactSubmission, dependencies=[Depends(contact_guard)])
+async def create_contact(input: ContactCreate, idempotency_key: Optional[str] = Header(None, max_length=255)):
+    """Send an `Idempotency-Key` header to make retries safe: a repeat gets the first response back."""
+    if idempotency_key:
+        return await idempotency.run("contact", idempotency_key, fingerprint(input.model_dump()),
+                                     lambda: store_contact(input))
+    return ORJSONResponse(await store_contact(input))
+
+async def store_contact(input: ContactCreate):
+    # Validated once by FastAPI; the stored document is built directly from it.
+    fields = input.model_dump()
+    doc = contact_doc(fields)
+    async with form_guard.deduplicated("contact", fields):
+        if contacts_buffer:
+            await buffered_write(contacts_buffer, doc)
+        else:
+            await contacts_repo.insert(doc)
+            await list_cache.invalidate("contacts")
+    job_queue.submit(db, "contact.created", dict(doc))
+    return doc
 
 @api_router.get("/contacts", response_model=List[ContactSubmission])
-async def get_contacts():
-    contacts = await db.contacts.find({}, {"_id": 0}).to_list(1000)
-    return contacts
+async def get_contacts(
+    request: Request,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    format: Literal["json", "ndjson"] = "json",
+    service: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    email: Optional[str] = None,
+    phone: Optional[str] = None,
+    q: Optional[str] = Query(None, description="Search name, email, phone and message; every word must match"),
+):
+    """Newest first. Pass the `X-Next-Cursor` header back as `cursor` for the next page;
+    `format=ndjson` streams every remaining document instead of a single page."""
+    filters = contact_filter(service, since, until, email, phone, q)
+    if format == "ndjson":
+        docs = contacts_repo.stream(filters, cursor, batch_size=500)
+        return StreamingResponse(ndjson_rows(docs), media_type="application/x-ndjson")
+
+    async def render():
+        contacts = await contacts_repo.list(filters, cursor, limit)
+        # Documents come from our own collection through a fixed projection; skip re-validating them.
+        return orjson.dumps(contacts), page_headers(contacts, limit, "created_at", request.url)
 
-@api_router.post("/newsletter", response_model=NewsletterSubscription)
+    key = (limit, cursor, service, since, until, email, phone, q)
+    return cached_response(request, await list_cache.get_or_render("contacts", key, render))
+
+@api_router.get("/contacts/live", dependencies=[Depends(require_mongo)])
+async def live_contacts(request: Request, last_event_id: Optional[str] = Query(None, alias="lastEventId")):
+    """Server-Sent Events stream of new contacts. Reconnects resume after the `Last-Event-ID`
+    header (or `lastEventId`), replaying anything created in between."""
+    token = request.headers.get("last-event-id") or last_event_id
+    after = decode_cursor(token) if token else None
+    return StreamingResponse(live_feed.stream(after), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@api_router.get("/contacts/stats", dependencies=[Depends(require_mongo)])
+async def get_contact_stats(
+    bucket: Literal["day", "week", "month"] = "day",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+):
+    key = ("contacts", bucket, since, until)
+    return await stats_cache.get_or_set(key, lambda: contact_stats(db, bucket, since, until, contacts_compact))
+
+@api_router.get("/contacts/export")
+async def export_contacts(
+    format: Literal["csv", "ndjson", "xlsx"] = "csv",
+    batch_size: int = Query(1000, ge=100, le=10000),
+    service: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    email: Optional[str] = None,
+    phone: Optional[str] = None,
+    q: Optional[str] = None,
+):
+    """Every matching contact, newest first, streamed as a download (compressed when accepted)."""
+    docs = contacts_repo.stream(contact_filter(service, since, until, email, phone, q), batch_size=batch_size)
+    return export_response(docs, "contacts", format, CONTACT_COLUMNS, batch_size)
+
+@api_router.post("/newsletter", response_model=NewsletterSubscription, dependencies=[Depends(newsletter_guard)])
 async def subscribe_newsletter(input: NewsletterCreate):
-    existing = await db.newsletter.find_one({"email": input.email}, {"_id": 0})
-    if existing:
-        return NewsletterSubscription(**existing)
-    subscription = NewsletterSubscription(**input.model_dump())
-    doc = subscription.model_dump()
-    await db.newsletter.insert_one(doc)
-    doc.pop("_id", None)
-    return subscription
+    doc = newsletter_doc(input.model_dump())
+    if newsletter_buffer:
+        return ORJSONResponse(await buffered_write(newsletter_buffer, doc))
+    stored, inserted = await newsletter_repo.upsert(doc)
+    if inserted:
+        await list_cache.invalidate("newsletter")
+    return ORJSONResponse(stored)
 
 @api_router.get("/newsletter", response_model=List[NewsletterSubscription])
-async def get_newsletter_subs():
-    subs = await db.newsletter.find({}, {"_id": 0}).to_list(1000)
-    return subs
+async def get_newsletter_subs(
+    request: Request,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+):
+    async def render():
+        subs = await newsletter_repo.list(ListFilter(), cursor, limit)
+        return orjson.dumps(subs), page_headers(subs, limit, "subscribed_at", request.url)
+
+    return cached_response(request, await list_cache.get_or_render("newsletter", (limit, cursor), render))
+
+@api_router.get("/newsletter/stats", dependencies=[Depends(require_mongo)])
+async def get_newsletter_stats(
+    bucket: Literal["day", "week", "month"] = "day",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+):
+    key = ("newsletter", bucket, since, until)
+    return await stats_cache.get_or_set(key, lambda: newsletter_stats(db, bucket, since, until))
+
+@api_router.get("/newsletter/export")
+async def export_newsletter(
+    format: Literal["csv", "ndjson", "xlsx"] = "csv",
+    batch_size: int = Query(1000, ge=100, le=10000),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+):
+    docs = newsletter_repo.stream(ListFilter(since, until), batch_size=batch_size)
+    return export_response(docs, "newsletter", format, NEWSLETTER_COLUMNS, batch_size)
+
+@api_router.post("/contacts/bulk", dependencies=[Depends(bulk_guard)])
+async def import_contacts(request: Request, format: Optional[Literal["json", "ndjson", "csv"]] = None):
+    """Body: JSON array, NDJSON or CSV of contact forms (format from Content-Type unless given).
+    Requires `Authorization: Bearer <ADMIN_TOKEN>`; 413 past the size or row limits."""
+    report = await run_import(limit_body(request.stream(), bulk_max_bytes), import_format(request, format),
+                              validate_contact, write_contacts, bulk_chunk_size, bulk_max_rows)
+    if report.inserted:
+        await list_cache.invalidate("contacts")
+    return import_response(report)
+
+@api_router.post("/newsletter/bulk", dependencies=[Depends(bulk_guard)])
+async def import_newsletter(request: Request, format: Optional[Literal["json", "ndjson", "csv"]] = None):
+    """Like /contacts/bulk; addresses already subscribed are counted as `existing`."""
+    report = await run_import(limit_body(request.stream(), bulk_max_bytes), import_format(request, format),
+                              validate_newsletter, write_newsletter, bulk_chunk_size, bulk_max_rows)
+    if report.inserted:
+        await list_cache.invalidate("newsletter")
+    return import_response(report)
+
+# Export
+def export_response(docs, name, fmt, columns, batch_size):
+    # The repository fetches batch_size documents per round trip and the encoder emits one chunk per batch.
+    body = ENCODERS[fmt](docs, columns, batch_size)
+    filename = f"{name}-{datetime.now(timezone.utc):%Y%m%d}.{fmt}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    # CSV and NDJSON are compressed on the fly by CompressionMiddleware; XLSX is already a deflated zip.
+    return StreamingResponse(body, media_type=MEDIA_TYPES[fmt], headers=headers)
+
+# Media
+@api_router.get("/media/{media_id}")
+async def get_media(request: Request, media_id: str, w: Optional[int] = Query(None, ge=1, le=8192)):
+    """Best prebuilt variant: format from `Accept`, width from `w` or the width client hints."""
+    return media_library.response(media_id, request.headers, w)
+
+@api_router.get("/media/{media_id}/meta")
+async def get_media_meta(media_id: str):
+    """Size, BlurHash placeholder and per-format `srcset` for building a `<picture>`."""
+    return media_library.meta(media_id, app.url_path_for("get_media", media_id=media_id))
+
+# Bulk import
+def import_format(request, format):
+    fmt = format or detect_format(request.headers.get("content-type", ""))
+    if fmt is None:
+        raise HTTPException(status_code=415, detail="Send application/json, application/x-ndjson or text/csv")
+    return fmt
+
+def import_response(report):
+    # Rows before the limit were written; the report says how far the import got.
+    return ORJSONResponse(report.as_dict(), status_code=413 if report.too_large else 200)
+
+def validate_contact(record):
+    return contact_doc(ContactCreate.model_validate(record).model_dump())
+
+def validate_newsletter(record):
+    return newsletter_doc(NewsletterCreate.model_validate(record).model_dump())
+
+async def write_contacts(batch, report):
+    try:
+        report.inserted += await contacts_repo.insert_many([doc for _, doc in batch])
+    except WriteFailed as exc:
+        report.inserted += exc.inserted
+        record_write_errors(exc, [row for row, _ in batch], report)
+
+async def write_newsletter(batch, report):
+    first, rows = {}, []
+    for row, doc in batch:
+        if doc["email"] in first:
+            report.existing += 1
+            continue
+        first[doc["email"]] = doc
+        rows.append(row)
+    try:
+        upserted, failed = sum(await newsletter_repo.upsert_many(list(first.values()))), 0
+    except WriteFailed as exc:
+        upserted, failed = exc.inserted, len(exc.errors)
+        record_write_errors(exc, rows, report)
+    report.inserted += upserted
+    report.existing += len(first) - upserted - failed
+
+# Background jobs
+@job_queue.handler("contact.created")
+async def notify_new_lead(contact):
+    # Hook for sales notifications / CRM sync; runs off the request path with retries.
+    logger.info("New lead %s: %s <%s> (%s)", contact["id"], contact["name"], contact["email"], contact.get("service") or "-")
+
+# Write-behind batching (WRITE_BUFFER_ENABLED)
+async def flush_contacts(docs):
+    try:
+        await contacts_repo.insert_many(docs)
+    finally:
+        # Invalidate after a partial failure too: some documents were written.
+        await list_cache.invalidate("contacts")
+    return docs
+
+async def flush_newsletter(docs):
+    # One upsert per distinct email; duplicates inside the batch resolve to the same document.
+    first = {}
+    for doc in docs:
+        first.setdefault(doc["email"], doc)
+    emails = list(first)
+    failed = {}
+    try:
+        flags = await newsletter_repo.upsert_many(list(first.values()))
+    except WriteFailed as exc:
+        failed = {emails[i]: WriteFailed(0, [(0, message)]) for i, message in exc.errors}
+        flags = [False] * len(emails)
+        await list_cache.invalidate("newsletter")
+    stored = {email: doc for (email, doc), inserted in zip(first.items(), flags) if inserted}
+    if stored:
+        await list_cache.invalidate("newsletter")
+    existing = [email for email in emails if email not in stored and email not in failed]
+    for doc in await newsletter_repo.get_many(existing) if existing else []:
+        stored[doc["email"]] = doc
+    return [failed.get(doc["email"]) or stored[doc["email"]] for doc in docs]
+
+async def buffered_write(buffer, doc):
+    try:
+        return await buffer.submit(doc)
+    except BufferFull:
+        raise HTTPException(status_code=503, detail="Too many pending submissions", headers={"Retry-After": "1"})
+
+contacts_buffer = WriteBehindBuffer.from_env("contacts", flush_contacts) if write_buffer_enabled else None
+newsletter_buffer = WriteBehindBuffer.from_env("newsletter", flush_newsletter) if write_buffer_enabled else None
 
 app.include_router(api_router)
 
+def process_gauges():
+    pool = pool_monitor.snapshot()
+    return {
+        "mongodb_pool_connections_open": pool["connections_open"],
+        "mongodb_pool_connections_in_use": pool["connections_in_use"],
+        "mongodb_pool_checkouts_total": pool["checkouts"],
+        "mongodb_pool_checkout_wait_seconds_p95": pool["wait_ms_p95"] / 1000,
+        "mongodb_pool_checkout_wait_seconds_max": pool["wait_ms_max"] / 1000,
+        "live_feed_subscribers": len(live_feed.subscribers),
+    }
+
+# Set when several workers share the port (METRICS_MULTIPROC_DIR, see metrics.py).
+multiprocess_metrics = MultiprocessMetrics.from_env(process_gauges)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return render_metrics(process_gauges(), multiprocess_metrics)
+
+# Static frontend (FRONTEND_BUILD_DIR); mounted last so every API route above takes precedence.
+frontend_build_dir = os.environ.get('FRONTEND_BUILD_DIR')
+if frontend_build_dir:
+    app.mount("/", FrontendFiles(frontend_build_dir), name="frontend")
+
+app.add_middleware(CompressionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Link", "ETag", "Server-Timing", "Idempotent-Replayed"],
 )
+app.add_middleware(MetricsMiddleware)
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
@@ -0,0 +1,72 @@
+"""Aggregation pipelines behind the lead analytics endpoints.
+
+Timestamps are stored as ISO-8601 strings, so date ranges are plain string
+comparisons on the indexed field (served by the ``created_at_id`` /
+``subscribed_at_id`` indexes) and bucketing parses the string server side.
+Contacts in the compact schema hold BSON dates instead; ``compact`` matches
+both forms and ``$toDate`` buckets either.
+"""
+from datetime import datetime
+from typing import Optional
+
+from filters import date_range, mixed_date_range
+
+BUCKET_FORMATS = {
+    "day": "%Y-%m-%d",
+    "week": "%G-W%V",
+    "month": "%Y-%m",
+}
+
+
+def _bucket(field: str, bucket: str):
+    return {"$dateToString": {
+        "format": BUCKET_FORMATS[bucket],
+        "date": {"$toDate": f"${field}"},
+    }}
+
+
+async def contact_stats(db, bucket: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                        compact: bool = False):
+    pipeline = [
+        {"$match": (mixed_date_range if compact else date_range)("created_at", since, until)},
+        {"$facet": {
+            "total": [{"$count": "count"}],
+            "by_service": [
+                {"$group": {"_id": {"$ifNull": ["$service", ""]}, "count": {"$sum": 1}}},
+                {"$sort": {"count": -1, "_id": 1}},
+            ],
+            "by_period": [
+                {"$group": {"_id": _bucket("created_at", bucket), "count": {"$sum": 1}}},
+                {"$sort": {"_id": 1}},
+            ],
+        }},
+    ]
+    [result] = await db.contacts.aggregate(pipeline).to_list(1)
+    return {
+        "bucket": bucket,
+        "total": result["total"][0]["count"] if result["total"] else 0,
+        "by_service": [{"service": row["_id"], "count": row["count"]} for row in result["by_service"]],
+        "by_period": [{"period": row["_id"], "count": row["count"]} for row in result["by_period"]],
+    }
+
+
+async def newsletter_stats(db, bucket: str, since: Optional[datetime] = None, until: Optional[datetime] = None):
+    match = date_range("subscribed_at", since, until)
+    pipeline = [
+        {"$match": match},
+        {"$group": {"_id": _bucket("subscribed_at", bucket), "count": {"$sum": 1}}},
+        {"$sort": {"_id": 1}},
+    ]
+    rows = await db.newsletter.aggregate(pipeline).to_list(None)
+    # Growth curve starts from everyone who subscribed before the window.
+    running = await db.newsletter.count_documents(date_range("subscribed_at", None, since)) if since else 0
+    growth = []
+    for row in rows:
+        running += row["count"]
+        growth.append({"period": row["_id"], "new": row["count"], "total": running})
+    return {
+        "bucket": bucket,
+        "total": running,
+        "new_in_range": sum(row["count"] for row in rows),
+        "growth": growth,
+    }
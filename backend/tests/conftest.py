@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Unit tests import the backend modules directly, as the server does when run from backend/.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
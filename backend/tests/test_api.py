@@ -5,9 +5,12 @@ Tests for Contact and Newsletter API endpoints
 import pytest
 import requests
 import os
+import json
 import uuid
 
 BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+# The bulk import endpoints require the server's ADMIN_TOKEN.
+ADMIN_HEADERS = {"Authorization": f"Bearer {os.environ.get('ADMIN_TOKEN', '')}"}
 
 @pytest.fixture(scope="module")
 def api_client():
@@ -28,6 +31,34 @@ class TestHealthCheck:
         assert "message" in data
         assert data["message"] == "Gruha Homes API"
 
+    def test_liveness(self, api_client):
+        """Liveness does not depend on the database"""
+        response = api_client.get(f"{BASE_URL}/api/health/live")
+        assert response.status_code == 200
+        assert response.json()["status"] == "ok"
+    
+    def test_readiness(self, api_client):
+        """Readiness pings Mongo"""
+        response = api_client.get(f"{BASE_URL}/api/health/ready")
+        assert response.status_code == 200
+        assert response.json()["status"] == "ok"
+    
+    def test_pool_status(self, api_client):
+        """Pool stats report checkout wait times"""
+        response = api_client.get(f"{BASE_URL}/api/status/pool")
+        assert response.status_code == 200
+        data = response.json()
+        for key in ("checkouts", "connections_in_use", "wait_ms_avg", "wait_ms_p95", "wait_ms_max"):
+            assert key in data
+
+    def test_jobs_status(self, api_client):
+        """Job queue reports backlog and lag"""
+        response = api_client.get(f"{BASE_URL}/api/status/jobs")
+        assert response.status_code == 200
+        data = response.json()
+        for key in ("pending", "running", "done", "dead", "oldest_pending_seconds"):
+            assert key in data
+
 
 class TestContactAPI:
     """Contact form submission API tests"""
@@ -51,7 +82,7 @@ class TestContactAPI:
         data = response.json()
         assert data["name"] == payload["name"]
         assert data["email"] == payload["email"]
-        assert data["phone"] == payload["phone"]
+        assert data["phone"] == "+919876543210"
         assert data["service"] == payload["service"]
         assert data["message"] == payload["message"]
         assert "id" in data
@@ -73,6 +104,46 @@ class TestContactAPI:
         assert data["email"] == payload["email"]
         assert data["message"] == payload["message"]
     
+    def test_create_contact_normalizes_and_orders_ids(self, api_client):
+        """Email is lowercased, phone compacted, and ids are time-ordered UUIDv7"""
+        unique_id = str(uuid.uuid4())[:8]
+        payload = {
+            "name": f"TEST_Normalize_{unique_id}",
+            "email": f"  Normalize_{unique_id}@Test.COM ",
+            "phone": "+91 (98765) 432-10",
+            "message": "Normalize me"
+        }
+        first = api_client.post(f"{BASE_URL}/api/contact", json=payload).json()
+        second = api_client.post(f"{BASE_URL}/api/contact", json={**payload, "message": "Again"}).json()
+        
+        assert first["email"] == f"normalize_{unique_id}@test.com"
+        assert first["phone"] == "+919876543210"
+        assert uuid.UUID(first["id"]).version == 7
+        assert first["id"] < second["id"]
+    
+    def test_create_contact_idempotency_key_replays(self, api_client):
+        """A retry with the same Idempotency-Key returns the original lead instead of creating another"""
+        unique_id = str(uuid.uuid4())[:8]
+        payload = {
+            "name": f"TEST_Idempotent_{unique_id}",
+            "email": f"idempotent_{unique_id}@test.com",
+            "message": "Retry me"
+        }
+        headers = {"Idempotency-Key": str(uuid.uuid4())}
+        first = api_client.post(f"{BASE_URL}/api/contact", json=payload, headers=headers)
+        retry = api_client.post(f"{BASE_URL}/api/contact", json=payload, headers=headers)
+        
+        assert first.status_code == 200
+        assert retry.status_code == 200
+        assert retry.headers.get("idempotent-replayed") == "true"
+        assert retry.json() == first.json()
+        
+        stored = api_client.get(f"{BASE_URL}/api/contacts", params={"email": payload["email"]}).json()
+        assert len(stored) == 1
+        
+        mismatch = api_client.post(f"{BASE_URL}/api/contact", json={**payload, "message": "Different"}, headers=headers)
+        assert mismatch.status_code == 422
+    
     def test_create_contact_missing_required_field(self, api_client):
         """Test contact without required email field - should fail"""
         payload = {
@@ -84,6 +155,20 @@ class TestContactAPI:
         # Should return 422 for validation error
         assert response.status_code == 422
     
+    def test_create_contact_duplicate_submission_rejected(self, api_client):
+        """Identical resubmission inside the dedup window returns 409"""
+        unique_id = str(uuid.uuid4())[:8]
+        payload = {
+            "name": f"TEST_Dedup_{unique_id}",
+            "email": f"dedup_{unique_id}@test.com",
+            "message": "Dedup test message"
+        }
+        first = api_client.post(f"{BASE_URL}/api/contact", json=payload)
+        second = api_client.post(f"{BASE_URL}/api/contact", json=payload)
+        
+        assert first.status_code == 200
+        assert second.status_code == 409
+    
     def test_get_contacts_returns_list(self, api_client):
         """Test that GET /contacts returns a list"""
         response = api_client.get(f"{BASE_URL}/api/contacts")
@@ -115,6 +200,276 @@ class TestContactAPI:
         found = any(c.get("id") == created_contact["id"] for c in contacts)
         assert found, "Created contact not found in contacts list"
 
+    def test_get_contacts_cursor_pagination(self, api_client):
+        """Pages follow X-Next-Cursor without overlap, newest first"""
+        unique_id = str(uuid.uuid4())[:8]
+        for i in range(3):
+            api_client.post(f"{BASE_URL}/api/contact", json={
+                "name": f"TEST_Page_{i}_{unique_id}",
+                "email": f"page_{i}_{unique_id}@test.com",
+                "message": "Pagination test message"
+            })
+        
+        first = api_client.get(f"{BASE_URL}/api/contacts", params={"limit": 2})
+        assert first.status_code == 200
+        assert len(first.json()) == 2
+        next_cursor = first.headers.get("X-Next-Cursor")
+        assert next_cursor
+        
+        second = api_client.get(f"{BASE_URL}/api/contacts", params={"limit": 2, "cursor": next_cursor})
+        assert second.status_code == 200
+        first_ids = {c["id"] for c in first.json()}
+        assert not first_ids & {c["id"] for c in second.json()}
+        assert first.json()[-1]["created_at"] >= second.json()[0]["created_at"]
+    
+    def test_get_contacts_etag_revalidation(self, api_client):
+        """Unchanged list answers If-None-Match with 304; a new contact changes the ETag"""
+        first = api_client.get(f"{BASE_URL}/api/contacts")
+        etag = first.headers.get("ETag")
+        assert etag
+        
+        unchanged = api_client.get(f"{BASE_URL}/api/contacts", headers={"If-None-Match": etag})
+        assert unchanged.status_code == 304
+        assert not unchanged.content
+        
+        unique_id = str(uuid.uuid4())[:8]
+        api_client.post(f"{BASE_URL}/api/contact", json={
+            "name": f"TEST_Etag_{unique_id}",
+            "email": f"etag_{unique_id}@test.com",
+            "message": "ETag test message"
+        })
+        changed = api_client.get(f"{BASE_URL}/api/contacts", headers={"If-None-Match": etag})
+        assert changed.status_code == 200
+        assert changed.headers["ETag"] != etag
+    
+    def test_get_contacts_filters_and_search(self, api_client):
+        """service, phone and q narrow the list server side"""
+        unique_id = uuid.uuid4().hex[:8]
+        payload = {
+            "name": f"TEST_Search_{unique_id}",
+            "email": f"search_{unique_id}@test.com",
+            "phone": f"+91 {unique_id}",
+            "service": "Interior Design",
+            "message": f"Looking for a duplex quote zq{unique_id}"
+        }
+        created = api_client.post(f"{BASE_URL}/api/contact", json=payload).json()
+        
+        by_service = api_client.get(f"{BASE_URL}/api/contacts", params={"service": "Interior Design"}).json()
+        assert all(c["service"] == "Interior Design" for c in by_service)
+        
+        by_phone = api_client.get(f"{BASE_URL}/api/contacts", params={"phone": payload["phone"]}).json()
+        assert [c["id"] for c in by_phone] == [created["id"]]
+        
+        by_text = api_client.get(f"{BASE_URL}/api/contacts", params={"q": f"zq{unique_id}"}).json()
+        assert [c["id"] for c in by_text] == [created["id"]]
+    
+    def test_get_contacts_invalid_cursor(self, api_client):
+        """Malformed cursor returns 400"""
+        response = api_client.get(f"{BASE_URL}/api/contacts", params={"cursor": "not-a-cursor"})
+        assert response.status_code == 400
+    
+    def test_get_contacts_ndjson_stream(self, api_client):
+        """format=ndjson streams one JSON document per line"""
+        response = api_client.get(f"{BASE_URL}/api/contacts", params={"format": "ndjson"})
+        
+        assert response.status_code == 200
+        assert response.headers["Content-Type"].startswith("application/x-ndjson")
+        for line in response.text.splitlines():
+            assert "id" in json.loads(line)
+
+
+class TestStatsAPI:
+    """Lead analytics aggregation endpoints"""
+    
+    def test_contact_stats(self, api_client):
+        """Contact stats break totals down by service and period"""
+        response = api_client.get(f"{BASE_URL}/api/contacts/stats", params={"bucket": "week"})
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["bucket"] == "week"
+        assert sum(row["count"] for row in data["by_service"]) == data["total"]
+        assert sum(row["count"] for row in data["by_period"]) == data["total"]
+    
+    def test_newsletter_stats_growth_is_cumulative(self, api_client):
+        """Newsletter growth curve is a running total"""
+        response = api_client.get(f"{BASE_URL}/api/newsletter/stats")
+        
+        assert response.status_code == 200
+        growth = response.json()["growth"]
+        totals = [row["total"] for row in growth]
+        assert totals == sorted(totals)
+    
+    def test_stats_invalid_bucket(self, api_client):
+        """Unknown bucket returns 422"""
+        response = api_client.get(f"{BASE_URL}/api/contacts/stats", params={"bucket": "year"})
+        assert response.status_code == 422
+
+
+class TestBulkImportAPI:
+    """Bulk import endpoints for contacts and newsletter lists"""
+    
+    def test_bulk_contacts_json_reports_row_errors(self, api_client):
+        """Valid rows are inserted, invalid rows reported by position"""
+        unique_id = str(uuid.uuid4())[:8]
+        rows = [
+            {"name": f"TEST_Bulk_{unique_id}", "email": f"bulk_{unique_id}@test.com", "message": "Bulk row"},
+            {"name": "TEST_Bulk_Invalid"},
+        ]
+        response = api_client.post(f"{BASE_URL}/api/contacts/bulk", json=rows, headers=ADMIN_HEADERS)
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["received"] == 2
+        assert data["inserted"] == 1
+        assert data["failed"] == 1
+        assert data["errors"][0]["row"] == 2
+    
+    def test_bulk_contacts_csv(self, api_client):
+        """CSV with a header row and a quoted multi-line message"""
+        unique_id = str(uuid.uuid4())[:8]
+        body = f'name,email,message\nTEST_Csv_{unique_id},csv_{unique_id}@test.com,"line one\nline two"\n'
+        response = api_client.post(
+            f"{BASE_URL}/api/contacts/bulk", data=body, headers={"Content-Type": "text/csv", **ADMIN_HEADERS})
+        
+        assert response.status_code == 200
+        assert response.json()["inserted"] == 1
+    
+    def test_bulk_newsletter_ndjson_dedupes(self, api_client):
+        """Repeated addresses in an import are counted as existing"""
+        unique_id = str(uuid.uuid4())[:8]
+        email = f"bulk_news_{unique_id}@test.com"
+        body = "\n".join(json.dumps({"email": e}) for e in (email, email.upper()))
+        response = api_client.post(
+            f"{BASE_URL}/api/newsletter/bulk", data=body,
+            headers={"Content-Type": "application/x-ndjson", **ADMIN_HEADERS})
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["inserted"] == 1
+        assert data["existing"] == 1
+    
+    def test_bulk_unsupported_content_type(self, api_client):
+        """Unknown body format returns 415"""
+        response = api_client.post(
+            f"{BASE_URL}/api/contacts/bulk", data="hello", headers={"Content-Type": "text/plain", **ADMIN_HEADERS})
+        assert response.status_code == 415
+    
+    def test_bulk_requires_admin_token(self, api_client):
+        """Without the admin token the import is refused before the body is read"""
+        response = api_client.post(f"{BASE_URL}/api/contacts/bulk", json=[],
+                                   headers={"Authorization": "Bearer wrong"})
+        assert response.status_code in (401, 403)
+
+
+class TestExportAPI:
+    """Streaming CSV/NDJSON/XLSX exports"""
+    
+    def test_export_contacts_csv_filtered(self, api_client):
+        """CSV export honours the service filter and starts with a header row"""
+        unique_id = str(uuid.uuid4())[:8]
+        service = f"TEST_Export_{unique_id}"
+        api_client.post(f"{BASE_URL}/api/contact", json={
+            "name": f"TEST_Export_{unique_id}", "email": f"export_{unique_id}@test.com",
+            "service": service, "message": "Export me"})
+        response = api_client.get(f"{BASE_URL}/api/contacts/export", params={"service": service})
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        assert "attachment" in response.headers["content-disposition"]
+        lines = response.text.strip().splitlines()
+        assert lines[0] == "id,name,email,phone,service,message,created_at"
+        assert len(lines) == 2
+        assert f"export_{unique_id}@test.com" in lines[1]
+    
+    def test_export_newsletter_ndjson_gzip(self, api_client):
+        """NDJSON export is gzip-encoded when the client accepts it"""
+        response = api_client.get(
+            f"{BASE_URL}/api/newsletter/export", params={"format": "ndjson"}, headers={"Accept-Encoding": "gzip"})
+        
+        assert response.status_code == 200
+        assert response.headers.get("content-encoding") == "gzip"
+        for line in response.text.splitlines():
+            assert "email" in json.loads(line)
+    
+    def test_export_contacts_xlsx(self, api_client):
+        """XLSX export is a zip archive"""
+        response = api_client.get(f"{BASE_URL}/api/contacts/export", params={"format": "xlsx"})
+        
+        assert response.status_code == 200
+        assert response.content[:2] == b"PK"
+
+
+class TestLiveFeedAPI:
+    """Server-Sent Events feed of new contacts"""
+    
+    def test_live_feed_delivers_new_contact(self, api_client):
+        """A contact posted while subscribed arrives as an SSE event with a resumable id"""
+        unique_id = str(uuid.uuid4())[:8]
+        with api_client.get(f"{BASE_URL}/api/contacts/live", stream=True, timeout=30) as stream:
+            assert stream.status_code == 200
+            assert stream.headers["content-type"].startswith("text/event-stream")
+            api_client.post(f"{BASE_URL}/api/contact", json={
+                "name": f"TEST_Live_{unique_id}", "email": f"live_{unique_id}@test.com", "message": "Live"})
+            event_id = None
+            for line in stream.iter_lines(decode_unicode=True):
+                if line.startswith("id:"):
+                    event_id = line[3:].strip()
+                if line.startswith("data:") and json.loads(line[5:])["name"] == f"TEST_Live_{unique_id}":
+                    break
+        assert event_id
+    
+    def test_live_feed_invalid_last_event_id(self, api_client):
+        """Malformed Last-Event-ID returns 400"""
+        response = api_client.get(f"{BASE_URL}/api/contacts/live", headers={"Last-Event-ID": "not-a-cursor"})
+        assert response.status_code == 400
+
+
+class TestCompressionAPI:
+    """Negotiated compression of /api responses"""
+    
+    def test_list_compressed_when_accepted(self, api_client):
+        """A list over the size threshold is gzip-encoded, varies on Accept-Encoding and keeps a usable ETag"""
+        unique_id = str(uuid.uuid4())[:8]
+        rows = [{"name": f"TEST_Gzip_{unique_id}_{i}", "email": f"gzip_{unique_id}_{i}@test.com",
+                 "message": "Compress me " * 5} for i in range(20)]
+        api_client.post(f"{BASE_URL}/api/contacts/bulk", json=rows, headers=ADMIN_HEADERS)
+        response = api_client.get(f"{BASE_URL}/api/contacts", params={"limit": 20}, headers={"Accept-Encoding": "gzip"})
+        
+        assert response.status_code == 200
+        assert response.headers.get("content-encoding") == "gzip"
+        assert "accept-encoding" in response.headers.get("vary", "").lower()
+        assert len(response.json()) == 20
+        
+        revalidated = api_client.get(f"{BASE_URL}/api/contacts", params={"limit": 20},
+                                     headers={"Accept-Encoding": "gzip", "If-None-Match": response.headers["etag"]})
+        assert revalidated.status_code == 304
+    
+    def test_identity_and_small_responses_uncompressed(self, api_client):
+        """Nothing is compressed for identity-only clients or below the size threshold"""
+        response = api_client.get(f"{BASE_URL}/api/contacts", params={"limit": 20}, headers={"Accept-Encoding": "identity"})
+        assert response.status_code == 200
+        assert "content-encoding" not in response.headers
+        
+        response = api_client.get(f"{BASE_URL}/api/", headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert "content-encoding" not in response.headers
+
+
+class TestMediaAPI:
+    """Responsive image variants"""
+    
+    def test_unknown_media_not_found(self, api_client):
+        """Ids that have not been built return 404 for both the image and its metadata"""
+        for path in ("/api/media/TEST_missing_image", "/api/media/TEST_missing_image/meta"):
+            response = api_client.get(f"{BASE_URL}{path}", headers={"Accept": "image/avif,image/webp,*/*"})
+            assert response.status_code == 404
+    
+    def test_media_invalid_width(self, api_client):
+        """Width hints must be positive"""
+        response = api_client.get(f"{BASE_URL}/api/media/TEST_missing_image", params={"w": 0})
+        assert response.status_code == 422
+
 
 class TestNewsletterAPI:
     """Newsletter subscription API tests"""
@@ -156,6 +511,18 @@ class TestNewsletterAPI:
         assert first_sub["id"] == second_sub["id"]
         assert first_sub["email"] == second_sub["email"]
     
+    def test_subscribe_newsletter_normalizes_email(self, api_client):
+        """Case/whitespace variants of an address map to one subscription"""
+        unique_id = str(uuid.uuid4())[:8]
+        email = f"normalize_{unique_id}@example.com"
+        
+        response1 = api_client.post(f"{BASE_URL}/api/newsletter", json={"email": email})
+        response2 = api_client.post(f"{BASE_URL}/api/newsletter", json={"email": f"  {email.upper()} "})
+        assert response1.status_code == 200
+        assert response2.status_code == 200
+        assert response2.json()["id"] == response1.json()["id"]
+        assert response2.json()["email"] == email
+    
     def test_subscribe_newsletter_missing_email(self, api_client):
         """Test subscription without email - should fail"""
         payload = {}
@@ -0,0 +1,92 @@
+"""Bulk import authorization and upload limits, in process on the memory backend (no server needed)"""
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import server
+from repository import open_embedded
+
+TOKEN = "test-admin-token"
+AUTH = {"Authorization": f"Bearer {TOKEN}"}
+
+
+def rows(count):
+    return [{"name": f"TEST_Bulk_{i}", "email": f"bulk_{i}@test.com", "message": "Bulk row"} for i in range(count)]
+
+
+@pytest.fixture
+def app(monkeypatch):
+    contacts, newsletter = open_embedded("memory")
+    monkeypatch.setattr(server, "contacts_repo", contacts)
+    monkeypatch.setattr(server, "newsletter_repo", newsletter)
+    monkeypatch.setattr(server, "admin_token", TOKEN)
+    monkeypatch.setattr(server, "bulk_chunk_size", 2)
+    return server.app
+
+
+def post(app, path, **kwargs):
+    async def main():
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await client.post(path, **kwargs)
+
+    return asyncio.run(main())
+
+
+class TestAuthorization:
+    def test_disabled_without_admin_token(self, app, monkeypatch):
+        monkeypatch.setattr(server, "admin_token", "")
+        assert post(app, "/api/contacts/bulk", json=rows(1), headers=AUTH).status_code == 403
+
+    @pytest.mark.parametrize("headers", [{}, {"Authorization": "Bearer wrong"}, {"Authorization": TOKEN}])
+    def test_rejects_missing_or_wrong_token(self, app, headers):
+        response = post(app, "/api/newsletter/bulk", json=[{"email": "a@test.com"}], headers=headers)
+        assert response.status_code == 401
+        assert response.headers["www-authenticate"] == "Bearer"
+        assert server.newsletter_repo.docs == {}
+
+    def test_imports_with_token(self, app):
+        response = post(app, "/api/contacts/bulk", json=rows(3), headers=AUTH)
+        assert response.status_code == 200
+        assert response.json()["inserted"] == 3
+
+
+class TestLimits:
+    def test_declared_length_over_the_limit(self, app, monkeypatch):
+        monkeypatch.setattr(server, "bulk_max_bytes", 100)
+        response = post(app, "/api/contacts/bulk", json=rows(5), headers=AUTH)
+        assert response.status_code == 413
+        assert server.contacts_repo.docs == {}
+
+    def test_streamed_body_over_the_limit(self, app, monkeypatch):
+        monkeypatch.setattr(server, "bulk_max_bytes", 300)
+        lines = [json.dumps(row).encode() + b"\n" for row in rows(10)]
+
+        async def body():
+            for line in lines:
+                yield line
+
+        # No Content-Length: the limit is enforced while reading.
+        response = post(app, "/api/contacts/bulk", content=body(),
+                        headers={"Content-Type": "application/x-ndjson", **AUTH})
+        assert response.status_code == 413
+        report = response.json()
+        assert report["errors"][-1]["error"] == "Body exceeds 300 bytes"
+        assert report["inserted"] == len(server.contacts_repo.docs) < 10
+
+    def test_row_limit(self, app, monkeypatch):
+        monkeypatch.setattr(server, "bulk_max_rows", 3)
+        response = post(app, "/api/contacts/bulk", json=rows(5), headers=AUTH)
+        assert response.status_code == 413
+        report = response.json()
+        assert report["received"] == 3 and report["inserted"] == 3
+        assert report["errors"] == [{"row": 4, "error": "More than 3 rows"}]
+
+    def test_within_limits(self, app, monkeypatch):
+        monkeypatch.setattr(server, "bulk_max_rows", 5)
+        response = post(app, "/api/newsletter/bulk", json=[{"email": f"n{i}@test.com"} for i in range(5)], headers=AUTH)
+        assert response.status_code == 200
+        assert response.json()["inserted"] == 5
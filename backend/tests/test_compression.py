@@ -0,0 +1,174 @@
+"""Accept-Encoding negotiation and CompressionMiddleware (no server needed)"""
+import asyncio
+import gzip
+
+import brotli
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import Response, StreamingResponse
+
+import server
+from cache import LRUCache, ResponseCache
+from compression import CompressionMiddleware, compressible, negotiate, quality_values
+from repository import open_embedded
+
+BIG = b'{"rows": "' + b"x" * 4000 + b'"}'
+
+
+def make_app():
+    app = FastAPI()
+
+    @app.get("/api/big")
+    async def big():
+        return Response(BIG, media_type="application/json", headers={"ETag": '"v1"'})
+
+    @app.get("/api/small")
+    async def small():
+        return Response(b'{"ok": true}', media_type="application/json")
+
+    @app.get("/api/stream")
+    async def stream():
+        async def rows():
+            for i in range(50):
+                yield b'{"row": %d, "pad": "%s"}\n' % (i, b"y" * 100)
+        return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+    @app.get("/api/events")
+    async def events():
+        return Response(b"data: x\n\n" * 500, media_type="text/event-stream")
+
+    @app.get("/api/encoded")
+    async def encoded():
+        return Response(gzip.compress(BIG), media_type="application/json", headers={"Content-Encoding": "gzip"})
+
+    @app.get("/api/image")
+    async def image():
+        return Response(b"\x89PNG" * 1000, media_type="image/png")
+
+    @app.get("/outside")
+    async def outside():
+        return Response(BIG, media_type="application/json")
+
+    app.add_middleware(CompressionMiddleware, minimum_size=1024)
+    return app
+
+
+def get(app, path, **headers):
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            # Raw bytes: httpx would otherwise decode gzip/br itself.
+            async with client.stream("GET", path, headers=headers) as response:
+                return response, b"".join([chunk async for chunk in response.aiter_raw()])
+
+    return asyncio.run(main())
+
+
+class TestNegotiation:
+    def test_quality_values(self):
+        assert quality_values("gzip;q=0.5, br, *;q=0, bad;q=x") == {"gzip": 0.5, "br": 1.0, "*": 0.0, "bad": 0.0}
+        assert quality_values("") == {}
+
+    @pytest.mark.parametrize("header, expected", [
+        ("gzip, br", "br"),
+        ("gzip", "gzip"),
+        ("br;q=0.5, gzip", "gzip"),
+        ("br;q=0, gzip;q=0", None),
+        ("*", "br"),
+        ("*;q=0.1, br;q=0", "gzip"),
+        ("identity", None),
+        ("", None),
+    ])
+    def test_negotiate(self, header, expected):
+        assert negotiate(header, ("br", "gzip")) == expected
+
+    def test_server_order_breaks_ties(self):
+        assert negotiate("gzip, br", ("gzip", "br")) == "gzip"
+
+    @pytest.mark.parametrize("content_type, expected", [
+        ("application/json", True),
+        ("text/csv; charset=utf-8", True),
+        ("application/x-ndjson", True),
+        ("text/event-stream", False),
+        ("image/png", False),
+        ("", False),
+    ])
+    def test_compressible(self, content_type, expected):
+        assert compressible(content_type) is expected
+
+
+class TestMiddleware:
+    def test_gzip_with_weak_etag(self):
+        response, body = get(make_app(), "/api/big", **{"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert response.headers["etag"] == 'W/"v1"'
+        assert int(response.headers["content-length"]) == len(body)
+        assert gzip.decompress(body) == BIG
+
+    def test_brotli_preferred(self):
+        response, body = get(make_app(), "/api/big", **{"Accept-Encoding": "gzip, br"})
+        assert response.headers["content-encoding"] == "br"
+        assert brotli.decompress(body) == BIG
+
+    def test_small_body_sent_as_is(self):
+        response, body = get(make_app(), "/api/small", **{"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in response.headers
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert body == b'{"ok": true}'
+
+    def test_no_accept_encoding(self):
+        response, body = get(make_app(), "/api/big", **{"Accept-Encoding": "identity"})
+        assert "content-encoding" not in response.headers
+        assert response.headers["etag"] == '"v1"'
+        assert body == BIG
+
+    def test_stream_compressed_chunk_by_chunk(self):
+        response, body = get(make_app(), "/api/stream", **{"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        assert gzip.decompress(body).count(b"\n") == 50
+
+    @pytest.mark.parametrize("path, encoding", [
+        ("/api/events", None),
+        ("/api/encoded", "gzip"),
+        ("/api/image", None),
+        ("/outside", None),
+    ])
+    def test_left_alone(self, path, encoding):
+        response, _ = get(make_app(), path, **{"Accept-Encoding": "br"})
+        assert response.headers.get("content-encoding") == encoding
+        assert "vary" not in response.headers
+
+
+class TestCachedListValidators:
+    """A 304 for a compressed list carries the same validator and Vary as its 200"""
+
+    def test_revalidation_matches_compressed_200(self, monkeypatch):
+        contacts, newsletter = open_embedded("memory")
+        monkeypatch.setattr(server, "contacts_repo", contacts)
+        monkeypatch.setattr(server, "newsletter_repo", newsletter)
+        monkeypatch.setattr(server, "list_cache", ResponseCache(LRUCache(), ttl=60))
+
+        async def main():
+            await contacts.insert_many([
+                {"id": f"id-{i}", "name": "TEST_Etag", "email": "etag@test.com", "phone": "", "service": "A",
+                 "message": "Compress me " * 10, "created_at": f"2026-01-01T00:00:{i:02d}+00:00"}
+                for i in range(20)])
+            transport = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                first = await client.get("/api/contacts", headers={"Accept-Encoding": "gzip"})
+                assert first.headers["content-encoding"] == "gzip"
+                etag = first.headers["etag"]
+                assert etag.startswith('W/"')
+                for sent in (etag, etag[2:]):
+                    revalidated = await client.get("/api/contacts",
+                                                   headers={"Accept-Encoding": "gzip", "If-None-Match": sent})
+                    assert revalidated.status_code == 304
+                    assert revalidated.headers["etag"] == etag
+                    assert revalidated.headers["vary"] == "Accept-Encoding"
+                plain = await client.get("/api/contacts", headers={"Accept-Encoding": "identity"})
+                assert plain.headers["etag"] == etag
+
+        asyncio.run(main())
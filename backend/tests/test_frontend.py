@@ -0,0 +1,104 @@
+"""FrontendFiles caching, precompressed variants and SPA fallback (no server needed)"""
+import asyncio
+import gzip
+
+import brotli
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Mount
+
+from frontend import IMMUTABLE, REVALIDATE, FrontendFiles, precompress
+
+SCRIPT = b"console.log('hello');\n" * 200
+
+
+@pytest.fixture
+def build(tmp_path):
+    (tmp_path / "index.html").write_bytes(b"<!doctype html><div id=root></div>")
+    (tmp_path / "manifest.json").write_bytes(b'{"name": "app"}')
+    js = tmp_path / "static" / "js"
+    js.mkdir(parents=True)
+    (js / "main.3f2a1b9c.js").write_bytes(SCRIPT)
+    (js / "main.3f2a1b9c.js.gz").write_bytes(gzip.compress(SCRIPT))
+    (js / "main.3f2a1b9c.js.br").write_bytes(brotli.compress(SCRIPT))
+    return tmp_path
+
+
+def get(directory, path, **headers):
+    app = Starlette(routes=[Mount("/", app=FrontendFiles(str(directory)))])
+
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            # Raw bytes: httpx would otherwise decode gzip/br itself.
+            async with client.stream("GET", path, headers=headers) as response:
+                return response, b"".join([chunk async for chunk in response.aiter_raw()])
+
+    return asyncio.run(main())
+
+
+class TestCaching:
+    def test_hashed_files_are_immutable(self, build):
+        response, _ = get(build, "/static/js/main.3f2a1b9c.js")
+        assert response.headers["cache-control"] == IMMUTABLE
+
+    @pytest.mark.parametrize("path", ["/", "/index.html", "/manifest.json"])
+    def test_other_files_revalidate(self, build, path):
+        response, _ = get(build, path)
+        assert response.status_code == 200
+        assert response.headers["cache-control"] == REVALIDATE
+
+    def test_if_none_match_answers_304(self, build):
+        first, _ = get(build, "/static/js/main.3f2a1b9c.js", **{"Accept-Encoding": "br"})
+        again, body = get(build, "/static/js/main.3f2a1b9c.js",
+                          **{"Accept-Encoding": "br", "If-None-Match": first.headers["etag"]})
+        assert again.status_code == 304 and body == b""
+        assert again.headers["etag"] == first.headers["etag"]
+
+
+class TestPrecompressed:
+    @pytest.mark.parametrize("accept, encoding, decode", [
+        ("gzip, br", "br", brotli.decompress),
+        ("gzip", "gzip", gzip.decompress),
+        ("br;q=0, gzip;q=0", None, bytes),
+        ("", None, bytes),
+    ])
+    def test_picks_the_accepted_variant(self, build, accept, encoding, decode):
+        response, body = get(build, "/static/js/main.3f2a1b9c.js", **{"Accept-Encoding": accept})
+        assert response.headers.get("content-encoding") == encoding
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert response.headers["content-type"].startswith(("text/javascript", "application/javascript"))
+        assert decode(body) == SCRIPT
+
+    def test_variants_have_their_own_etag(self, build):
+        plain, _ = get(build, "/static/js/main.3f2a1b9c.js")
+        packed, _ = get(build, "/static/js/main.3f2a1b9c.js", **{"Accept-Encoding": "gzip"})
+        assert plain.headers["etag"] != packed.headers["etag"]
+
+    def test_no_vary_without_variants(self, build):
+        response, _ = get(build, "/manifest.json", **{"Accept-Encoding": "gzip"})
+        assert "vary" not in response.headers and "content-encoding" not in response.headers
+
+    def test_precompress_writes_siblings(self, build):
+        (build / "static" / "app.css").write_bytes(b"body { margin: 0; }\n" * 100)
+        (build / "static" / "tiny.css").write_bytes(b"a{}")
+        assert precompress(build) == 2
+        assert gzip.decompress((build / "static" / "app.css.gz").read_bytes()).startswith(b"body")
+        assert brotli.decompress((build / "static" / "app.css.br").read_bytes()).startswith(b"body")
+        assert not (build / "static" / "tiny.css.gz").exists()
+        assert precompress(build) == 0
+
+
+class TestFallback:
+    @pytest.mark.parametrize("path", ["/about", "/contacts/42"])
+    def test_client_routes_get_index(self, build, path):
+        response, body = get(build, path)
+        assert response.status_code == 200
+        assert body.startswith(b"<!doctype html>")
+        assert response.headers["cache-control"] == REVALIDATE
+
+    @pytest.mark.parametrize("path", ["/missing.png", "/api/contacts", "/api/x"])
+    def test_missing_files_and_api_paths_404(self, build, path):
+        response, _ = get(build, path)
+        assert response.status_code == 404
@@ -0,0 +1,210 @@
+"""Idempotency-Key handling for POST /api/contact, in process on the memory backend (no server needed)"""
+import asyncio
+
+import httpx
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+import server
+from cache import LRUCache
+from idempotency import MemoryIdempotencyStore, MongoIdempotencyStore
+from rate_limit import MemoryBackend
+from repository import open_embedded
+
+PAYLOAD = {"name": "TEST_Idempotent", "email": "idempotent@test.com", "message": "Retry me"}
+
+
+@pytest.fixture
+def app(monkeypatch):
+    contacts, newsletter = open_embedded("memory")
+    monkeypatch.setattr(server, "contacts_repo", contacts)
+    monkeypatch.setattr(server, "newsletter_repo", newsletter)
+    monkeypatch.setattr(server.idempotency, "store", None)
+    monkeypatch.setattr(server.idempotency, "cache", LRUCache())
+    monkeypatch.setattr(server.form_guard, "backend", MemoryBackend())
+    monkeypatch.setattr(server.form_guard, "enabled", True)
+    return server.app
+
+
+def run(app, scenario):
+    async def main():
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                await scenario(client)
+
+    asyncio.run(main())
+
+
+def fail_once(monkeypatch, obj, name):
+    original = getattr(obj, name)
+
+    async def failing(*args, **kwargs):
+        monkeypatch.setattr(obj, name, original)
+        raise RuntimeError("write failed")
+
+    monkeypatch.setattr(obj, name, failing)
+
+
+class TestContactIdempotency:
+    """Retries under one Idempotency-Key store the lead once"""
+
+    def test_retry_replays_without_writing(self, app):
+        async def scenario(client):
+            headers = {"Idempotency-Key": "k-replay"}
+            first = await client.post("/api/contact", json=PAYLOAD, headers=headers)
+            retry = await client.post("/api/contact", json=PAYLOAD, headers=headers)
+            assert first.status_code == 200 and retry.status_code == 200
+            assert retry.headers["idempotent-replayed"] == "true"
+            assert retry.json() == first.json()
+            mismatch = await client.post("/api/contact", json={**PAYLOAD, "message": "Other"}, headers=headers)
+            assert mismatch.status_code == 422
+            assert len((await client.get("/api/contacts")).json()) == 1
+
+        run(app, scenario)
+
+    def test_retry_after_failed_attempt_is_stored(self, app, monkeypatch):
+        async def scenario(client):
+            fail_once(monkeypatch, server.contacts_repo, "insert")
+            headers = {"Idempotency-Key": "k-failure"}
+            first = await client.post("/api/contact", json=PAYLOAD, headers=headers)
+            retry = await client.post("/api/contact", json=PAYLOAD, headers=headers)
+            assert first.status_code == 500
+            assert retry.status_code == 200
+            assert "idempotent-replayed" not in retry.headers
+            assert [c["id"] for c in (await client.get("/api/contacts")).json()] == [retry.json()["id"]]
+
+        run(app, scenario)
+
+    def test_job_enqueue_failure_keeps_stored_lead(self, app, monkeypatch):
+        async def scenario(client):
+            fail_once(monkeypatch, server.job_queue, "enqueue")
+            headers = {"Idempotency-Key": "k-enqueue"}
+            first = await client.post("/api/contact", json=PAYLOAD, headers=headers)
+            retry = await client.post("/api/contact", json=PAYLOAD, headers=headers)
+            assert first.status_code == 200
+            assert retry.headers["idempotent-replayed"] == "true"
+            assert len((await client.get("/api/contacts")).json()) == 1
+
+        run(app, scenario)
+
+    def test_resubmission_after_failed_attempt_without_key(self, app, monkeypatch):
+        async def scenario(client):
+            fail_once(monkeypatch, server.contacts_repo, "insert")
+            assert (await client.post("/api/contact", json=PAYLOAD)).status_code == 500
+            assert (await client.post("/api/contact", json=PAYLOAD)).status_code == 200
+            assert (await client.post("/api/contact", json=PAYLOAD)).status_code == 409
+
+        run(app, scenario)
+
+    def test_completion_is_retried_so_a_takeover_replays(self, app, monkeypatch):
+        monkeypatch.setattr(server.idempotency, "complete_backoff", 0)
+        monkeypatch.setattr(server.idempotency, "lock_seconds", 0)
+
+        async def scenario(client):
+            fail_once(monkeypatch, server.idempotency.store, "complete")
+            headers = {"Idempotency-Key": "k-complete"}
+            first = await client.post("/api/contact", json=PAYLOAD, headers=headers)
+            assert first.status_code == 200
+            # Another worker: no LRU entry, and the claim would already be stale if still pending.
+            monkeypatch.setattr(server.idempotency, "cache", LRUCache())
+            retry = await client.post("/api/contact", json=PAYLOAD, headers=headers)
+            assert retry.headers["idempotent-replayed"] == "true"
+            assert retry.json() == first.json()
+            assert len((await client.get("/api/contacts")).json()) == 1
+
+        run(app, scenario)
+
+    def test_completion_failure_still_answers_and_replays_locally(self, app, monkeypatch):
+        monkeypatch.setattr(server.idempotency, "complete_backoff", 0)
+
+        async def scenario(client):
+            calls = []
+
+            async def complete(key, response):
+                calls.append(key)
+                raise RuntimeError("store down")
+
+            monkeypatch.setattr(server.idempotency.store, "complete", complete)
+            headers = {"Idempotency-Key": "k-store-down"}
+            first = await client.post("/api/contact", json=PAYLOAD, headers=headers)
+            retry = await client.post("/api/contact", json=PAYLOAD, headers=headers)
+            assert first.status_code == 200 and len(calls) == server.idempotency.complete_attempts
+            assert retry.headers["idempotent-replayed"] == "true"
+            assert len((await client.get("/api/contacts")).json()) == 1
+
+        run(app, scenario)
+
+
+class TestContactGuard:
+    """Replays skip the per-email limit but not the per-IP one"""
+
+    def test_replay_skips_the_email_limit(self, app, monkeypatch):
+        monkeypatch.setattr(server.form_guard, "email_burst", 1)
+
+        async def scenario(client):
+            headers = {"Idempotency-Key": "k-email"}
+            assert (await client.post("/api/contact", json=PAYLOAD, headers=headers)).status_code == 200
+            retry = await client.post("/api/contact", json=PAYLOAD, headers=headers)
+            assert retry.headers["idempotent-replayed"] == "true"
+            other = await client.post("/api/contact", json={**PAYLOAD, "message": "New"},
+                                      headers={"Idempotency-Key": "k2"})
+            assert other.status_code == 429
+
+        run(app, scenario)
+
+    def test_ip_limit_applies_before_any_store_lookup(self, app, monkeypatch):
+        monkeypatch.setattr(server.form_guard, "ip_burst", 1)
+
+        async def scenario(client):
+            lookups = []
+            original = server.idempotency.store.get
+
+            async def get(key):
+                lookups.append(key)
+                return await original(key)
+
+            monkeypatch.setattr(server.idempotency.store, "get", get)
+            first = await client.post("/api/contact", json=PAYLOAD, headers={"Idempotency-Key": "a"})
+            assert first.status_code == 200
+            lookups.clear()
+            for key in ("a", "b", "c"):
+                response = await client.post("/api/contact", json=PAYLOAD, headers={"Idempotency-Key": key})
+                assert response.status_code == 429
+            assert lookups == []
+
+        run(app, scenario)
+
+
+@pytest.fixture(params=["memory", "mongo"])
+def store(request):
+    if request.param == "memory":
+        return MemoryIdempotencyStore(ttl=60)
+    return MongoIdempotencyStore(AsyncMongoMockClient()["idempotency"])
+
+
+class TestIdempotencyStores:
+    """Claim, complete, release and stale takeover behave the same on every store"""
+
+    def test_claim_lifecycle(self, store):
+        async def scenario():
+            assert await store.claim("contact:a", "fp", 60) is None
+            assert (await store.claim("contact:a", "fp", 60))["status"] == "pending"
+            await store.complete("contact:a", {"id": "1"})
+            record = await store.claim("contact:a", "fp", 60)
+            assert record["status"] == "done" and record["response"] == {"id": "1"}
+            await store.release("contact:a")
+            assert (await store.get("contact:a"))["status"] == "done"
+
+        asyncio.run(scenario())
+
+    def test_release_and_stale_takeover(self, store):
+        async def scenario():
+            assert await store.claim("contact:b", "fp", 60) is None
+            await store.release("contact:b")
+            assert await store.claim("contact:b", "fp", 60) is None
+            await asyncio.sleep(0.01)
+            assert await store.claim("contact:b", "fp2", 0) is None
+            assert (await store.get("contact:b"))["fingerprint"] == "fp2"
+
+        asyncio.run(scenario())
@@ -0,0 +1,221 @@
+"""Compact contacts schema, migration and archival on mongomock (no server needed)"""
+import asyncio
+import types
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from bson.binary import Binary
+from fastapi import HTTPException
+from mongomock_motor import AsyncMongoMockClient
+
+import lifecycle
+from filters import ListFilter, contact_filter
+from pagination import encode_cursor
+from repository import CONTACTS, NEWSLETTER, MongoRepository
+
+START = datetime(2026, 3, 1, tzinfo=timezone.utc)
+
+
+def contact(minutes):
+    # Whole milliseconds, so the compact round trip returns the same string.
+    return {"id": str(uuid.uuid4()), "name": "TEST_Lifecycle", "email": "life@test.com", "phone": None,
+            "service": "Interior Design", "message": "Hello",
+            "created_at": (START + timedelta(minutes=minutes, milliseconds=minutes)).isoformat()}
+
+
+@pytest.fixture
+def db():
+    return AsyncMongoMockClient()["lifecycle_test"]
+
+
+async def seed(db, strings, compact):
+    """Older leads in the string form, newer ones compact: the state while the flag is on and
+    a migration has not run yet. Returns every document, newest first."""
+    docs = [contact(minutes) for minutes in range(strings + compact)]
+    for compact_form, batch in ((False, docs[:strings]), (True, docs[strings:])):
+        if batch:
+            await MongoRepository(db, CONTACTS, compact=compact_form).insert_many([dict(doc) for doc in batch])
+    return sorted(docs, key=lambda doc: (doc["created_at"], doc["id"]), reverse=True)
+
+
+async def pages(repo, filters, limit):
+    cursor, seen = None, []
+    while True:
+        page = await repo.list(filters, cursor, limit)
+        seen.extend(page)
+        if len(page) < limit:
+            return seen
+        cursor = encode_cursor(page[-1], repo.schema.sort_field)
+
+
+def interrupt_after(monkeypatch, batches):
+    """Stop a ``pause``d run between batches, as a killed process would."""
+    calls = []
+
+    async def sleep(_):
+        calls.append(1)
+        if len(calls) >= batches:
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr(lifecycle, "asyncio", types.SimpleNamespace(sleep=sleep))
+
+
+class TestCompactKeyset:
+    def test_encode_truncates_to_milliseconds(self, db):
+        repo = MongoRepository(db, CONTACTS, compact=True)
+        doc = {"id": str(uuid.uuid4()), "created_at": "2026-03-01T10:00:00.123456+05:30"}
+        stored = repo.encode(doc)
+        assert isinstance(stored["id"], Binary)
+        assert stored["created_at"] == datetime(2026, 3, 1, 4, 30, 0, 123000, tzinfo=timezone.utc)
+        assert doc["created_at"] == "2026-03-01T04:30:00.123000+00:00"
+        assert repo.decode(dict(stored)) == doc
+
+    def test_encode_keeps_non_uuid_ids(self, db):
+        stored = MongoRepository(db, CONTACTS, compact=True).encode({"id": "legacy-1", "created_at": START.isoformat()})
+        assert stored["id"] == "legacy-1"
+
+    def test_after_query_rejects_a_non_date_cursor(self, db):
+        with pytest.raises(HTTPException) as exc:
+            MongoRepository(db, CONTACTS, compact=True).after_query("not-a-date", "x")
+        assert exc.value.status_code == 400
+
+    def test_pages_cross_from_dates_to_strings(self, db):
+        async def main():
+            expected = await seed(db, strings=5, compact=4)
+            repo = MongoRepository(db, CONTACTS, compact=True)
+            assert [doc["id"] for doc in await pages(repo, ListFilter(), 2)] == [doc["id"] for doc in expected]
+            assert await repo.list(ListFilter(), limit=20) == expected
+
+        asyncio.run(main())
+
+    def test_range_matches_both_forms(self, db):
+        async def main():
+            expected = await seed(db, strings=5, compact=4)
+            repo = MongoRepository(db, CONTACTS, compact=True)
+            filters = contact_filter(since=START + timedelta(minutes=3), until=START + timedelta(minutes=7))
+            # [3, 7) spans the boundary at minute 5; minute 3 has +3ms so still matches.
+            assert await repo.list(filters) == [doc for doc in expected
+                                                if "T00:03" <= doc["created_at"][10:16] < "T00:07"]
+            assert await repo.count(filters) == 4
+
+        asyncio.run(main())
+
+
+class TestMigrate:
+    def test_round_trip(self, db):
+        async def main():
+            expected = await seed(db, strings=7, compact=0)
+            assert await lifecycle.migrate(db, "compact", batch_size=3) == 7
+            assert await lifecycle.status(db) == {"contacts_string": 0, "contacts_compact": 7, "contacts_archive": 0}
+            assert await MongoRepository(db, CONTACTS, compact=True).list(ListFilter()) == expected
+            assert await lifecycle.migrate(db, "strings", batch_size=3) == 7
+            assert await lifecycle.status(db) == {"contacts_string": 7, "contacts_compact": 0, "contacts_archive": 0}
+            assert await MongoRepository(db, CONTACTS).list(ListFilter()) == expected
+
+        asyncio.run(main())
+
+    def test_resumes_after_interruption(self, db, monkeypatch):
+        async def main():
+            expected = await seed(db, strings=7, compact=2)
+            interrupt_after(monkeypatch, batches=2)
+            with pytest.raises(KeyboardInterrupt):
+                await lifecycle.migrate(db, "compact", batch_size=2, pause=0.01)
+            # Converted newest first, so the remaining strings are all older than every date.
+            assert await lifecycle.status(db) == {"contacts_string": 3, "contacts_compact": 6, "contacts_archive": 0}
+            repo = MongoRepository(db, CONTACTS, compact=True)
+            assert [doc["id"] for doc in await pages(repo, ListFilter(), 4)] == [doc["id"] for doc in expected]
+            monkeypatch.undo()
+            assert await lifecycle.migrate(db, "compact", batch_size=2) == 3
+            assert await lifecycle.status(db) == {"contacts_string": 0, "contacts_compact": 9, "contacts_archive": 0}
+            assert await repo.list(ListFilter()) == expected
+
+        asyncio.run(main())
+
+    def test_skips_unconvertible_documents(self, db):
+        async def main():
+            await seed(db, strings=3, compact=0)
+            await db.contacts.insert_one({**contact(10), "created_at": "not a date"})
+            assert await lifecycle.migrate(db, "compact", batch_size=2) == 3
+            assert await lifecycle.status(db) == {"contacts_string": 1, "contacts_compact": 3, "contacts_archive": 0}
+
+        asyncio.run(main())
+
+
+class TestArchive:
+    CUTOFF = START + timedelta(minutes=6)
+
+    def test_moves_both_forms_before_the_cutoff(self, db):
+        async def main():
+            expected = await seed(db, strings=4, compact=4)
+            assert await lifecycle.archive(db, self.CUTOFF, batch_size=3) == 6
+            repo = MongoRepository(db, CONTACTS, compact=True)
+            assert await repo.list(ListFilter()) == expected[:2]
+            archived = await db.contacts_archive.find({}, {"_id": 0}).to_list(None)
+            assert len(archived) == 6 and all("archived_at" in doc for doc in archived)
+
+        asyncio.run(main())
+
+    def test_rerun_after_interruption(self, db, monkeypatch):
+        async def main():
+            expected = await seed(db, strings=4, compact=4)
+            interrupt_after(monkeypatch, batches=1)
+            with pytest.raises(KeyboardInterrupt):
+                await lifecycle.archive(db, self.CUTOFF, batch_size=2, pause=0.01)
+            monkeypatch.undo()
+            # A run killed between insert and delete: the next batch is already archived.
+            [copied] = await db.contacts.find().sort([("created_at", 1), ("id", 1)]).limit(1).to_list(1)
+            await db.contacts_archive.insert_one({**copied, "archived_at": datetime.now(timezone.utc)})
+            assert await lifecycle.archive(db, self.CUTOFF, batch_size=2) == 4
+            assert await MongoRepository(db, CONTACTS, compact=True).list(ListFilter()) == expected[:2]
+            assert await db.contacts_archive.count_documents({}) == 6
+            assert len(await db.contacts_archive.distinct("_id")) == 6
+
+        asyncio.run(main())
+
+
+class TestNormalize:
+    def test_normalizes_and_merges_legacy_newsletter_emails(self, db):
+        async def main():
+            await db.newsletter.create_index("email", unique=True)
+            await db.newsletter.insert_many([
+                {"id": "1", "email": "User@X.com ", "subscribed_at": START.isoformat()},
+                {"id": "2", "email": "user@x.com", "subscribed_at": START.isoformat()},
+                {"id": "3", "email": "Other@X.com", "subscribed_at": START.isoformat()},
+                {"id": "4", "email": "fine@x.com", "subscribed_at": START.isoformat()},
+            ])
+            counts = await lifecycle.normalize(db, batch_size=2)
+            assert counts["newsletter"] == {"normalized": 1, "merged": 1}
+            docs = await db.newsletter.find({}, {"_id": 0, "id": 1, "email": 1}).sort("id", 1).to_list(None)
+            assert docs == [{"id": "2", "email": "user@x.com"}, {"id": "3", "email": "other@x.com"},
+                            {"id": "4", "email": "fine@x.com"}]
+            assert (await lifecycle.normalize(db))["newsletter"] == {"normalized": 0, "merged": 0}
+
+        asyncio.run(main())
+
+    def test_upsert_finds_a_normalized_legacy_subscriber(self, db):
+        async def main():
+            await db.newsletter.insert_one({"id": "legacy", "email": "Legacy@X.com", "subscribed_at": START.isoformat()})
+            await lifecycle.normalize(db)
+            stored, inserted = await MongoRepository(db, NEWSLETTER).upsert(
+                {"id": "new", "email": "legacy@x.com", "subscribed_at": START.isoformat()})
+            assert not inserted and stored["id"] == "legacy"
+
+        asyncio.run(main())
+
+    def test_legacy_contacts_match_filters_after_normalizing(self, db):
+        async def main():
+            legacy = [{**contact(0), "email": " Ana@Test.com", "phone": "+91 98765-43210"},
+                      {**contact(1), "email": "ana@test.com", "phone": "(080) 2345 6789"},
+                      {**contact(2), "email": "ben@test.com", "phone": None}]
+            await db.contacts.insert_many([dict(doc) for doc in legacy])
+            repo = MongoRepository(db, CONTACTS)
+            assert len(await repo.list(contact_filter(email="ana@test.com"))) == 1
+            counts = await lifecycle.normalize(db, batch_size=2)
+            assert counts["contacts"] == {"normalized": 2, "merged": 0}
+            assert [doc["id"] for doc in await repo.list(contact_filter(email="ANA@test.com"))] == [
+                legacy[1]["id"], legacy[0]["id"]]
+            assert [doc["id"] for doc in await repo.list(contact_filter(phone="+91 98765 43210"))] == [legacy[0]["id"]]
+            assert [doc["id"] for doc in await repo.list(contact_filter(phone="08023456789"))] == [legacy[1]["id"]]
+
+        asyncio.run(main())
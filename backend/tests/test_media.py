@@ -0,0 +1,153 @@
+"""Image variant build, negotiation and conditional responses (no server needed)"""
+import json
+
+import pytest
+from PIL import Image
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+
+from media import MediaLibrary, blurhash, build, pick_variant, target_width
+
+SETTINGS = {"widths": [16, 32], "quality": {"avif": 50, "webp": 75, "jpeg": 80}, "blurhash": [4, 3]}
+VARIANTS = [{"width": w, "format": f, "file": f"{w}.{f}"} for w in (16, 32, 48) for f in ("avif", "jpeg", "webp")]
+
+
+def gradient(width=48, height=24, mode="RGB"):
+    image = Image.new(mode, (width, height))
+    image.putdata([(x * 5 % 256, y * 10 % 256, 128) + ((255,) if mode == "RGBA" else ())
+                   for y in range(height) for x in range(width)])
+    return image
+
+
+@pytest.fixture
+def built(tmp_path):
+    source, cache = tmp_path / "originals", tmp_path / "cache"
+    (source / "projects").mkdir(parents=True)
+    gradient().save(source / "projects" / "villa-1.jpg")
+    gradient(mode="RGBA").save(source / "logo.png")
+    (source / "notes.txt").write_text("not an image")
+    index = build(source, cache, workers=1, settings=SETTINGS)
+    return source, cache, index
+
+
+class TestPickVariant:
+    @pytest.mark.parametrize("accept, fmt", [
+        ("image/avif,image/webp,*/*", "avif"),
+        ("image/webp,*/*", "webp"),
+        ("image/avif;q=0.5,image/webp", "webp"),
+        ("image/avif;q=0,image/webp;q=0", "jpeg"),
+        ("image/avif,image/webp", "avif"),
+        ("image/*", "jpeg"),
+        ("*/*", "jpeg"),
+        ("", "jpeg"),
+    ])
+    def test_format_from_accept(self, accept, fmt):
+        assert pick_variant(VARIANTS, accept, None)["format"] == fmt
+
+    def test_png_fallback_for_alpha(self):
+        variants = [{"width": 16, "format": f, "file": f} for f in ("png", "webp")]
+        assert pick_variant(variants, "image/*", None)["format"] == "png"
+
+    @pytest.mark.parametrize("width, expected", [(None, 48), (1, 16), (16, 16), (17, 32), (40, 48), (4000, 48)])
+    def test_smallest_wide_enough(self, width, expected):
+        assert pick_variant(VARIANTS, "image/webp", width)["width"] == expected
+
+
+class TestTargetWidth:
+    @pytest.mark.parametrize("headers, width, expected", [
+        ({}, None, None),
+        ({"sec-ch-width": "500"}, 300, 300),
+        ({"sec-ch-width": "500", "width": "700"}, None, 500.0),
+        ({"width": "700"}, None, 700.0),
+        ({"sec-ch-viewport-width": "400", "sec-ch-dpr": "2"}, None, 800.0),
+        ({"viewport-width": "400"}, None, 400.0),
+        ({"sec-ch-width": "wide", "viewport-width": "400", "dpr": "1.5"}, None, 600.0),
+    ])
+    def test_hints(self, headers, width, expected):
+        assert target_width(Headers(headers), width) == expected
+
+
+class TestBuild:
+    def test_variants_per_width_and_format(self, built):
+        _, cache, index = built
+        assert sorted(index) == ["logo", "projects-villa-1"]
+        digest = index["projects-villa-1"]
+        info = json.loads((cache / digest[:2] / digest / "info.json").read_text())
+        assert (info["width"], info["height"]) == (48, 24)
+        assert {v["width"] for v in info["variants"]} == {16, 32, 48}
+        assert {v["format"] for v in info["variants"]} >= {"webp", "jpeg"}
+        assert {v["height"] for v in info["variants"] if v["width"] == 16} == {8}
+        logo = index["logo"]
+        logo_info = json.loads((cache / logo[:2] / logo / "info.json").read_text())
+        logo_formats = {v["format"] for v in logo_info["variants"]}
+        assert "png" in logo_formats and "jpeg" not in logo_formats
+        assert json.loads((cache / "index.json").read_text()) == index
+
+    def test_unchanged_originals_are_skipped(self, built):
+        source, cache, index = built
+        info = cache / index["logo"][:2] / index["logo"] / "info.json"
+        before = info.stat().st_mtime_ns
+        gradient(width=64).save(source / "projects" / "villa-1.jpg")
+        rebuilt = build(source, cache, workers=1, settings=SETTINGS)
+        assert info.stat().st_mtime_ns == before
+        assert rebuilt["logo"] == index["logo"]
+        assert rebuilt["projects-villa-1"] != index["projects-villa-1"]
+
+    def test_settings_change_the_hash(self, built):
+        source, cache, index = built
+        rebuilt = build(source, cache, workers=1, settings={**SETTINGS, "widths": [16]})
+        assert rebuilt["logo"] != index["logo"]
+
+
+class TestBlurhash:
+    def test_solid_colour(self):
+        assert blurhash(Image.new("RGB", (8, 8), (255, 0, 0)), 1, 1) == "00TI:j"
+
+    def test_length_and_alphabet(self):
+        encoded = blurhash(gradient(32, 16), 4, 3)
+        # 1 size + 1 maximum + 4 DC + 2 per AC component
+        assert len(encoded) == 6 + 2 * (4 * 3 - 1)
+        assert encoded[0] == "L"
+
+
+class TestResponse:
+    def test_serves_the_negotiated_variant(self, built):
+        _, cache, index = built
+        response = MediaLibrary(cache, max_age=60).response(
+            "projects-villa-1", Headers({"accept": "image/webp,*/*", "sec-ch-width": "20"}))
+        assert response.path.name == "32.webp"
+        assert response.media_type == "image/webp"
+        assert response.headers["cache-control"] == "public, max-age=60"
+        assert response.headers["vary"].startswith("Accept, Sec-CH-Width")
+        assert response.headers["etag"] == f'"{index["projects-villa-1"][:16]}-32.webp"'
+
+    def test_explicit_width_varies_on_accept_only(self, built):
+        _, cache, _ = built
+        response = MediaLibrary(cache).response("projects-villa-1", Headers({"accept": "*/*"}), 16)
+        assert response.path.name == "16.jpg"
+        assert response.headers["vary"] == "Accept"
+
+    def test_if_none_match(self, built):
+        _, cache, _ = built
+        library = MediaLibrary(cache)
+        etag = library.response("logo", Headers({})).headers["etag"]
+        for sent in (etag, f'"other", W/{etag}', "*"):
+            assert library.response("logo", Headers({"if-none-match": sent})).status_code == 304
+        # A prefix of the real tag is a different tag.
+        partial = etag[:-6] + '"'
+        assert library.response("logo", Headers({"if-none-match": partial})).status_code == 200
+        assert library.response("logo", Headers({"accept": "image/webp", "if-none-match": etag})).status_code == 200
+
+    def test_unknown_id_404(self, built):
+        _, cache, _ = built
+        with pytest.raises(HTTPException) as exc:
+            MediaLibrary(cache).response("missing", Headers({}))
+        assert exc.value.status_code == 404
+
+    def test_meta_srcset(self, built):
+        _, cache, _ = built
+        meta = MediaLibrary(cache).meta("projects-villa-1", "/api/media/projects-villa-1")
+        assert meta["width"] == 48 and meta["blurhash"]
+        assert meta["srcset"]["image/webp"] == ("/api/media/projects-villa-1?w=16 16w, "
+                                                "/api/media/projects-villa-1?w=32 32w, "
+                                                "/api/media/projects-villa-1?w=48 48w")
@@ -0,0 +1,169 @@
+"""Request/command instrumentation and Prometheus rendering (no server needed)"""
+import asyncio
+import json
+from types import SimpleNamespace
+
+import httpx
+from fastapi import FastAPI
+
+from metrics import (MONGO_FAILURES, MONGO_LATENCY, REQUEST_LATENCY, Counter, Gauge, Histogram, MetricsMiddleware,
+                     MultiprocessMetrics, command_monitor, render_metrics)
+
+
+def command_event(request_id, collection="contacts", name="find", micros=2000):
+    return SimpleNamespace(command={name: collection}, command_name=name, request_id=request_id,
+                           connection_id=("db", 27017), duration_micros=micros)
+
+
+def make_app(server_timing=False):
+    app = FastAPI()
+
+    @app.get("/test-metrics/items/{item_id}")
+    async def item(item_id: str):
+        return {"id": item_id}
+
+    @app.get("/test-metrics/query")
+    async def query():
+        # What Motor's listener calls see from inside a request.
+        command_monitor.started(command_event(9001))
+        command_monitor.succeeded(command_event(9001, micros=40000))
+        return {}
+
+    app.add_middleware(MetricsMiddleware, server_timing=server_timing)
+    return app
+
+
+def get(app, path):
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get(path)
+
+    return asyncio.run(main())
+
+
+class TestMiddleware:
+    def test_labels_by_route_template(self):
+        app = make_app()
+        assert get(app, "/test-metrics/items/1").status_code == 200
+        assert get(app, "/test-metrics/items/2").status_code == 200
+        assert get(app, "/test-metrics/missing").status_code == 404
+        samples = REQUEST_LATENCY.samples()
+        assert samples[("GET", "/test-metrics/items/{item_id}", "200")][-2] >= 2
+        assert ("GET", "unmatched", "404") in samples
+        assert not any("/test-metrics/items/1" in labels for labels in samples)
+
+    def test_server_timing_splits_db_and_app(self):
+        response = get(make_app(server_timing=True), "/test-metrics/query")
+        db, app = response.headers["server-timing"].split(", ")
+        assert db.startswith("db;dur=") and float(db.split("=")[1]) >= 40.0
+        assert app.startswith("app;dur=")
+
+    def test_no_server_timing_by_default(self):
+        assert "server-timing" not in get(make_app(), "/test-metrics/items/1").headers
+
+
+class TestCommandMonitor:
+    def test_times_commands_by_collection(self):
+        before = MONGO_LATENCY.samples().get(("test_monitor", "insert"), [0] * 15)[-2]
+        command_monitor.started(command_event(1, "test_monitor", "insert"))
+        command_monitor.succeeded(command_event(1, "test_monitor", "insert"))
+        assert MONGO_LATENCY.samples()[("test_monitor", "insert")][-2] == before + 1
+
+    def test_counts_failures(self):
+        command_monitor.started(command_event(2, "test_monitor", "update"))
+        command_monitor.failed(command_event(2, "test_monitor", "update"))
+        assert MONGO_FAILURES.samples()[("test_monitor", "update")] >= 1
+
+    def test_commands_without_a_collection(self):
+        command_monitor.started(SimpleNamespace(command={"ping": 1}, command_name="ping", request_id=3,
+                                                connection_id=("db", 1)))
+        command_monitor.succeeded(command_event(3, name="ping"))
+        assert ("", "ping") in MONGO_LATENCY.samples()
+
+
+class TestRendering:
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram("t_seconds", "Test.", ("route",), buckets=(0.01, 0.1, 1.0))
+        histogram.observe(("/a",), 0.05)
+        histogram.observe(("/a",), 0.5)
+        assert histogram.render() == [
+            "# HELP t_seconds Test.",
+            "# TYPE t_seconds histogram",
+            't_seconds_bucket{route="/a",le="0.01"} 0',
+            't_seconds_bucket{route="/a",le="0.1"} 1',
+            't_seconds_bucket{route="/a",le="1.0"} 2',
+            't_seconds_bucket{route="/a",le="+Inf"} 2',
+            't_seconds_count{route="/a"} 2',
+            't_seconds_sum{route="/a"} 0.55',
+        ]
+
+    def test_label_values_are_escaped(self):
+        counter = Counter("t_total", "Test.", ("path",))
+        counter.inc(('a"b\\c\nd',))
+        assert counter.render()[-1] == 't_total{path="a\\"b\\\\c\\nd"} 1'
+
+    def test_gauge_and_scrape_time_gauges(self):
+        gauge = Gauge("t_in_flight", "Test.")
+        gauge.inc()
+        gauge.dec()
+        assert gauge.render() == ["# HELP t_in_flight Test.", "# TYPE t_in_flight gauge", "t_in_flight 0"]
+        body = render_metrics({"t_subscribers": 3}).body.decode()
+        assert body.endswith("# TYPE t_subscribers gauge\nt_subscribers 3\n")
+        assert "# TYPE http_request_duration_seconds histogram" in body
+
+
+class TestMultiprocess:
+    def other_worker(self, tmp_path, pid, exited=False):
+        (tmp_path / f"{pid}.json").write_text(json.dumps({
+            "pid": pid,
+            "exited": exited,
+            "metrics": {
+                "mongodb_command_failures_total": [[["test_mp", "find"], 5]],
+                "mongodb_command_duration_seconds": [[["test_mp", "find"], [1] * 14 + [0.5]]],
+                "http_requests_in_flight": [[[], 2]],
+            },
+            "gauges": {} if exited else {"live_feed_subscribers": 4},
+        }))
+
+    def test_sums_counters_and_labels_gauges_by_worker(self, tmp_path):
+        store = MultiprocessMetrics(str(tmp_path), gauges=lambda: {"live_feed_subscribers": 1})
+        MONGO_FAILURES.inc(("test_mp", "find"), 2)
+        MONGO_LATENCY.observe(("test_mp", "find"), 0.25)
+        self.other_worker(tmp_path, 1)
+        self.other_worker(tmp_path, 2, exited=True)
+        lines = store.collect()
+        assert 'mongodb_command_failures_total{collection="test_mp",command="find"} 12' in lines
+        assert 'mongodb_command_duration_seconds_count{collection="test_mp",command="find"} 3' in lines
+        assert 'mongodb_command_duration_seconds_sum{collection="test_mp",command="find"} 1.25' in lines
+        assert 'http_requests_in_flight{pid="1"} 2' in lines
+        assert not any(line.startswith('http_requests_in_flight{pid="2"}') for line in lines)
+        assert f'live_feed_subscribers{{pid="{store.pid}"}} 1' in lines
+        assert 'live_feed_subscribers{pid="1"} 4' in lines
+        assert lines.count("# TYPE live_feed_subscribers gauge") == 1
+
+    def test_stop_keeps_counters_and_drops_gauges(self, tmp_path):
+        store = MultiprocessMetrics(str(tmp_path), interval=60, gauges=lambda: {"live_feed_subscribers": 1})
+
+        async def main():
+            store.start()
+            await asyncio.sleep(0)
+            await store.stop()
+
+        asyncio.run(main())
+        snapshot = json.loads((tmp_path / f"{store.pid}.json").read_text())
+        assert snapshot["exited"] and snapshot["gauges"] == {}
+        assert "mongodb_command_duration_seconds" in snapshot["metrics"]
+
+    def test_from_env(self, monkeypatch, tmp_path):
+        monkeypatch.delenv("METRICS_MULTIPROC_DIR", raising=False)
+        assert MultiprocessMetrics.from_env() is None
+        monkeypatch.setenv("METRICS_MULTIPROC_DIR", str(tmp_path))
+        monkeypatch.setenv("METRICS_SNAPSHOT_SECONDS", "5")
+        store = MultiprocessMetrics.from_env()
+        assert store.directory == tmp_path and store.interval == 5
+
+    def test_render_metrics_uses_every_worker(self, tmp_path):
+        self.other_worker(tmp_path, 1)
+        body = render_metrics({}, MultiprocessMetrics(str(tmp_path))).body.decode()
+        assert 'http_requests_in_flight{pid="1"} 2' in body
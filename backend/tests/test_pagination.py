@@ -0,0 +1,74 @@
+"""Cursor encoding, validation and next-page links (no server needed)"""
+import asyncio
+import base64
+import json
+
+import httpx
+import pytest
+from fastapi import HTTPException
+from starlette.datastructures import URL
+
+import server
+from cache import LRUCache, ResponseCache
+from pagination import decode_cursor, encode_cursor, page_headers
+from repository import open_embedded
+
+
+def token(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip("=")
+
+
+def test_round_trip():
+    doc = {"id": "0190a0e0-0000-7000-8000-000000000000", "created_at": "2026-01-01T00:00:00+00:00"}
+    assert decode_cursor(encode_cursor(doc, "created_at")) == (doc["created_at"], doc["id"])
+
+
+@pytest.mark.parametrize("value", [
+    [1, "a"],
+    [{"$ne": None}, "z"],
+    ["a", {"$gt": ""}],
+    ["a", "b", "c"],
+    {"a": 1, "b": 2},
+    "ab",
+])
+def test_rejects_anything_but_two_strings(value):
+    with pytest.raises(HTTPException) as exc:
+        decode_cursor(token(value))
+    assert exc.value.status_code == 400
+
+
+def test_rejects_garbage():
+    with pytest.raises(HTTPException):
+        decode_cursor("not-a-cursor!")
+
+
+def test_link_keeps_the_request_filters():
+    url = URL("http://test/api/contacts?service=A&q=kitchen&limit=5")
+    headers = page_headers([{"id": "b", "created_at": "2026-01-01T00:00:00+00:00"}], 1, "created_at", url)
+    cursor = headers["X-Next-Cursor"]
+    assert headers["Link"] == f'</api/contacts?service=A&q=kitchen&limit=1&cursor={cursor}>; rel="next"'
+    assert page_headers([], 1, "created_at", url) == {}
+
+
+def test_following_link_stays_filtered(monkeypatch):
+    contacts, newsletter = open_embedded("memory")
+    monkeypatch.setattr(server, "contacts_repo", contacts)
+    monkeypatch.setattr(server, "newsletter_repo", newsletter)
+    monkeypatch.setattr(server, "list_cache", ResponseCache(LRUCache(), ttl=0))
+
+    async def main():
+        for minute, service in enumerate("ABAB"):
+            await contacts.insert({"id": f"id-{minute}", "name": "TEST_Link", "email": "link@test.com", "phone": "",
+                                   "service": service, "message": "Hi",
+                                   "created_at": f"2026-01-01T00:0{minute}:00+00:00"})
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            seen, path = [], "/api/contacts?service=A&limit=1"
+            while path:
+                response = await client.get(path)
+                seen += [doc["service"] for doc in response.json()]
+                link = response.headers.get("link")
+                path = link[1:link.index(">")] if link else None
+        assert seen == ["A", "A"]
+
+    asyncio.run(main())
@@ -0,0 +1,80 @@
+"""FormGuard client IP resolution and duplicate suppression (no server needed)"""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from rate_limit import FormGuard, MemoryBackend
+
+
+def make_request(forwarded=None, peer="10.0.0.9", body=b"{}"):
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    scope = {"type": "http", "method": "POST", "path": "/", "headers": headers, "client": (peer, 1234)}
+    return Request(scope, receive)
+
+
+@pytest.fixture
+def guard(monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_ENABLED", "true")
+    monkeypatch.setenv("RATE_LIMIT_TRUSTED_PROXIES", "0")
+    return FormGuard(MemoryBackend())
+
+
+class TestClientIP:
+    """The rate-limit key must not be choosable by the client"""
+
+    def test_peer_by_default(self, guard):
+        assert guard.client_ip(make_request("6.6.6.6")) == "10.0.0.9"
+
+    def test_trusted_hops_counted_from_the_right(self, guard):
+        guard.trusted_proxies = 2
+        assert guard.client_ip(make_request("6.6.6.6, 203.0.113.7, 10.0.0.2")) == "203.0.113.7"
+        # Too few hops for the configured proxies: fall back to the peer.
+        assert guard.client_ip(make_request("203.0.113.7")) == "10.0.0.9"
+
+    def test_spoofed_forwarded_for_still_limited(self, guard):
+        guard.ip_burst, guard.ip_rate = 3, 0.001
+
+        async def post(i):
+            await guard.check(make_request(f"192.0.2.{i}"), "newsletter")
+
+        async def run():
+            for i in range(3):
+                await post(i)
+            with pytest.raises(HTTPException) as exc:
+                await post(99)
+            assert exc.value.status_code == 429
+
+        asyncio.run(run())
+
+
+class TestDeduplicated:
+    """Only stored submissions count as duplicates"""
+
+    FIELDS = {"name": "A", "email": "a@x.com", "message": "hi"}
+
+    def test_repeat_after_success_is_rejected(self, guard):
+        async def run():
+            async with guard.deduplicated("contact", self.FIELDS):
+                pass
+            with pytest.raises(HTTPException) as exc:
+                async with guard.deduplicated("contact", self.FIELDS):
+                    pass
+            assert exc.value.status_code == 409
+
+        asyncio.run(run())
+
+    def test_failed_write_is_forgotten(self, guard):
+        async def run():
+            with pytest.raises(RuntimeError):
+                async with guard.deduplicated("contact", self.FIELDS):
+                    raise RuntimeError("insert failed")
+            async with guard.deduplicated("contact", self.FIELDS):
+                pass
+
+        asyncio.run(run())
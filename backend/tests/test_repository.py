@@ -0,0 +1,242 @@
+"""The same storage cases against every Repository backend (no server needed)"""
+import asyncio
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from filters import ListFilter, contact_filter, mongo_query
+from pagination import encode_cursor
+from repository import CONTACTS, NEWSLETTER, MemoryRepository, MongoRepository, SQLiteRepository, WriteFailed
+
+BACKENDS = ["memory", "sqlite", "mongo", "mongo-compact"]
+START = datetime(2026, 3, 1, tzinfo=timezone.utc)
+
+
+def stamp(minutes):
+    return (START + timedelta(minutes=minutes)).isoformat()
+
+
+def contact(minutes, **fields):
+    return {"id": str(uuid.uuid4()), "name": "TEST_Repo", "email": "repo@test.com", "phone": None,
+            "service": "Interior Design", "message": "Hello", "created_at": stamp(minutes), **fields}
+
+
+def subscriber(email, minutes=0):
+    return {"id": str(uuid.uuid4()), "email": email, "subscribed_at": stamp(minutes)}
+
+
+@pytest.fixture(params=BACKENDS)
+def repos(request, tmp_path):
+    """``(contacts, newsletter)`` for one backend; tests drive them with ``asyncio.run``."""
+    backend = request.param
+    if backend == "memory":
+        yield MemoryRepository(CONTACTS), MemoryRepository(NEWSLETTER)
+        return
+    if backend == "sqlite":
+        executor = ThreadPoolExecutor(2)
+        path = str(tmp_path / "repo.sqlite3")
+        pair = SQLiteRepository(path, CONTACTS, executor), SQLiteRepository(path, NEWSLETTER, executor)
+        for repo in pair:
+            repo.create_schema()
+        yield pair
+        asyncio.run(pair[0].close())
+        return
+    db = AsyncMongoMockClient()["repo_test"]
+    asyncio.run(db.newsletter.create_index("email", unique=True))
+    compact = backend == "mongo-compact"
+    yield MongoRepository(db, CONTACTS, compact=compact), MongoRepository(db, NEWSLETTER)
+
+
+def text_search(repos):
+    if isinstance(repos[0], MongoRepository):
+        pytest.skip("mongomock does not implement $text")
+
+
+async def pages(repo, filters, limit):
+    cursor, seen = None, []
+    while True:
+        page = await repo.list(filters, cursor, limit)
+        seen.append([doc["id"] for doc in page])
+        if len(page) < limit:
+            return seen
+        cursor = encode_cursor(page[-1], repo.schema.sort_field)
+
+
+class TestInsert:
+    def test_insert_then_list(self, repos):
+        contacts, _ = repos
+
+        async def main():
+            doc = contact(0, phone="+919876543210")
+            await contacts.insert(doc)
+            assert await contacts.list(ListFilter()) == [doc]
+            assert await contacts.count(ListFilter()) == 1
+
+        asyncio.run(main())
+
+    def test_insert_many_reports_duplicates(self, repos):
+        _, newsletter = repos
+
+        async def main():
+            assert await newsletter.insert_many([subscriber("a@test.com"), subscriber("b@test.com", 1)]) == 2
+            with pytest.raises(WriteFailed) as exc:
+                await newsletter.insert_many([subscriber("c@test.com", 2), subscriber("a@test.com", 3)])
+            assert exc.value.inserted == 1
+            assert [index for index, _ in exc.value.errors] == [1]
+            assert await newsletter.count(ListFilter()) == 3
+
+        asyncio.run(main())
+
+
+class TestUpsert:
+    def test_upsert_keeps_the_first_document(self, repos):
+        _, newsletter = repos
+
+        async def main():
+            first = subscriber("same@test.com")
+            stored, inserted = await newsletter.upsert(dict(first))
+            assert inserted and stored == first
+            stored, inserted = await newsletter.upsert(subscriber("same@test.com", 5))
+            assert not inserted and stored == first
+
+        asyncio.run(main())
+
+    def test_upsert_many_and_get_many(self, repos):
+        _, newsletter = repos
+
+        async def main():
+            await newsletter.upsert(subscriber("old@test.com"))
+            docs = [subscriber("new@test.com", 1), subscriber("old@test.com", 2)]
+            assert await newsletter.upsert_many(docs) == [True, False]
+            found = await newsletter.get_many(["new@test.com", "old@test.com", "missing@test.com"])
+            assert sorted(doc["email"] for doc in found) == ["new@test.com", "old@test.com"]
+            assert await newsletter.get_many([]) == []
+
+        asyncio.run(main())
+
+
+class TestListing:
+    def test_newest_first_with_id_tiebreak(self, repos):
+        contacts, _ = repos
+
+        async def main():
+            docs = [contact(minutes) for minutes in (0, 10, 10, 20)]
+            await contacts.insert_many([dict(doc) for doc in docs])
+            expected = sorted(docs, key=lambda doc: (doc["created_at"], doc["id"]), reverse=True)
+            assert [doc["id"] for doc in await contacts.list(ListFilter())] == [doc["id"] for doc in expected]
+
+        asyncio.run(main())
+
+    def test_cursor_pages_cover_every_document_once(self, repos):
+        contacts, _ = repos
+
+        async def main():
+            # Pairs of equal timestamps so page boundaries fall inside ties.
+            docs = [contact(minutes // 2) for minutes in range(11)]
+            await contacts.insert_many([dict(doc) for doc in docs])
+            seen = await pages(contacts, ListFilter(), 3)
+            assert [len(page) for page in seen] == [3, 3, 3, 2]
+            flat = [ident for page in seen for ident in page]
+            assert flat == [doc["id"] for doc in await contacts.list(ListFilter(), limit=20)]
+            assert sorted(flat) == sorted(doc["id"] for doc in docs)
+
+        asyncio.run(main())
+
+    def test_stream_matches_list(self, repos):
+        contacts, _ = repos
+
+        async def main():
+            await contacts.insert_many([contact(minutes) for minutes in range(7)])
+            streamed = [doc async for doc in contacts.stream(ListFilter(), batch_size=2)]
+            assert streamed == await contacts.list(ListFilter(), limit=10)
+
+        asyncio.run(main())
+
+
+class TestFilters:
+    DOCS = [
+        contact(0, service="Interior Design", email="ana@test.com"),
+        contact(30, service="Architecture", email="ben@test.com", phone="+919876543210"),
+        contact(60, service="Interior Design", email="ben@test.com"),
+        contact(90, service="Architecture", email="cy@test.com"),
+    ]
+
+    def matching(self, repos, **criteria):
+        contacts, _ = repos
+
+        async def main():
+            await contacts.insert_many([dict(doc) for doc in self.DOCS])
+            filters = contact_filter(**criteria)
+            page = await contacts.list(filters)
+            assert await contacts.count(filters) == len(page)
+            return [self.DOCS.index(next(d for d in self.DOCS if d["id"] == doc["id"])) for doc in page]
+
+        return asyncio.run(main())
+
+    def test_service(self, repos):
+        assert self.matching(repos, service="Architecture") == [3, 1]
+
+    def test_email_is_normalized(self, repos):
+        assert self.matching(repos, email=" BEN@Test.com ") == [2, 1]
+
+    def test_phone(self, repos):
+        assert self.matching(repos, phone="+919876543210") == [1]
+
+    def test_since_until_is_half_open(self, repos):
+        assert self.matching(repos, since=START + timedelta(minutes=30), until=START + timedelta(minutes=90)) == [2, 1]
+
+    def test_combined(self, repos):
+        assert self.matching(repos, service="Interior Design", since=START + timedelta(minutes=1)) == [2]
+
+
+class TestTextSearch:
+    DOCS = [
+        contact(0, name="Asha Rao", message="Need a modular kitchen"),
+        contact(1, name="Vikram", email="vikram@example.org", message="Budget 100% flexible"),
+        contact(2, name="Meera", message="Villa_renovation in Pune"),
+        contact(3, name="Karan", message="Bathroom tiles"),
+        contact(4, name="Neha", email="neha@example.org", message="Kitchen and tiles"),
+    ]
+
+    def search(self, repos, q):
+        text_search(repos)
+        contacts, _ = repos
+
+        async def main():
+            await contacts.insert_many([dict(doc) for doc in self.DOCS])
+            filters = contact_filter(q=q)
+            page = await contacts.list(filters)
+            assert await contacts.count(filters) == len(page)
+            return [self.DOCS.index(next(d for d in self.DOCS if d["id"] == doc["id"])) for doc in page]
+
+        return asyncio.run(main())
+
+    @pytest.mark.parametrize("q, expected", [("KITCHEN tiles", [4]), ("kitchen", [4, 0]), ("kitchen garden", [])])
+    def test_every_word_case_insensitive(self, repos, q, expected):
+        assert self.search(repos, q) == expected
+
+    def test_matches_email(self, repos):
+        assert self.search(repos, "vikram@example.org") == [1]
+
+    def test_mongo_query_quotes_every_term(self):
+        query = mongo_query(contact_filter(q=' john@gmail.com  "kitchen '), "created_at")
+        assert query == {"$text": {"$search": '"john@gmail.com" "kitchen"'}}
+
+    @pytest.mark.parametrize("q, expected", [("100%", [1]), ("ash_", []), ("villa_", [2])])
+    def test_wildcards_are_literal(self, repos, q, expected):
+        assert self.search(repos, q) == expected
+
+    def test_with_other_filters_and_cursor(self, repos):
+        text_search(repos)
+        contacts, _ = repos
+
+        async def main():
+            await contacts.insert_many([contact(minutes, message="kitchen") for minutes in range(5)]
+                                       + [contact(minutes, message="garden") for minutes in range(5)])
+            seen = await pages(contacts, contact_filter(q="kitchen", service="Interior Design"), 2)
+            assert [len(page) for page in seen] == [2, 2, 1]
+
+        asyncio.run(main())
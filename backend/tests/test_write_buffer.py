@@ -0,0 +1,196 @@
+"""WriteBehindBuffer batching, backpressure and per-write results (no server needed)"""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import server
+from repository import NEWSLETTER, MemoryRepository, WriteFailed
+from write_buffer import BufferFull, WriteBehindBuffer
+
+
+class Recorder:
+    """A ``flush`` that records each batch and can be held back or made to fail."""
+
+    def __init__(self, fail=None):
+        self.batches = []
+        self.release = asyncio.Event()
+        self.release.set()
+        self.fail = fail
+
+    async def __call__(self, docs):
+        await self.release.wait()
+        self.batches.append(list(docs))
+        if self.fail:
+            raise self.fail
+        return [{"stored": doc} for doc in docs]
+
+
+def run(coro):
+    asyncio.run(asyncio.wait_for(coro, 5))
+
+
+class TestBatching:
+    def test_flushes_when_the_batch_is_full(self):
+        async def main():
+            flush = Recorder()
+            buffer = WriteBehindBuffer("t", flush, max_batch=3, max_delay=60)
+            buffer.start()
+            results = await asyncio.gather(*(buffer.submit(i) for i in range(3)))
+            assert flush.batches == [[0, 1, 2]]
+            assert results == [{"stored": 0}, {"stored": 1}, {"stored": 2}]
+            await buffer.stop()
+
+        run(main())
+
+    def test_flushes_after_max_delay(self):
+        async def main():
+            flush = Recorder()
+            buffer = WriteBehindBuffer("t", flush, max_batch=100, max_delay=0.02)
+            buffer.start()
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            assert await buffer.submit("a") == {"stored": "a"}
+            assert loop.time() - started >= 0.015
+            assert flush.batches == [["a"]]
+            await buffer.stop()
+
+        run(main())
+
+    def test_stop_flushes_pending_writes(self):
+        async def main():
+            flush = Recorder()
+            buffer = WriteBehindBuffer("t", flush, max_batch=100, max_delay=60, durability="buffered")
+            buffer.start()
+            assert [await buffer.submit(i) for i in range(4)] == [0, 1, 2, 3]
+            assert flush.batches == []
+            await buffer.stop()
+            assert flush.batches == [[0, 1, 2, 3]]
+
+        run(main())
+
+
+class TestDurability:
+    def test_ack_waits_for_the_flush(self):
+        async def main():
+            flush = Recorder()
+            flush.release.clear()
+            buffer = WriteBehindBuffer("t", flush, max_batch=1)
+            buffer.start()
+            pending = asyncio.create_task(buffer.submit("a"))
+            await asyncio.sleep(0.01)
+            assert not pending.done()
+            flush.release.set()
+            assert await pending == {"stored": "a"}
+            await buffer.stop()
+
+        run(main())
+
+    def test_buffered_returns_before_the_flush(self):
+        async def main():
+            flush = Recorder()
+            flush.release.clear()
+            buffer = WriteBehindBuffer("t", flush, max_batch=1, durability="buffered")
+            buffer.start()
+            assert await buffer.submit("a") == "a"
+            assert flush.batches == []
+            flush.release.set()
+            await buffer.stop()
+            assert flush.batches == [["a"]]
+
+        run(main())
+
+    def test_rejects_unknown_mode(self):
+        with pytest.raises(ValueError):
+            WriteBehindBuffer("t", Recorder(), durability="fast")
+
+
+class TestBackpressure:
+    def test_full_queue_raises_buffer_full(self):
+        async def main():
+            flush = Recorder()
+            flush.release.clear()
+            buffer = WriteBehindBuffer("t", flush, max_batch=1, max_queue=1, durability="buffered",
+                                       enqueue_timeout=0.02)
+            buffer.start()
+            await buffer.submit("held")  # taken by the flusher, which blocks in flush
+            await asyncio.sleep(0)
+            await buffer.submit("queued")
+            with pytest.raises(BufferFull):
+                await buffer.submit("rejected")
+            flush.release.set()
+            await buffer.stop()
+
+        run(main())
+
+    def test_server_answers_503(self):
+        class Full:
+            async def submit(self, doc):
+                raise BufferFull("contacts")
+
+        async def main():
+            with pytest.raises(HTTPException) as exc:
+                await server.buffered_write(Full(), {})
+            assert exc.value.status_code == 503
+            assert exc.value.headers == {"Retry-After": "1"}
+
+        run(main())
+
+
+class TestFailures:
+    def test_partial_failure_fails_only_the_rejected_writes(self):
+        async def main():
+            buffer = WriteBehindBuffer("t", Recorder(fail=WriteFailed(2, [(1, "duplicate")])), max_batch=3)
+            buffer.start()
+            results = await asyncio.gather(*(buffer.submit(doc) for doc in ("a", "b", "c")), return_exceptions=True)
+            assert results[0] == "a" and results[2] == "c"
+            assert isinstance(results[1], WriteFailed) and results[1].errors == [(0, "duplicate")]
+            await buffer.stop()
+
+        run(main())
+
+    def test_exception_results_fail_their_write(self):
+        async def main():
+            async def flush(docs):
+                return [ValueError(doc) if doc == "bad" else doc for doc in docs]
+
+            buffer = WriteBehindBuffer("t", flush, max_batch=2)
+            buffer.start()
+            results = await asyncio.gather(buffer.submit("ok"), buffer.submit("bad"), return_exceptions=True)
+            assert results[0] == "ok" and isinstance(results[1], ValueError)
+            await buffer.stop()
+
+        run(main())
+
+    def test_failed_flush_fails_the_batch_and_keeps_running(self):
+        async def main():
+            flush = Recorder(fail=RuntimeError("down"))
+            buffer = WriteBehindBuffer("t", flush, max_batch=2)
+            buffer.start()
+            results = await asyncio.gather(buffer.submit("a"), buffer.submit("b"), return_exceptions=True)
+            assert all(isinstance(result, RuntimeError) for result in results)
+            flush.fail = None
+            assert await buffer.submit("c") == {"stored": "c"}
+            await buffer.stop()
+
+        run(main())
+
+    def test_newsletter_flush_maps_errors_to_each_signup(self, monkeypatch):
+        repo = MemoryRepository(NEWSLETTER)
+        original = repo.upsert_many
+
+        async def upsert_many(docs):
+            await original(docs[1:])
+            raise WriteFailed(len(docs) - 1, [(0, "write failed")])
+
+        monkeypatch.setattr(repo, "upsert_many", upsert_many)
+        monkeypatch.setattr(server, "newsletter_repo", repo)
+        docs = [{"id": str(i), "email": email, "subscribed_at": f"2026-03-01T00:00:0{i}+00:00"}
+                for i, email in enumerate(["a@x.com", "b@x.com", "a@x.com"])]
+
+        async def main():
+            results = await server.flush_newsletter(docs)
+            assert isinstance(results[0], WriteFailed) and isinstance(results[2], WriteFailed)
+            assert results[1] == docs[1]
+
+        run(main())
@@ -0,0 +1,144 @@
+"""In-process write-behind buffer that coalesces single-document writes into batches.
+
+Each buffer owns a bounded asyncio queue and one flusher task. The flusher
+waits for the first queued write, then keeps collecting until either
+``max_batch`` writes are pending or ``max_delay`` seconds have passed, and
+hands the whole batch to ``flush`` (e.g. one ``insert_many``). ``flush``
+returns one result per write, in order; a result that is an exception fails
+just that write. A ``WriteFailed`` raised by ``flush`` fails only the writes
+at its error indexes, and the others resolve to the submitted document, so
+writes that did land are never reported as failed.
+
+Durability modes:
+
+* ``ack`` - ``submit`` returns only after the batch containing the write has
+  been acknowledged by Mongo, and returns that write's result.
+* ``buffered`` - ``submit`` returns as soon as the write is queued. Writes
+  still pending when the process dies are lost; a failed batch is logged.
+
+A full queue applies backpressure: ``submit`` waits up to
+``enqueue_timeout`` seconds for room and then raises ``BufferFull``.
+"""
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Callable, List, Optional
+
+from repository import WriteFailed
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class BufferFull(Exception):
+    pass
+
+
+class WriteBehindBuffer:
+    def __init__(
+        self,
+        name: str,
+        flush: Callable[[List[Any]], Awaitable[List[Any]]],
+        max_batch: int = 500,
+        max_delay: float = 0.05,
+        max_queue: int = 10000,
+        durability: str = "ack",
+        enqueue_timeout: float = 1.0,
+    ):
+        if durability not in ("ack", "buffered"):
+            raise ValueError(f"Unknown durability mode: {durability}")
+        self.name = name
+        self.flush = flush
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.durability = durability
+        self.enqueue_timeout = enqueue_timeout
+        self._max_queue = max_queue
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls, name: str, flush):
+        return cls(
+            name,
+            flush,
+            max_batch=int(os.environ.get('WRITE_BUFFER_MAX_BATCH', '500')),
+            max_delay=int(os.environ.get('WRITE_BUFFER_MAX_DELAY_MS', '50')) / 1000,
+            max_queue=int(os.environ.get('WRITE_BUFFER_MAX_QUEUE', '10000')),
+            durability=os.environ.get('WRITE_BUFFER_DURABILITY', 'ack'),
+        )
+
+    def start(self):
+        self._queue = asyncio.Queue(self._max_queue)
+        self._task = asyncio.create_task(self._run(), name=f"write-buffer-{self.name}")
+
+    async def stop(self):
+        """Flush everything queued so far and stop the flusher."""
+        if self._task is None:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    async def submit(self, doc: Any) -> Any:
+        if self._task is None:
+            raise RuntimeError(f"Write buffer {self.name} is not running")
+        future = asyncio.get_running_loop().create_future() if self.durability == "ack" else None
+        try:
+            await asyncio.wait_for(self._queue.put((doc, future)), self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            raise BufferFull(self.name)
+        if future is None:
+            return doc
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        docs = [doc for doc, _ in batch]
+        try:
+            results = await self.flush(docs)
+        except WriteFailed as exc:
+            failed = dict(exc.errors)
+            results = [WriteFailed(0, [(0, failed[i])]) if i in failed else doc for i, doc in enumerate(docs)]
+        except Exception as exc:
+            logger.error("Write buffer %s failed to flush %d writes: %s", self.name, len(docs), exc)
+            for _, future in batch:
+                if future is not None and not future.done():
+                    future.set_exception(exc)
+            return
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            logger.error("Write buffer %s failed %d of %d writes: %s", self.name, len(errors), len(docs), errors[0])
+        for (_, future), result in zip(batch, results):
+            if future is None or future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)